@@ -0,0 +1,4 @@
+'''
+Benchmarks of the SEA Wikipedia data pipeline, run against deterministic synthetic dumps
+(see `local_dump_mirror.py`) so the results are reproducible offline and comparable across commits.
+'''
@@ -0,0 +1,233 @@
+'''
+Script on Benchmarking the startup time of the pipeline CLIs
+-------------------
+Each CLI script is run with `--help` on a fresh interpreter several times (so the import cost is paid every run,
+as when the shell drivers spawn one process per language), and the heaviest top-level imports of each one
+are reported from `python -X importtime`. A CLI whose `--help` can't run (e.g. a missing dependency) is
+reported with its return code instead of being timed.
+Run it from the repo root, e.g. `python -m benchmarks.import_time_benchmark --repeats 5`
+'''
+
+import sys
+import json
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+from benchmarks.pipeline_benchmark import _REPO_DIR, get_git_commit
+from dedup_raw_wiki_data import argparse_bool_check
+
+
+_CLI_SCRIPTS = [
+    "extract_raw_wiki_data.py",
+    "extract_raw_wiki_data_batched.py",
+    "extract_raw_wiki_data_multilang.py",
+    "extract_dedup_wiki_data.py",
+    "concat_batched_data.py",
+    "dedup_raw_wiki_data.py",
+    "count_tokens_wiki_data.py",
+    "export_parquet_shards.py",
+    "local_dump_mirror.py",
+    "wiki_article_lookup.py",
+    "diff_wiki_data.py",
+    "wiki_data_stats.py",
+    "filter_wiki_data.py",
+    "pack_tokens_wiki_data.py",
+    "wiki_title_index.py",
+    "remove_boilerplate_wiki_data.py",
+]
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    logger = logging.getLogger("Wiki Dataset Benchmark")
+
+    return logger
+
+
+def _run_timed(cmd: list):
+    #the elapsed time is measured by the child itself around `runpy`, excluding the interpreter boot
+    _timer_code = ("import sys, time, runpy; sys.argv = sys.argv[1:]; _start = time.perf_counter()\n"
+                   "try:\n    runpy.run_path(sys.argv[0], run_name='__main__')\n"
+                   "except SystemExit as e:\n    _code = e.code or 0\nelse:\n    _code = 0\n"
+                   "sys.stderr.write(f'\\n__elapsed__ {time.perf_counter() - _start}\\n'); sys.exit(_code)")
+    proc = subprocess.run([sys.executable, "-c", _timer_code] + cmd, cwd=_REPO_DIR, capture_output=True, text=True)
+    _elapsed_lines = [line for line in proc.stderr.splitlines() if line.startswith("__elapsed__ ")]
+    elapsed = float(_elapsed_lines[-1].split()[1]) if _elapsed_lines else None
+    return proc.returncode, elapsed, proc.stderr
+
+
+def get_top_imports(script: str, top_n: int=10):
+    '''
+    Get the heaviest top-level imports (by cumulative time) of running a CLI script with `--help`
+
+    Returns
+    -------
+    list of dict of module name and its cumulative import time in ms
+    '''
+    proc = subprocess.run([sys.executable, "-X", "importtime", script, "--help"], cwd=_REPO_DIR,
+                          capture_output=True, text=True)
+    imports = []
+    for line in proc.stderr.splitlines():
+        #format: "import time: self [us] | cumulative | imported package", nested imports are indented
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("  "):
+            continue
+        imports.append({"module": name.strip(), "cumulative_ms": int(cumulative) / 1000})
+    return sorted(imports, key=lambda val: val["cumulative_ms"], reverse=True)[:top_n]
+
+
+def run_import_time_benchmark(scripts: list=_CLI_SCRIPTS, repeats: int=5, top_n: int=10, logger=None):
+    '''
+    Measure `--help` elapsed time of each CLI script over `repeats` fresh interpreters
+
+    Returns
+    -------
+    dict of script name to its result
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    results = {}
+    for script in scripts:
+        _elapsed, _return_code, _stderr = [], 0, ""
+        for _ in range(repeats):
+            _return_code, elapsed, _stderr = _run_timed([script, "--help"])
+            if _return_code != 0 or elapsed is None:
+                break
+            _elapsed.append(elapsed)
+
+        if _return_code != 0 or len(_elapsed) == 0:
+            _error = [line for line in _stderr.splitlines() if line and not line.startswith("__elapsed__")][-1:]
+            logger.warning(f"{script} --help failed with return code {_return_code}: {' '.join(_error)}")
+            results[script] = {"return_code": _return_code, "error": " ".join(_error)}
+            continue
+
+        results[script] = {
+            "return_code": 0,
+            "median_seconds": statistics.median(_elapsed),
+            "min_seconds": min(_elapsed),
+            "repeats": len(_elapsed),
+            "top_imports": get_top_imports(script, top_n=top_n),
+        }
+        logger.info(f"{script:>36} | median {results[script]['median_seconds']*1000:8.1f}ms | min {results[script]['min_seconds']*1000:8.1f}ms")
+    return results
+
+
+def count_built_builder_configs(lang: str="id", date: str="20231101"):
+    '''
+    Count the `WikipediaConfig` built on creating one `Wikipedia` builder on a fresh interpreter, which
+    has to be exactly one since the per-language configs are only built when looked up
+
+    Returns
+    -------
+    tuple of return code and number of configs built (None if the builder can't be created, e.g. `datasets` is missing)
+    '''
+    #the builder cache is written into a temp dir, so the check never reads a previous run
+    _counter_code = ("import sys, tempfile\nfrom sea_loader_batched import wiki_loader\n_num_built = [0]\n"
+                     "_init = wiki_loader.WikipediaConfig.__init__\n"
+                     "def _counted_init(self, *args, **kwargs):\n    _num_built[0] += 1\n    _init(self, *args, **kwargs)\n"
+                     "wiki_loader.WikipediaConfig.__init__ = _counted_init\n"
+                     "with tempfile.TemporaryDirectory() as cache_dir:\n"
+                     "    wiki_loader.Wikipedia(language=sys.argv[1], date=sys.argv[2], cache_dir=cache_dir)\n"
+                     "print(f'__num_configs__ {_num_built[0]}')")
+    proc = subprocess.run([sys.executable, "-c", _counter_code, lang, date], cwd=_REPO_DIR, capture_output=True, text=True)
+    _count_lines = [line for line in proc.stdout.splitlines() if line.startswith("__num_configs__ ")]
+    num_configs = int(_count_lines[-1].split()[1]) if proc.returncode == 0 and _count_lines else None
+    return proc.returncode, num_configs
+
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float, logger=None):
+    '''
+    Compare median `--help` time of each CLI script against a previous benchmark result
+
+    Returns
+    -------
+    list of (script, ratio) whose ratio of current/baseline median time exceeds the threshold
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    regressions = []
+    for script, result in results["results"].items():
+        _baseline = baseline.get("results", {}).get(script)
+        if result.get("median_seconds") is None or _baseline is None or not _baseline.get("median_seconds"):
+            logger.info(f"No comparable baseline for {script}, skipping")
+            continue
+        ratio = result["median_seconds"] / _baseline["median_seconds"]
+        logger.info(f"{script:>36} | {ratio:.3f}x of baseline startup time")
+        if ratio > threshold:
+            regressions.append((script, ratio))
+    return regressions
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--scripts", help="CLI scripts (relative to the repo root) to benchmark", nargs="+",
+            default=_CLI_SCRIPTS)
+
+    parser.add_argument("--repeats", help="Number of fresh interpreter runs of each script", default=5, type=int)
+
+    parser.add_argument("--top-imports", help="Number of heaviest top-level imports reported per script", default=10, type=int)
+
+    parser.add_argument("--output-path", help="Path of JSON benchmark result", default="import_time_results.json")
+
+    parser.add_argument("--baseline-path", help="""Path of previous JSON benchmark result to compare with,
+                        exits with non-zero code if any script regresses more than `regression-threshold`""",
+            default=None)
+
+    parser.add_argument("--regression-threshold", help="Max allowed ratio of current/baseline median startup time",
+            default=1.2, type=float)
+
+    parser.add_argument("--check-builder-configs", help="""Flag whether to check that creating one loader builder
+                        builds exactly one config, exits with non-zero code if not (skipped if the builder can't be created)""",
+            default=True, type=argparse_bool_check)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+
+    results = {
+        "git_commit": get_git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": args.repeats,
+        "results": run_import_time_benchmark(args.scripts, repeats=args.repeats, top_n=args.top_imports, logger=logger),
+    }
+
+    num_configs = None
+    if args.check_builder_configs:
+        _return_code, num_configs = count_built_builder_configs()
+        if num_configs is None:
+            logger.warning(f"Loader builder can't be created (return code {_return_code}), skipping the builder configs check")
+        else:
+            logger.info(f"Creating one loader builder built {num_configs} config(s)")
+        results["builder_configs_built"] = num_configs
+
+    with open(args.output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Benchmark result is saved in {args.output_path}")
+
+    if args.baseline_path is not None:
+        with open(args.baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.regression_threshold, logger=logger)
+        if len(regressions) > 0:
+            for script, ratio in regressions:
+                logger.error(f"Regression on {script}: {ratio:.3f}x of baseline startup time")
+            sys.exit(1)
+
+    if num_configs is not None and num_configs != 1:
+        logger.error(f"Creating one loader builder built {num_configs} configs instead of exactly one")
+        sys.exit(1)
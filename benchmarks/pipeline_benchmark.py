@@ -0,0 +1,368 @@
+'''
+Script on Benchmarking each stage of the pipeline on synthetic SEA-like Wikipedia dumps
+-------------------
+Stages benchmarked (in order, each one consumes the outputs of the previous one):
+  split: `split_bz2_files` of the dump files into smaller chunks
+  parse: XML page extraction of the chunks (`_extract_raw_pages`)
+  clean: wikicode cleaning of the extracted pages (`_clean_raw_page`)
+  write: writing the cleaned examples of each chunk into CSV gzip-compressed files
+  concat: `concat_csv_files` of the chunk CSVs and writing the concatted CSV
+  hard-dedup: `drop_hard_duplicates` of the concatted data
+  soft-dedup: `drop_soft_duplicates` of the hard-deduped data
+Each stage runs on its own forked process so its peak RSS can be measured separately.
+Run it from the repo root, e.g. `python -m benchmarks.pipeline_benchmark --scales small medium`
+'''
+
+import os, sys
+import gc
+import json
+import time
+import pickle
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_DIR not in sys.path:
+    sys.path.insert(0, _REPO_DIR)
+
+from dedup_raw_wiki_data import argparse_bool_check
+from local_dump_mirror import build_synthetic_dump
+
+
+_SCALES = {"small": 2000, "medium": 20000, "large": 200000}
+_STAGES = ["split", "parse", "clean", "write", "concat", "hard-dedup", "soft-dedup"]
+_EXPECTED_COLNAMES = ["id", "url", "title", "text"]
+
+_BENCH_LANG, _BENCH_DATE = "id", "20231101"
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    logger = logging.getLogger("Wiki Dataset Benchmark")
+
+    return logger
+
+
+class _StageTimer:
+    '''
+    Context manager accumulating the elapsed time of the measured part of a stage
+    '''
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed += time.perf_counter() - self._start
+
+
+def _quiet_logger():
+    _logger = logging.getLogger("Wiki Dataset Benchmark Stage")
+    _logger.setLevel(logging.WARNING)
+    return _logger
+
+
+def _total_size(paths):
+    return sum(os.path.getsize(path) for path in paths)
+
+
+### STAGES DEFINITION ###
+#each stage receives the benchmark context and the timer wrapping its measured part,
+#and returns its counts (items, bytes_in, bytes_out) and outputs to be merged into the context
+
+def _stage_split(ctx, timer):
+    from sea_loader_batched.wiki_loader import split_bz2_files
+
+    xml_files = ctx["xml_files"]
+    with timer:
+        split_files = split_bz2_files({"xml": list(xml_files)}, [True]*len(xml_files),
+                                      ctx["split_size"], force_rerun=True)["xml"]
+    return {"items": len(split_files), "bytes_in": _total_size(xml_files), "bytes_out": _total_size(split_files),
+            "outputs": {"split_files": split_files}}
+
+
+def _stage_parse(ctx, timer):
+    from sea_loader_batched.wiki_loader import _extract_raw_pages
+
+    n_pages, n_bytes_out = 0, 0
+    with timer:
+        for path in ctx["split_files"]:
+            with open(path, "rb") as f:
+                for _, _, raw_content in _extract_raw_pages(f):
+                    n_pages += 1
+                    n_bytes_out += len(raw_content)
+    return {"items": n_pages, "bytes_in": _total_size(ctx["split_files"]), "bytes_out": n_bytes_out}
+
+
+def _stage_clean(ctx, timer):
+    import mwparserfromhell
+    from sea_loader_batched.wiki_loader import _extract_raw_pages, _clean_raw_page
+
+    n_pages, n_bytes_in, n_bytes_out, example_files = 0, 0, 0, []
+    for idx, path in enumerate(ctx["split_files"]):
+        with open(path, "rb") as f:
+            raw_pages = list(_extract_raw_pages(f))
+        n_pages += len(raw_pages)
+        n_bytes_in += sum(len(raw_content) for _, _, raw_content in raw_pages)
+
+        with timer:
+            examples = [_clean_raw_page(inputs, parser=mwparserfromhell, language=_BENCH_LANG) for inputs in raw_pages]
+            examples = [example for example in examples if example is not None]
+        n_bytes_out += sum(len(example["text"]) for example in examples)
+
+        _example_file = os.path.join(ctx["work_dir"], f"examples_{idx+1}.pkl")
+        with open(_example_file, "wb") as f:
+            pickle.dump(examples, f)
+        example_files.append(_example_file)
+    return {"items": n_pages, "bytes_in": n_bytes_in, "bytes_out": n_bytes_out, "outputs": {"example_files": example_files}}
+
+
+def _stage_write(ctx, timer):
+    import pandas as pd
+
+    n_rows, csv_files = 0, []
+    for idx, path in enumerate(ctx["example_files"]):
+        with open(path, "rb") as f:
+            examples = pickle.load(f)
+        _csv_file = os.path.join(ctx["work_dir"], f"wiki_{_BENCH_LANG}_{_BENCH_DATE}_raw_dataset_splitted_idx_{idx+1}.csv.gz")
+        with timer:
+            df = pd.DataFrame(examples, columns=_EXPECTED_COLNAMES)
+            df.to_csv(_csv_file, index=False, compression="gzip")
+        n_rows += df.shape[0]
+        csv_files.append(_csv_file)
+    return {"items": n_rows, "bytes_in": _total_size(ctx["example_files"]), "bytes_out": _total_size(csv_files),
+            "outputs": {"csv_files": csv_files}}
+
+
+def _stage_concat(ctx, timer):
+    from concat_batched_data import concat_csv_files
+
+    _concat_file = os.path.join(ctx["work_dir"], f"wiki_{_BENCH_LANG}_{_BENCH_DATE}_raw_dataset.csv.gz")
+    with timer:
+        df = concat_csv_files(ctx["csv_files"], logger=_quiet_logger())
+        df.to_csv(_concat_file, index=False, compression="gzip")
+    return {"items": df.shape[0], "bytes_in": _total_size(ctx["csv_files"]), "bytes_out": os.path.getsize(_concat_file),
+            "outputs": {"concat_file": _concat_file}}
+
+
+def _stage_hard_dedup(ctx, timer):
+    from dedup_raw_wiki_data import read_csv_ignore_some_nulls, drop_hard_duplicates
+
+    df = read_csv_ignore_some_nulls(ctx["concat_file"], compression="gzip")
+    _n_rows = df.shape[0]
+    with timer:
+        df = drop_hard_duplicates(df, _EXPECTED_COLNAMES[1:], id_colname="id", logger=_quiet_logger())
+
+    _hard_dedup_file = os.path.join(ctx["work_dir"], f"wiki_{_BENCH_LANG}_{_BENCH_DATE}_hard_dedup.pkl")
+    df.to_pickle(_hard_dedup_file)
+    return {"items": _n_rows, "rows_dropped": _n_rows - df.shape[0], "bytes_in": os.path.getsize(ctx["concat_file"]),
+            "bytes_out": 0, "outputs": {"hard_dedup_file": _hard_dedup_file}}
+
+
+def _stage_soft_dedup(ctx, timer):
+    import pandas as pd
+    from dedup_raw_wiki_data import _args_to_text_constructor_fn, drop_soft_duplicates
+
+    #same defaults of `dedup_raw_wiki_data.py` CLI args
+    _text_processing_fn, _title_processing_fn = _args_to_text_constructor_fn(
+        remove_non_alphanumeric_option="neither", remove_excessive_whitespace_option="all",
+        remove_html_tags_option="all", decode_url_option="all", encoder_check_option="all",
+        text_encoder_choice_title="utf8", text_encoder_choice_text="utf8")
+
+    df = pd.read_pickle(ctx["hard_dedup_file"])
+    _n_rows = df.shape[0]
+    with timer:
+        df = drop_soft_duplicates(df, ["title", "text"], _text_processing_fn, _title_processing_fn, logger=_quiet_logger())
+    return {"items": _n_rows, "rows_dropped": _n_rows - df.shape[0], "bytes_in": os.path.getsize(ctx["hard_dedup_file"]),
+            "bytes_out": 0}
+
+
+_STAGE_FNS = {
+    "split": _stage_split,
+    "parse": _stage_parse,
+    "clean": _stage_clean,
+    "write": _stage_write,
+    "concat": _stage_concat,
+    "hard-dedup": _stage_hard_dedup,
+    "soft-dedup": _stage_soft_dedup,
+}
+
+
+def _stage_worker(stage_fn, ctx, conn):
+    try:
+        import warnings
+        warnings.simplefilter("ignore")
+        gc.collect()
+        timer = _StageTimer()
+        result = stage_fn(ctx, timer)
+        #ru_maxrss is in kB on Linux
+        result["elapsed_seconds"] = timer.elapsed
+        result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        conn.send(result)
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run_stage(stage: str, ctx: dict):
+    '''
+    Run a benchmark stage on a forked process, returning its measurement
+    '''
+    mp_ctx = multiprocessing.get_context("fork")
+    recv_conn, send_conn = mp_ctx.Pipe(duplex=False)
+    proc = mp_ctx.Process(target=_stage_worker, args=(_STAGE_FNS[stage], ctx, send_conn))
+    proc.start()
+    send_conn.close()
+    result = recv_conn.recv()
+    proc.join()
+
+    if "error" in result:
+        raise RuntimeError(f"Benchmark stage {stage} failed! {result['error']}")
+
+    _elapsed = result["elapsed_seconds"]
+    result["items_per_sec"] = round(result["items"] / _elapsed, 3) if _elapsed > 0 else None
+    result["mb_in_per_sec"] = round(result["bytes_in"] / 1e6 / _elapsed, 3) if _elapsed > 0 else None
+    result["elapsed_seconds"] = round(_elapsed, 4)
+    result["peak_rss_mb"] = round(result["peak_rss_mb"], 1)
+    return result
+
+
+def run_pipeline_benchmark(num_pages: int, work_dir: str, split_size: int, stages: list=_STAGES, seed: int=0, logger=None):
+    '''
+    Generate a synthetic dump of `num_pages` pages and run the pipeline stages on it
+
+    Returns
+    -------
+    dict of the scale info and measurement of each stage
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+
+    logger.info(f"Generating synthetic dump with {num_pages} pages in {work_dir}...")
+    dump_dir = build_synthetic_dump(work_dir, _BENCH_LANG, _BENCH_DATE, num_pages=num_pages, seed=seed)
+    xml_files = sorted(os.path.join(dump_dir, fname) for fname in os.listdir(dump_dir) if ".xml" in fname)
+
+    ctx = {"work_dir": work_dir, "xml_files": xml_files, "split_size": split_size}
+    stage_results = {}
+    for stage in stages:
+        logger.info(f"Running stage {stage}...")
+        result = run_stage(stage, ctx)
+        ctx.update(result.pop("outputs", {}))
+        stage_results[stage] = result
+        logger.info(f"Stage {stage} done in {result['elapsed_seconds']}s ({result['items_per_sec']} items/s, "
+                    f"{result['mb_in_per_sec']}MB/s in, peak RSS {result['peak_rss_mb']}MB)")
+
+    return {"num_pages": num_pages, "dump_bytes": _total_size(xml_files), "split_size": split_size, "stages": stage_results}
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=_REPO_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float, logger=None):
+    '''
+    Compare elapsed time of each stage against a previous benchmark result
+
+    Returns
+    -------
+    list of (scale, stage, ratio) whose ratio of current/baseline elapsed time exceeds the threshold
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    regressions = []
+    for scale, scale_result in results["results"].items():
+        _baseline_scale = baseline.get("results", {}).get(scale)
+        if _baseline_scale is None or _baseline_scale["num_pages"] != scale_result["num_pages"]:
+            logger.info(f"No comparable baseline for scale {scale}, skipping")
+            continue
+        for stage, stage_result in scale_result["stages"].items():
+            _baseline_stage = _baseline_scale["stages"].get(stage)
+            if _baseline_stage is None or not _baseline_stage["elapsed_seconds"]:
+                continue
+            ratio = stage_result["elapsed_seconds"] / _baseline_stage["elapsed_seconds"]
+            logger.info(f"{scale:>8} | {stage:>10} | {ratio:.3f}x of baseline elapsed time")
+            if ratio > threshold:
+                regressions.append((scale, stage, ratio))
+    return regressions
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--scales", help="Scales of synthetic dump to benchmark", nargs="+",
+            choices=list(_SCALES.keys()), default=["small"])
+
+    parser.add_argument("--stages", help="Stages of the pipeline to benchmark (need the prior stages)", nargs="+",
+            choices=_STAGES, default=_STAGES)
+
+    parser.add_argument("--split-size-mb", help="Uncompressed size (in MB) of each split chunk", default=4, type=float)
+
+    parser.add_argument("--seed", help="Seed of synthetic dump generation", default=0, type=int)
+
+    parser.add_argument("--output-path", help="Path of the JSON benchmark result", default="bench_results.json")
+
+    parser.add_argument("--baseline-path", help="Path of a previous JSON benchmark result to compare with", default=None)
+
+    parser.add_argument("--regression-threshold", help="Ratio of elapsed time vs baseline considered as regression",
+            default=1.1, type=float)
+
+    parser.add_argument("--work-dir-path", help="Dir to put the synthetic dumps and stage outputs (temp dir if not given)",
+            default=None)
+
+    parser.add_argument("--keep-work-dir", help="Flag whether to keep the synthetic dumps and stage outputs",
+            default=False, type=argparse_bool_check)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    stages = [stage for stage in _STAGES if stage in args.stages]
+    results = {
+        "commit": get_git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": {},
+    }
+
+    for scale in args.scales:
+        _work_dir = os.path.join(args.work_dir_path, scale) if args.work_dir_path else tempfile.mkdtemp(prefix=f"wiki_bench_{scale}_")
+        os.makedirs(_work_dir, exist_ok=True)
+        try:
+            results["results"][scale] = run_pipeline_benchmark(
+                _SCALES[scale], _work_dir, split_size=int(args.split_size_mb*1e6), stages=stages, seed=args.seed, logger=logger)
+        finally:
+            if not args.keep_work_dir:
+                shutil.rmtree(_work_dir, ignore_errors=True)
+
+    with open(args.output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Benchmark result is saved in {args.output_path}")
+
+    if args.baseline_path is not None:
+        with open(args.baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.regression_threshold, logger=logger)
+        for scale, stage, ratio in regressions:
+            logger.warning(f"Possible regression on scale {scale} stage {stage}: {ratio:.3f}x of baseline elapsed time")
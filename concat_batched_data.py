@@ -1,8 +1,11 @@
+import io
 import os
+import gzip
+import heapq
 import argparse
 import logging
 
-import pandas as pd
+from pipeline_metrics import PipelineMetrics, add_metrics_args
 
 
 def set_logger():
@@ -41,6 +44,8 @@ def read_csv_ignore_some_nulls(path: str, null_list_data: list=None, *args, **kw
     -------
     pandas DataFrame object
     '''
+    import pandas as pd
+
     #values of pd._libs.parsers.STR_NA_VALUES: {'', '<NA>', 'NaN', 'N/A', 'null', '1.#QNAN', 'None', '#NA', 'nan', '-NaN', '#N/A N/A', '-1.#QNAN', 'NA', '-1.#IND', 'n/a', 'NULL', '-nan', '1.#IND', '#N/A'}
     _unconsidered_for_null_list = ['NA', 'NULL', 'null', 'nan', 'null', 'NaN', 'None', 'N/A']
     if null_list_data is not None:
@@ -50,6 +55,90 @@ def read_csv_ignore_some_nulls(path: str, null_list_data: list=None, *args, **kw
     return pd.read_csv(path, keep_default_na=False, na_values=values_to_considered_missing_data, *args, **kwargs)
 
 
+def concat_csv_files(csv_list_files: list, logger=None):
+    '''
+    Concat the gzip-compressed CSV files of batched Wikipedia data into one DataFrame
+
+    Parameters
+    ----------
+    csv_list_files: list of paths to CSV gzip-compressed files
+    Returns
+    -------
+    pandas DataFrame object
+    '''
+    import pandas as pd
+
+    logger = logger if logger is not None else logging.getLogger(__name__)
+
+    for idx, path in enumerate(csv_list_files):
+        logger.info(f"Processinng data {idx+1} out of {len(csv_list_files)}")
+        if idx == 0:
+            df = read_csv_ignore_some_nulls(path, compression='gzip')
+        else:
+            df = pd.concat([df, read_csv_ignore_some_nulls(path, compression='gzip')], ignore_index=True)
+    return df
+
+
+def _iter_id_sorted_rows(path: str, colnames: list, chunk_size: int, id_colname: str="id"):
+    _id_idx, _last_id = colnames.index(id_colname), None
+    #every column is read as text, so the values are copied verbatim instead of re-typed per chunk (e.g. "007" into 7)
+    for df in read_csv_ignore_some_nulls(path, compression='gzip', chunksize=chunk_size, dtype=str):
+        for row in df[colnames].itertuples(index=False, name=None):
+            _id = int(row[_id_idx])
+            if _last_id is not None and _id < _last_id:
+                raise ValueError(f"Data {path} isn't sorted by {id_colname}! Re-run `extract_raw_wiki_data_batched.py` to write the sorted splits")
+            _last_id = _id
+            yield _id, row
+
+
+def merge_sorted_csv_files(csv_list_files: list, save_path: str, chunk_size: int=1000, id_colname: str="id",
+                           logger=None, inc_counter=None):
+    '''
+    Merge the gzip-compressed CSV files of batched Wikipedia data, each one sorted by numeric id, into one CSV
+    sorted by id, streaming a k-way merge so only `chunk_size` rows of each file are held in memory at once.
+    The output is deterministic (regardless of the order of the files, for unique ids) & byte-identical across runs
+
+    Parameters
+    ----------
+    csv_list_files: list of paths to CSV gzip-compressed files sorted by `id_colname`
+    save_path: path of the merged CSV gzip-compressed file
+    chunk_size: number of rows read from each file (and written into the merged file) at once
+    id_colname: colname of the numeric data identifier
+    inc_counter: optional fn of `(name, value=1)` to count the merged rows
+    Returns
+    -------
+    number of rows of the merged file
+    '''
+    import pandas as pd
+
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    if len(csv_list_files) == 0:
+        raise ValueError("No CSV gzip-compressed files to be merged!")
+
+    colnames = read_csv_ignore_some_nulls(csv_list_files[0], compression='gzip', nrows=0).columns.to_list()
+    _sorted_rows = [_iter_id_sorted_rows(path, colnames, chunk_size, id_colname=id_colname) for path in sorted(csv_list_files)]
+
+    num_rows, rows = 0, []
+    #one gzip stream without the write time in its header, so the output bytes don't depend on the run nor the chunking
+    with open(save_path, "wb") as f, gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gzip_f, \
+            io.TextIOWrapper(gzip_f, encoding="utf-8", newline="") as text_f:
+        for _, row in heapq.merge(*_sorted_rows, key=lambda val: val[0]):
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                #written as str, as `to_csv` on the handle flushes the gzip stream, whose sync points depend on the chunking
+                text_f.write(pd.DataFrame(rows, columns=colnames).to_csv(index=False, header=num_rows == 0))
+                num_rows += len(rows)
+                rows = []
+        if len(rows) > 0 or num_rows == 0:
+            text_f.write(pd.DataFrame(rows, columns=colnames).to_csv(index=False, header=num_rows == 0))
+            num_rows += len(rows)
+    logger.info(f"{num_rows} rows of {len(csv_list_files)} files are merged into {save_path}")
+
+    if inc_counter is not None:
+        inc_counter("pages", num_rows)
+    return num_rows
+
+
 #only executed if called directly
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -62,6 +151,12 @@ if __name__ == "__main__":
                     to the `concat_data.py` script dir""",
         default=os.path.dirname(os.path.abspath(__file__)))
 
+    parser.add_argument("--chunk-size", help="""Number of rows read from each batch file at once,
+                    the memory used is bounded by #batch files x chunk size""",
+        default=1000, type=int)
+
+    add_metrics_args(parser)
+
     args = parser.parse_args()
 
 
@@ -73,14 +168,14 @@ if __name__ == "__main__":
 
     csv_list_files = [os.path.join(load_dir, _filename) for _filename in os.listdir(load_dir) if _filename.endswith(".csv.gz")]
 
-    for idx, path in enumerate(csv_list_files):
-        logger.info(f"Processinng data {idx+1} out of {len(csv_list_files)}")
-        if idx == 0:
-            df = read_csv_ignore_some_nulls(path, compression='gzip')
-        else:
-            df = pd.concat([df, read_csv_ignore_some_nulls(path, compression='gzip')], ignore_index=True)
-    
-    logger.info("Loading done!")
-    logger.info(f"#Data collected: {df.shape[0]}")
-    logger.info("Saving dataset raw form after concatted...")
-    df.to_csv(f"{save_dir}.csv.gz", index=False, compression='gzip')
+    metrics = PipelineMetrics.from_args(args, run_name="concat_" + os.path.basename(save_dir))
+
+    logger.info("Merging the batched data by id...")
+    with metrics.stage("concat") as inc_counter:
+        num_rows = merge_sorted_csv_files(csv_list_files, f"{save_dir}.csv.gz", chunk_size=args.chunk_size,
+                                          logger=logger, inc_counter=inc_counter)
+        inc_counter("bytes_in", sum(os.path.getsize(path) for path in csv_list_files))
+        inc_counter("bytes_out", os.path.getsize(f"{save_dir}.csv.gz"))
+    logger.info(f"#Data collected: {num_rows}")
+
+    metrics.export_if_requested(args, logger)
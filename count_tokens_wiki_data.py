@@ -0,0 +1,144 @@
+'''
+Script on Counting `tiktoken` Tokens of Wikipedia Data extracted/deduplicated by this repo
+-------------------
+Adds `n_tokens` column into each CSV gzip-compressed data and reports the per-language totals.
+The texts are encoded in batches by `encode_ordinary_batch` on a thread pool (tiktoken releases the GIL).
+'''
+
+import os
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+
+from dedup_raw_wiki_data import read_csv_ignore_some_nulls, write_csv_chunk, get_lang_and_date_from_file_name
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def count_tokens(texts: list, encoder, executor: ThreadPoolExecutor, batch_size: int=1000):
+    '''
+    Count tokens of each text by encoding the batches concurrently on the given thread pool
+
+    Parameters
+    ----------
+    texts: list of string to be tokenized
+    encoder: `tiktoken.Encoding` object
+    executor: thread pool to run `encode_ordinary_batch` of each batch on
+    batch_size: number of texts per batch
+    Returns
+    -------
+    list of token count of each text (in the same order)
+    '''
+    def _count_batch(batch):
+        return [len(tokens) for tokens in encoder.encode_ordinary_batch(batch, num_threads=1)]
+
+    batches = [texts[idx:idx+batch_size] for idx in range(0, len(texts), batch_size)]
+    n_tokens = []
+    for batch_n_tokens in executor.map(_count_batch, batches):
+        n_tokens.extend(batch_n_tokens)
+    return n_tokens
+
+
+def count_tokens_of_csv(csv_path: str, save_path: str, encoder, executor: ThreadPoolExecutor,
+                        batch_size: int=1000, chunk_size: int=100000, text_colname: str="text"):
+    '''
+    Stream a CSV gzip-compressed Wikipedia data in chunks and write it with `n_tokens` column added
+
+    Returns
+    -------
+    tuple of number of rows and number of tokens
+    '''
+    n_rows, n_tokens = 0, 0
+    for idx, df in enumerate(read_csv_ignore_some_nulls(csv_path, compression="gzip", chunksize=chunk_size)):
+        #the empty texts are read as nulls, counted as 0 tokens
+        df["n_tokens"] = count_tokens(df[text_colname].fillna("").astype(str).to_list(), encoder, executor, batch_size=batch_size)
+        write_csv_chunk(df, save_path, is_first_chunk=idx == 0)
+        n_rows += df.shape[0]
+        n_tokens += int(df["n_tokens"].sum())
+    return n_rows, n_tokens
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--csv-path", help="Relative location of csv file(s) containing Wikipedia data", nargs="+")
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved Wikipedia CSV data with `n_tokens` column
+                        to the `count_tokens_wiki_data.py` script dir""",
+            default=os.path.dirname(os.path.abspath(__file__)))
+
+    parser.add_argument("--encoding-name", help="Name of `tiktoken` encoding to count the tokens with",
+            default="cl100k_base")
+
+    parser.add_argument("--batch-size", help="Number of texts per `encode_ordinary_batch` call", default=1000, type=int)
+
+    parser.add_argument("--num-threads", help="Number of threads to encode the batches concurrently",
+            default=os.cpu_count(), type=int)
+
+    parser.add_argument("--chunk-size", help="Number of rows read from the CSV at once", default=100000, type=int)
+
+    parser.add_argument("--report-path", help="Path of JSON report of per-language token totals",
+            default="token_count_report.json")
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    import tiktoken
+    encoder = tiktoken.get_encoding(args.encoding_name)
+
+    report = defaultdict(lambda: {"n_articles": 0, "n_tokens": 0, "elapsed_seconds": 0.0, "files": []})
+    with ThreadPoolExecutor(max_workers=args.num_threads) as executor:
+        for csv_path in args.csv_path:
+            lang, date_ver = get_lang_and_date_from_file_name(csv_path)
+            _save_file_name = os.path.basename(csv_path).replace(".csv.gz", "") + "_n_tokens.csv.gz"
+            _save_path = os.path.join(args.save_dir_path, _save_file_name)
+
+            logger.info(f"Counting tokens of {csv_path}...")
+            _start_time = time.perf_counter()
+            n_rows, n_tokens = count_tokens_of_csv(csv_path, _save_path, encoder, executor,
+                                                   batch_size=args.batch_size, chunk_size=args.chunk_size)
+            _elapsed = time.perf_counter() - _start_time
+            logger.info(f"#Data: {n_rows}, #Tokens: {n_tokens} in {_elapsed:.1f}s ({n_tokens/_elapsed if _elapsed > 0 else 0:.0f} tokens/sec)")
+
+            _lang_report = report[f"{lang}_{date_ver}" if lang is not None else os.path.basename(csv_path)]
+            _lang_report["n_articles"] += n_rows
+            _lang_report["n_tokens"] += n_tokens
+            _lang_report["elapsed_seconds"] += _elapsed
+            _lang_report["files"].append(_save_path)
+
+    for _lang_report in report.values():
+        _elapsed = _lang_report["elapsed_seconds"]
+        _lang_report["tokens_per_sec"] = _lang_report["n_tokens"] / _elapsed if _elapsed > 0 else None
+
+    with open(args.report_path, "w") as f:
+        json.dump({"encoding_name": args.encoding_name, "languages": report}, f, indent=2)
+    logger.info(f"Token count report is saved in {args.report_path}")
@@ -1,6 +1,9 @@
 '''
 Script on Cleansing Wikipedia Data that has been extracted from extract_raw_wiki_data.py
 '''
+#annotations aren't evaluated on import, so pandas is only imported when the data is read
+from __future__ import annotations
+
 #core functionality modules
 import os, gc
 import logging
@@ -12,11 +15,10 @@ from functools import partial
 #text preprocess modules
 import re
 import urllib
+import unicodedata
 from xml.etree import ElementTree as ET
 
-#dataset related modules
-import numpy as np
-import pandas as pd
+from pipeline_metrics import PipelineMetrics, add_metrics_args
 
 
 ### MODULES DEFINITION ###
@@ -131,10 +133,73 @@ def check_text_by_encoder(text: str, encoder: str="utf8"):
 def remove_excessive_whitespace(text: str):
     return re.sub("(\s)(\s+)", r"\1", text).strip()
 
+#Unicode blocks of scripts that aren't covered by the legacy ASCII-only non-alphanumeric removal
+_NON_ALPHANUMERIC_SCRIPT_RANGES = {
+    "thai": [(0x0E00, 0x0E7F)],
+    "lao": [(0x0E80, 0x0EFF)],
+    "khmer": [(0x1780, 0x17FF), (0x19E0, 0x19FF)],
+    "myanmar": [(0x1000, 0x109F), (0xA9E0, 0xA9FF), (0xAA60, 0xAA7F)],
+    "tamil": [(0x0B80, 0x0BFF), (0x11FC0, 0x11FFF)],
+}
+#"ascii" keeps the legacy `[^a-z0-9\s]` behaviour, "all" keeps letters, marks & digits of every script
+NON_ALPHANUMERIC_SCRIPT_CHOICES = ["auto", "ascii", "all"] + list(_NON_ALPHANUMERIC_SCRIPT_RANGES.keys())
+
+#default script of `remove_non_alphanumeric` per lang id, the other langs use "ascii"
+_LANG_DEFAULT_NON_ALPHANUMERIC_SCRIPT = {
+    "th": "thai", "lo": "lao", "km": "khmer", "my": "myanmar", "shn": "myanmar", "mnw": "myanmar", "ta": "tamil",
+}
+
+_LEGACY_ALPHANUMERIC_RE = re.compile("[a-z0-9\s]", flags=re.I)
+
+
+class _NonAlphanumericTranslateTable(dict):
+    '''
+    `str.translate` table deleting the chars that aren't alphanumeric for a given script.
+    The ASCII range and the script blocks are precomputed, other chars are resolved (and cached) on first lookup
+    '''
+    def __init__(self, script: str):
+        super().__init__()
+        self._script_ranges = _NON_ALPHANUMERIC_SCRIPT_RANGES.get(script, [])
+        self._keep_all_scripts = script == "all"
+        for codepoint in range(0x80):
+            self.__missing__(codepoint)
+        for start, end in self._script_ranges:
+            for codepoint in range(start, end+1):
+                self.__missing__(codepoint)
+
+    def _is_kept(self, codepoint: int):
+        char = chr(codepoint)
+        if _LEGACY_ALPHANUMERIC_RE.match(char):
+            return True
+        if self._keep_all_scripts or any(start <= codepoint <= end for start, end in self._script_ranges):
+            #letters, combining marks (vowel signs of Brahmic scripts) & digits
+            return unicodedata.category(char)[0] in ("L", "M", "N")
+        return False
+
+    def __missing__(self, codepoint: int):
+        value = codepoint if self._is_kept(codepoint) else None
+        self[codepoint] = value
+        return value
+
+
+_NON_ALPHANUMERIC_TRANSLATE_TABLES = {}
+
+
+def get_non_alphanumeric_script(script: str, lang_id: str=None):
+    '''
+    Resolve "auto" script choice of `remove_non_alphanumeric` from the lang id
+    '''
+    if script != "auto":
+        return script
+    return _LANG_DEFAULT_NON_ALPHANUMERIC_SCRIPT.get(lang_id, "ascii")
+
+
 #create non-alphanumeric removal of text
 @text_cleansing_wrapper
-def remove_non_alphanumeric(text: str):
-    return re.sub("[^a-z0-9\s]", "", text, flags=re.I).strip()
+def remove_non_alphanumeric(text: str, script: str="ascii"):
+    if script not in _NON_ALPHANUMERIC_TRANSLATE_TABLES:
+        _NON_ALPHANUMERIC_TRANSLATE_TABLES[script] = _NonAlphanumericTranslateTable(script)
+    return text.translate(_NON_ALPHANUMERIC_TRANSLATE_TABLES[script]).strip()
 
 # def cleanse_wiki_text(text: str):
 #     return remove_html_tags(decode_url_and_remove_non_ascii(text))
@@ -155,6 +220,8 @@ def read_csv_ignore_some_nulls(path: str, null_list_data: list=None, *args, **kw
     -------
     pandas DataFrame object
     '''
+    import pandas as pd
+
     #values of pd._libs.parsers.STR_NA_VALUES: {'', '<NA>', 'NaN', 'N/A', 'null', '1.#QNAN', 'None', '#NA', 'nan', '-NaN', '#N/A N/A', '-1.#QNAN', 'NA', '-1.#IND', 'n/a', 'NULL', '-nan', '1.#IND', '#N/A'}
     _unconsidered_for_null_list = ['NA', 'NULL', 'null', 'nan', 'null', 'NaN', 'None', 'N/A']
     if null_list_data is not None:
@@ -164,13 +231,49 @@ def read_csv_ignore_some_nulls(path: str, null_list_data: list=None, *args, **kw
     return pd.read_csv(path, keep_default_na=False, na_values=values_to_considered_missing_data, *args, **kwargs)
 
 
+def write_csv_chunk(data, path: str, is_first_chunk: bool, colnames: list=None):
+    '''
+    Write a chunk of data into a gzip-compressed CSV file, (over)writing it with the header on the first chunk
+    and appending the next ones
+
+    Parameters
+    ----------
+    data: pandas DataFrame, or list of records if `colnames` is given
+    path: path of the CSV gzip-compressed file
+    is_first_chunk: whether the chunk is the first one of the file
+    colnames: colnames of the records of `data`
+    '''
+    import pandas as pd
+
+    df = pd.DataFrame(data, columns=colnames) if colnames is not None else data
+    #appending into gzip file creates multi-member gzip, which is still readable as one file
+    df.to_csv(path, index=False, compression="gzip", mode="w" if is_first_chunk else "a", header=is_first_chunk)
+
+
+def get_lang_and_date_from_file_name(path: str):
+    '''
+    Get the lang id and date of Wikipedia data from its file name following `wiki_{lang}_{date}_*` format
+
+    Parameters
+    ----------
+    path: path to Wikipedia data file
+    Returns
+    -------
+    tuple of lang id and date (YYYYMMDD), both are None if the file name doesn't follow the format
+    '''
+    _match = re.match(r"wiki_([^_]+)_(\d{8})_", os.path.basename(path))
+    if _match is None:
+        return None, None
+    return _match.group(1), _match.group(2)
+
+
 def _text_normalizer_constructor(
         remove_non_alphanumeric_bool: bool, remove_excessive_whitespace_bool: bool,
         remove_html_tags_bool: bool, decode_url_bool: bool, encoder_check_bool: bool,
-        encoder: str="utf8"):
+        encoder: str="utf8", non_alphanumeric_script: str="ascii"):
 
     _lambda_fn_1 = partial(check_text_by_encoder, encoder=encoder) if encoder_check_bool else lambda x: x
-    _lambda_fn_2 = lambda x: remove_non_alphanumeric(_lambda_fn_1(x)) if remove_non_alphanumeric_bool else _lambda_fn_1(x)
+    _lambda_fn_2 = lambda x: remove_non_alphanumeric(_lambda_fn_1(x), script=non_alphanumeric_script) if remove_non_alphanumeric_bool else _lambda_fn_1(x)
     _lambda_fn_3 = lambda x: remove_excessive_whitespace(_lambda_fn_2(x)) if remove_excessive_whitespace_bool else _lambda_fn_2(x)
     _lambda_fn_4 = lambda x: remove_html_tags(_lambda_fn_3(x)) if remove_html_tags_bool else _lambda_fn_3(x)
     _lambda_fn_5 = lambda x: decode_url(_lambda_fn_4(x)) if decode_url_bool else _lambda_fn_4(x)
@@ -197,6 +300,9 @@ def _args_to_text_constructor_fn(**kwargs):
     kwargs_title["encoder"] = kwargs["text_encoder_choice_title"]
     kwargs_text["encoder"] = kwargs["text_encoder_choice_text"]
 
+    kwargs_title["non_alphanumeric_script"] = kwargs.get("non_alphanumeric_script_choice", "ascii")
+    kwargs_text["non_alphanumeric_script"] = kwargs.get("non_alphanumeric_script_choice", "ascii")
+
     for key, val in kwargs.items():
         if key not in [
             "remove_non_alphanumeric_option", "remove_excessive_whitespace_option",
@@ -209,30 +315,53 @@ def _args_to_text_constructor_fn(**kwargs):
     return _text_normalizer_constructor(**kwargs_text), _text_normalizer_constructor(**kwargs_title)
 
 
-def _text_processing_wrapper(text: str, _fn, mode: str="text"):
-    if mode not in ["text", "title"]:
-        raise ValueError(f"Provided `mode` isn't either 'text' or 'title'! Received: {mode}")
-    return _fn(text.lower()) if mode=="title" else _fn(text)
+def get_text_processing_fns(args, non_alphanumeric_script: str="ascii"):
+    '''
+    Construct the text & title processing fns of soft-dedup from the parsed CLI args added by `add_text_processing_args`
+    '''
+    return _args_to_text_constructor_fn(
+        remove_non_alphanumeric_option = args.remove_non_alphanumeric_option,
+        remove_excessive_whitespace_option = args.remove_excessive_whitespace_option,
+        remove_html_tags_option = args.remove_html_tags_option,
+        decode_url_option = args.text_encoder_choice_title,
+        encoder_check_option = args.encoder_check_option,
+        text_encoder_choice_title = args.text_encoder_choice_title,
+        text_encoder_choice_text = args.text_encoder_choice_text,
+        non_alphanumeric_script_choice = non_alphanumeric_script
+    )
 
 
-### MAIN CODE ###
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
+def get_dedup_save_file_name(raw_data_path: str, overwrite_initial_title_data: bool=False,
+                             overwrite_initial_text_data: bool=False):
+    '''
+    Get the file name of deduplicated data from its raw data file name
+    (e.g. `wiki_id_20231101_raw_dataset.csv.gz` into `wiki_id_20231101_dataset_dedup_cleansed.csv.gz`)
+    '''
+    #input path splitted by ("/") for the last entry should return filename
+    #whereas the filename splitted by (".") except the last value should return the filename w/o ".csv" extension
 
-    parser.add_argument("--raw-csv-path", help="Relative location of csv file containing raw Wikipedia data")
+    _override_suffix_identifier = ""
+    if overwrite_initial_title_data or overwrite_initial_text_data:
+        _override_suffix_identifier = "_overwritten"
+        if overwrite_initial_text_data:
+            _override_suffix_identifier = "_text"+_override_suffix_identifier
+        if overwrite_initial_title_data:
+            _override_suffix_identifier = "_title"+_override_suffix_identifier
 
-    parser.add_argument("--drop-hard-dupl", help="""Flag whether to drop hard duplicates
-                        (exact values of data of relevant text fields, Titles & Desc)""",
-          default=True, type=argparse_bool_check)
+    _save_file_name = ".".join(raw_data_path.split("/")[-1].split(".")[:-2]) + "_dedup_cleansed" + _override_suffix_identifier + ".csv.gz"
+    return _save_file_name.replace("_raw", "")
 
-    parser.add_argument("--drop-soft-dupl", help="""Flag whether to drop soft duplicates
-                        (duplicates after cleansed and normalized relevant text fields, Titles & Desc)""",
-          default=True, type=argparse_bool_check)
 
-    parser.add_argument("--save-dir-path", help="""Relative dir path of saved Wikipedia CSV data
-                        to the `dedup_raw_wiki_data.py` script dir""",
-            default=os.path.dirname(os.path.abspath(__file__)))
+def _text_processing_wrapper(text: str, _fn, mode: str="text"):
+    if mode not in ["text", "title"]:
+        raise ValueError(f"Provided `mode` isn't either 'text' or 'title'! Received: {mode}")
+    return _fn(text.lower()) if mode=="title" else _fn(text)
+
 
+def add_text_processing_args(parser):
+    '''
+    Add the CLI args of soft-dedup text processing into an `argparse.ArgumentParser`
+    '''
     ### THE FOLLOWING ARGUMENTS ONLY TEMPORARILY ALTER THE TEXT DATA ONLY FOR SOFT-DEDUP CHECK ###
     ### THE INITIAL TEXT DATA WON'T BE OVERWRITTEN AFTER BEING PREPROCESSED ###
     ### UNLESS YOU ARE SPECIFYING IN ARGS `overwrite-initial-title-data` AND `overwrite-initial-text-data` ###
@@ -281,6 +410,148 @@ if __name__ == "__main__":
                         to be applied into `check_text_by_encoder` for soft duplicates detection""",
           default="utf8", type=str)
 
+    ### ARGS TO CHOOSE SCRIPT OF ALPHANUMERIC CHARS KEPT BY `remove_non_alphanumeric` ###
+    parser.add_argument("--non-alphanumeric-script-choice", help="""Identifier of script whose letters & digits are kept
+                        (besides ASCII ones) by `remove_non_alphanumeric` for soft duplicates detection.
+                        "auto" chooses it from the lang id of the data (e.g. "thai" for "th"),
+                        "ascii" keeps ASCII letters & digits only, "all" keeps letters & digits of every script""",
+          default="auto", choices=NON_ALPHANUMERIC_SCRIPT_CHOICES)
+    return parser
+
+
+def drop_hard_duplicates(df: pd.DataFrame, colnames: list, id_colname: str="id", logger=None, inc_counter=None):
+    '''
+    Drop all rows having exact same value with any other row on any of the given colnames
+
+    Parameters
+    ----------
+    df: pandas DataFrame of Wikipedia data
+    colnames: list of colnames to be checked for hard duplicates
+    id_colname: colname of the data identifier, re-assigned if it's duplicated after dropping
+    inc_counter: optional fn of `(name, value=1)` to count the dropped rows per column
+    Returns
+    -------
+    pandas DataFrame object
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+
+    for colname in colnames:
+        logger.info(f"Checking data integrity on column {colname} on removing hard-duplicate(s)...")
+        dupl_text_df = df[df.duplicated(subset=colname,keep=False)]
+        shape_of_dupl_data = dupl_text_df.shape[0]
+
+        if shape_of_dupl_data > 0:
+            logger.info(f"Found {shape_of_dupl_data} data duplicated! Will be dropped")
+            df.drop_duplicates(subset=colname, keep=False, inplace=True)
+            if inc_counter is not None:
+                inc_counter(f"dropped-hard-dupl-{colname}", shape_of_dupl_data)
+
+
+    #check id/idx of the cleansed data, whether it has duplicate
+    # (the duplication of id/idx should came from the very first extraction, not from the cleansing)
+
+    if df[df.duplicated(subset=id_colname,keep=False)].shape[0] > 0:
+        logger.info("Duplicated ID found! Re-assigning ID to the new ones based on `df.reset_index` method!")
+        df[id_colname] = df.reset_index().index
+        if inc_counter is not None:
+            inc_counter("reassigned-ids", df.shape[0])
+
+    return df
+
+
+def drop_soft_duplicates(df: pd.DataFrame, colnames: list, text_processing_fn, title_processing_fn,
+                         overwrite_initial_title_data: bool=False, overwrite_initial_text_data: bool=False,
+                         logger=None, inc_counter=None):
+    '''
+    Drop all except the longest raw value of rows having same value on any of the given colnames
+    after being normalized by its text processing fn
+
+    Parameters
+    ----------
+    df: pandas DataFrame of Wikipedia data
+    colnames: list of colnames to be checked for soft duplicates ("title" and/or "text")
+    text_processing_fn: normalizer fn of "text" column
+    title_processing_fn: normalizer fn of "title" column
+    overwrite_initial_title_data: whether to overwrite the "title" column with its normalized value
+    overwrite_initial_text_data: whether to overwrite the "text" column with its normalized value
+    inc_counter: optional fn of `(name, value=1)` to count the duplicated rows per column and the dropped rows
+    Returns
+    -------
+    pandas DataFrame object
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+
+    idx_to_keep = set(df.index.to_list())
+
+    for colname in colnames:
+        #Construct Text Cleanser Fn for soft-duplicate cleansing
+        _PROCESSING_FN = text_processing_fn if colname == "text" else title_processing_fn
+        _text_processing_fn = partial(_text_processing_wrapper, _fn=_PROCESSING_FN, mode=colname)
+        logger.info(f"Checking data integrity on column {colname} on removing soft-duplicate(s)...")
+        _df = df.copy(deep=True)
+
+        #Setting up DF cols as String so it can be text-processed
+        _df = _df[[colname]]
+        _df[colname] = _df[colname].astype("str")
+        logger.info(f"Cleansing the data based on {colname}")
+
+        #applying text processing
+        _df[colname+"_raw_len"] = _df[colname].apply(len)
+        _df[colname+"_cleansed"] = _df[colname].apply(lambda row_text: _text_processing_fn(text=row_text))
+
+        #overwrite its text data if set as true
+        if overwrite_initial_title_data and colname == "title":
+            df[colname] = _df[colname+"_cleansed"]
+        elif overwrite_initial_text_data and colname == "text":
+            df[colname] = _df[colname+"_cleansed"]
+
+        #choose the data to keep by "ranking" it according to len of its raw text (greatest to keep)
+        logger.info(f"Ranking and grouping the data based on {colname}")
+        _df["rk"] = _df.groupby(colname+"_cleansed")[colname+"_raw_len"].rank(method="min", ascending=False)
+        shape_of_dupl_data = _df[_df["rk"]>1].shape[0]
+
+        if shape_of_dupl_data > 0:
+            logger.info(f"Found {shape_of_dupl_data} data duplicated! Will be dropped")
+            _idx_to_keep = _df[_df["rk"]==1].index.to_list()
+            if len(_idx_to_keep)+shape_of_dupl_data != df.shape[0]:
+                raise AssertionError("Mismatch of data number!")
+            idx_to_keep = idx_to_keep.intersection(set(_idx_to_keep))
+            if inc_counter is not None:
+                inc_counter(f"soft-dupl-{colname}", shape_of_dupl_data)
+        else:
+            logger.info(f"No soft-duplicate found in colname {colname}. Continuing")
+
+        del _df
+        gc.collect()
+
+    logger.info(f"The final data kept is {len(idx_to_keep)} from {df.shape[0]}")
+    if inc_counter is not None:
+        inc_counter("dropped-soft-dupl", df.shape[0] - len(idx_to_keep))
+    return df.loc[list(idx_to_keep),:]
+
+
+### MAIN CODE ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--raw-csv-path", help="Relative location of csv file containing raw Wikipedia data")
+
+    parser.add_argument("--drop-hard-dupl", help="""Flag whether to drop hard duplicates
+                        (exact values of data of relevant text fields, Titles & Desc)""",
+          default=True, type=argparse_bool_check)
+
+    parser.add_argument("--drop-soft-dupl", help="""Flag whether to drop soft duplicates
+                        (duplicates after cleansed and normalized relevant text fields, Titles & Desc)""",
+          default=True, type=argparse_bool_check)
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved Wikipedia CSV data
+                        to the `dedup_raw_wiki_data.py` script dir""",
+            default=os.path.dirname(os.path.abspath(__file__)))
+
+    add_text_processing_args(parser)
+
+    add_metrics_args(parser)
+
 
     _EXPECTED_COLNAMES = ["id", "url", "title", "text"]
 
@@ -289,15 +560,11 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    _TEXT_PROCESSING_FN, _TITLE_PROCESSING_FN = _args_to_text_constructor_fn(
-        remove_non_alphanumeric_option = args.remove_non_alphanumeric_option,
-        remove_excessive_whitespace_option = args.remove_excessive_whitespace_option,
-        remove_html_tags_option = args.remove_html_tags_option,
-        decode_url_option = args.text_encoder_choice_title,
-        encoder_check_option = args.encoder_check_option,
-        text_encoder_choice_title = args.text_encoder_choice_title,
-        text_encoder_choice_text = args.text_encoder_choice_text
-    )
+    _lang_id, _ = get_lang_and_date_from_file_name(args.raw_csv_path)
+    non_alphanumeric_script = get_non_alphanumeric_script(args.non_alphanumeric_script_choice, _lang_id)
+    logger.info(f"Using script of `{non_alphanumeric_script}` on `remove_non_alphanumeric` text processing")
+
+    _TEXT_PROCESSING_FN, _TITLE_PROCESSING_FN = get_text_processing_fns(args, non_alphanumeric_script)
 
     raw_data_path = args.raw_csv_path
     drop_hard_dupl = args.drop_hard_dupl
@@ -308,7 +575,12 @@ if __name__ == "__main__":
     overwrite_initial_text_data = args.overwrite_initial_text_data
 
 
-    df = read_csv_ignore_some_nulls(raw_data_path, compression='gzip')
+    metrics = PipelineMetrics.from_args(args, run_name="dedup_" + raw_data_path.split("/")[-1].split(".")[0])
+
+    with metrics.stage("load") as inc_counter:
+        df = read_csv_ignore_some_nulls(raw_data_path, compression='gzip')
+        inc_counter("pages", df.shape[0])
+        inc_counter("bytes_in", os.path.getsize(raw_data_path))
     if len(set(df.columns).difference(set(_EXPECTED_COLNAMES))) != 0 or len(set(_EXPECTED_COLNAMES).difference(set(df.columns))) != 0:
         raise ValueError(f"The data schema expected, consist of columns: {', '.join(df.columns.to_list())} doesn't match with expected column values of {', '.join(_EXPECTED_COLNAMES)}!")
 
@@ -327,86 +599,27 @@ if __name__ == "__main__":
 
     #hard duplicate drop (drop all duplicate values that has exact same text on expected unique colnames)
     if drop_hard_dupl:
-
-        for colname in _EXPECTED_COLNAMES:
-            logger.info(f"Checking data integrity on column {colname} on removing hard-duplicate(s)...")
-            dupl_text_df = df[df.duplicated(subset=colname,keep=False)]
-            shape_of_dupl_data = dupl_text_df.shape[0]
-
-            if shape_of_dupl_data > 0:
-                logger.info(f"Found {shape_of_dupl_data} data duplicated! Will be dropped")
-                df.drop_duplicates(subset=colname, keep=False, inplace=True)
-
-
-        #check id/idx of the cleansed data, whether it has duplicate
-        # (the duplication of id/idx should came from the very first extraction, not from the cleansing)
-
-        if df[df.duplicated(subset=id_colname,keep=False)].shape[0] > 0:
-            logger.info("Duplicated ID found! Re-assigning ID to the new ones based on `df.reset_index` method!")
-            df[id_colname] = df.reset_index().index
+        with metrics.stage("hard-dedup") as inc_counter:
+            inc_counter("pages", df.shape[0])
+            df = drop_hard_duplicates(df, _EXPECTED_COLNAMES, id_colname=id_colname, logger=logger, inc_counter=inc_counter)
 
     #soft duplicate drop (drop all except one duplicate values that has exact same text on expected unique colnames)
     #keep the data that has longest value of its raw form
     if drop_soft_dupl:
-
-        idx_to_keep = set(df.index.to_list())
         #clean from text & title only, url isn't needed for this process
         _EXPECTED_COLNAMES.remove("url")
-
-        for colname in _EXPECTED_COLNAMES:
-            #Construct Text Cleanser Fn for soft-duplicate cleansing
-            _PROCESSING_FN = _TEXT_PROCESSING_FN if colname == "text" else _TITLE_PROCESSING_FN
-            text_processing_fn = partial(_text_processing_wrapper, _fn=_PROCESSING_FN, mode=colname)
-            logger.info(f"Checking data integrity on column {colname} on removing soft-duplicate(s)...")
-            _df = df.copy(deep=True)
-
-            #Setting up DF cols as String so it can be text-processed
-            _df = _df[[colname]]
-            _df[colname] = _df[colname].astype("str")
-            logger.info(f"Cleansing the data based on {colname}")
-
-            #applying text processing
-            _df[colname+"_raw_len"] = _df[colname].apply(len)
-            _df[colname+"_cleansed"] = _df[colname].apply(lambda row_text: text_processing_fn(text=row_text))
-
-            #overwrite its text data if set as true
-            if overwrite_initial_title_data and colname == "title":
-                df[colname] = _df[colname+"_cleansed"]
-            elif overwrite_initial_text_data and colname == "text":
-                df[colname] = _df[colname+"_cleansed"]
-
-            #choose the data to keep by "ranking" it according to len of its raw text (greatest to keep)
-            logger.info(f"Ranking and grouping the data based on {colname}")
-            _df["rk"] = _df.groupby(colname+"_cleansed")[colname+"_raw_len"].rank(method="min", ascending=False)
-            shape_of_dupl_data = _df[_df["rk"]>1].shape[0]
-
-            if shape_of_dupl_data > 0:
-                logger.info(f"Found {shape_of_dupl_data} data duplicated! Will be dropped")
-                _idx_to_keep = _df[_df["rk"]==1].index.to_list()
-                if len(_idx_to_keep)+shape_of_dupl_data != df.shape[0]:
-                    raise AssertionError("Mismatch of data number!")
-                idx_to_keep = idx_to_keep.intersection(set(_idx_to_keep))
-            else:
-                logger.info(f"No soft-duplicate found in colname {colname}. Continuing")
-
-            del _df
-            gc.collect()
-
-        logger.info(f"The final data kept is {len(idx_to_keep)} from {df.shape[0]}")
-        df = df.loc[list(idx_to_keep),:]
+        with metrics.stage("soft-dedup") as inc_counter:
+            inc_counter("pages", df.shape[0])
+            df = drop_soft_duplicates(df, _EXPECTED_COLNAMES, _TEXT_PROCESSING_FN, _TITLE_PROCESSING_FN,
+                                      overwrite_initial_title_data=overwrite_initial_title_data,
+                                      overwrite_initial_text_data=overwrite_initial_text_data,
+                                      logger=logger, inc_counter=inc_counter)
 
     logger.info("Saving dataset cleansed form...")
-    #input path splitted by ("/") for the last entry should return filename
-    #whereas the filename splitted by (".") except the last value should return the filename w/o ".csv" extension
-
-    _override_suffix_identifier = ""
-    if overwrite_initial_title_data or overwrite_initial_text_data:
-        _override_suffix_identifier = "_overwritten"
-        if overwrite_initial_text_data:
-            _override_suffix_identifier = "_text"+_override_suffix_identifier
-        if overwrite_initial_title_data:
-            _override_suffix_identifier = "_title"+_override_suffix_identifier
+    _save_file_name = get_dedup_save_file_name(raw_data_path, overwrite_initial_title_data, overwrite_initial_text_data)
+    with metrics.stage("write") as inc_counter:
+        df.to_csv(f"{save_dir}/{_save_file_name}", index=False, compression='gzip')
+        inc_counter("pages", df.shape[0])
+        inc_counter("bytes_out", os.path.getsize(f"{save_dir}/{_save_file_name}"))
 
-    _save_file_name = ".".join(raw_data_path.split("/")[-1].split(".")[:-2]) + "_dedup_cleansed" + _override_suffix_identifier + ".csv.gz"
-    _save_file_name = _save_file_name.replace("_raw", "")
-    df.to_csv(f"{save_dir}/{_save_file_name}", index=False, compression='gzip')
+    metrics.export_if_requested(args, logger)
@@ -0,0 +1,284 @@
+'''
+Script on Computing the Delta between Two Dump Dates of a Deduplicated Wikipedia Data
+-------------------
+Both CSVs are streamed in chunks and hash-partitioned on `id` into local spool files, keeping only the `id`,
+a digest of `url/title/text` and (for the new data) the record itself. The partitions are then joined one by one,
+so only one partition of ids & digests is held in memory. The added, changed (with their new content) and
+removed articles are written into compact CSVs with a `manifest.json`, so a refresh of the published data (and
+its downstream sync) is proportional to the change instead of the corpus size.
+Usage example:
+    python diff_wiki_data.py --old-csv-path sea_wiki_dedup_data/wiki_id_20231101_dataset_dedup_cleansed.csv.gz \
+        --new-csv-path sea_wiki_dedup_data/wiki_id_20231201_dataset_dedup_cleansed.csv.gz
+'''
+
+import os
+import json
+import zlib
+import pickle
+import hashlib
+import logging
+import argparse
+import tempfile
+
+from dedup_raw_wiki_data import read_csv_ignore_some_nulls, write_csv_chunk, get_lang_and_date_from_file_name
+
+
+_EXPECTED_COLNAMES = ["id", "url", "title", "text"]
+_REMOVED_COLNAMES = ["id", "url", "title"]
+_DELTA_FILE_NAMES = {"added": "added.csv.gz", "changed": "changed.csv.gz", "removed": "removed.csv.gz"}
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def get_content_digest(record: list):
+    '''
+    Get 128-bit digest of `url/title/text` of a record (list of values ordered as `_EXPECTED_COLNAMES`)
+    '''
+    #null values are digested apart from the empty strings
+    _values = ["\x00" if val is None else str(val) for val in record[1:]]
+    return hashlib.blake2b("\x1f".join(_values).encode("utf-8", errors="surrogatepass"), digest_size=16).digest()
+
+
+def _get_partition(id_: str, num_partitions: int):
+    #python `hash` of str is salted per process, crc32 is stable
+    return zlib.crc32(id_.encode("utf-8")) % num_partitions
+
+
+def _iter_csv_records(csv_path: str, chunk_size: int):
+    for df in read_csv_ignore_some_nulls(csv_path, compression="gzip", chunksize=chunk_size, dtype={"id": str}):
+        df = df[_EXPECTED_COLNAMES].astype(object)
+        yield from df.where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def _iter_spooled_batches(spool_path: str):
+    if not os.path.exists(spool_path):
+        return
+    with open(spool_path, "rb") as f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                return
+
+
+def _partition_csv(csv_path: str, spool_dir: str, prefix: str, num_partitions: int, keep_record: bool,
+                   chunk_size: int):
+    '''
+    Spool the records of a CSV into `num_partitions` files by the hash of their ids
+
+    Returns
+    -------
+    number of rows of the CSV
+    '''
+    buffers, num_rows = [[] for _ in range(num_partitions)], 0
+    _flush_size = max(1, chunk_size // num_partitions)
+
+    def _flush(partition):
+        with open(os.path.join(spool_dir, f"{prefix}-{partition:05d}.pkl"), "ab") as f:
+            pickle.dump(buffers[partition], f, protocol=pickle.HIGHEST_PROTOCOL)
+        buffers[partition] = []
+
+    for record in _iter_csv_records(csv_path, chunk_size):
+        partition = _get_partition(record[0], num_partitions)
+        #the old data only needs the columns of the removed articles
+        buffers[partition].append((record[0], get_content_digest(record), record if keep_record else record[:3]))
+        num_rows += 1
+        if len(buffers[partition]) >= _flush_size:
+            _flush(partition)
+
+    for partition in range(num_partitions):
+        if len(buffers[partition]) > 0:
+            _flush(partition)
+    return num_rows
+
+
+def compute_delta(old_csv_path: str, new_csv_path: str, save_dir: str, num_partitions: int=64,
+                  chunk_size: int=100000, spool_dir: str=None, logger=None):
+    '''
+    Compute the added, changed & removed articles of a new deduplicated Wikipedia data against an old one,
+    joined on `id` and digest of `url/title/text`
+
+    Parameters
+    ----------
+    old_csv_path: path to CSV gzip-compressed Wikipedia data of the old dump date
+    new_csv_path: path to CSV gzip-compressed Wikipedia data of the new dump date
+    save_dir: dir to write the delta CSVs and `manifest.json` into
+    num_partitions: number of hash partitions, the memory is bounded by the ids & digests of one partition
+    chunk_size: number of rows read from the CSVs (and written into the delta CSVs) at once
+    spool_dir: dir of the temp spool files (system temp dir if None)
+    Returns
+    -------
+    dict of the manifest
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    os.makedirs(save_dir, exist_ok=True)
+
+    old_lang, old_date = get_lang_and_date_from_file_name(old_csv_path)
+    new_lang, new_date = get_lang_and_date_from_file_name(new_csv_path)
+    if old_lang != new_lang:
+        raise ValueError(f"The delta is only computed on the same language, received {old_lang} and {new_lang}!")
+
+    _paths = {name: os.path.join(save_dir, file_name) for name, file_name in _DELTA_FILE_NAMES.items()}
+    _colnames = {"added": _EXPECTED_COLNAMES, "changed": _EXPECTED_COLNAMES, "removed": _REMOVED_COLNAMES}
+    buffers, counts = {name: [] for name in _paths}, {name: 0 for name in list(_paths) + ["unchanged"]}
+
+    def _add_delta(name, record):
+        buffers[name].append(record)
+        if len(buffers[name]) >= chunk_size:
+            _flush(name)
+
+    def _flush(name):
+        write_csv_chunk(buffers[name], _paths[name], is_first_chunk=counts[name] == 0, colnames=_colnames[name])
+        counts[name] += len(buffers[name])
+        buffers[name] = []
+
+    with tempfile.TemporaryDirectory(dir=spool_dir) as _spool_dir:
+        logger.info(f"Partitioning {old_csv_path} into {num_partitions} partitions...")
+        old_num_rows = _partition_csv(old_csv_path, _spool_dir, "old", num_partitions, keep_record=False, chunk_size=chunk_size)
+        logger.info(f"Partitioning {new_csv_path} into {num_partitions} partitions...")
+        new_num_rows = _partition_csv(new_csv_path, _spool_dir, "new", num_partitions, keep_record=True, chunk_size=chunk_size)
+
+        logger.info("Joining the partitions...")
+        for partition in range(num_partitions):
+            old_digests = {id_: (digest, record) for id_, digest, record in
+                           _iter_spooled_batches(os.path.join(_spool_dir, f"old-{partition:05d}.pkl"))}
+            for id_, digest, record in _iter_spooled_batches(os.path.join(_spool_dir, f"new-{partition:05d}.pkl")):
+                _old = old_digests.pop(id_, None)
+                if _old is None:
+                    _add_delta("added", record)
+                elif _old[0] != digest:
+                    _add_delta("changed", record)
+                else:
+                    counts["unchanged"] += 1
+            for _, old_record in old_digests.values():
+                _add_delta("removed", old_record)
+
+    #every delta file is written, even the empty ones
+    for name in _paths:
+        if len(buffers[name]) > 0 or counts[name] == 0:
+            _flush(name)
+
+    manifest = {
+        "lang": new_lang,
+        "old_date": old_date,
+        "new_date": new_date,
+        "old_source_file": os.path.basename(old_csv_path),
+        "new_source_file": os.path.basename(new_csv_path),
+        "old_num_rows": old_num_rows,
+        "new_num_rows": new_num_rows,
+        "num_unchanged": counts["unchanged"],
+        "content_digest": "blake2b-128 of url, title & text",
+        "files": {name: {"file_name": _DELTA_FILE_NAMES[name], "num_rows": counts[name],
+                         "num_bytes": os.path.getsize(_paths[name])}
+                  for name in _paths},
+    }
+    with open(os.path.join(save_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def apply_delta(old_csv_path: str, delta_dir: str, save_path: str, chunk_size: int=100000, logger=None):
+    '''
+    Apply a delta from `compute_delta` on the old deduplicated Wikipedia data, giving the same rows as the new one
+    (the unchanged rows keep their old order, followed by the changed then the added rows)
+
+    Parameters
+    ----------
+    old_csv_path: path to CSV gzip-compressed Wikipedia data the delta was computed against
+    delta_dir: dir of the delta CSVs and `manifest.json`
+    save_path: path of the CSV gzip-compressed result
+    chunk_size: number of rows read from the CSVs at once
+    Returns
+    -------
+    number of rows written
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    with open(os.path.join(delta_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest["old_source_file"] != os.path.basename(old_csv_path):
+        logger.warning(f"The delta was computed against {manifest['old_source_file']}, not {os.path.basename(old_csv_path)}!")
+
+    _file_paths = {name: os.path.join(delta_dir, info["file_name"]) for name, info in manifest["files"].items()}
+    #only the ids of the delta are held in memory
+    ids_to_drop = set()
+    for name in ["changed", "removed"]:
+        for df in read_csv_ignore_some_nulls(_file_paths[name], compression="gzip", chunksize=chunk_size,
+                                             dtype={"id": str}, usecols=["id"]):
+            ids_to_drop.update(df["id"])
+
+    num_rows = 0
+    for path in [old_csv_path, _file_paths["changed"], _file_paths["added"]]:
+        for df in read_csv_ignore_some_nulls(path, compression="gzip", chunksize=chunk_size, dtype={"id": str}):
+            if path == old_csv_path:
+                df = df[~df["id"].isin(ids_to_drop)]
+            df[_EXPECTED_COLNAMES].to_csv(save_path, index=False, compression="gzip", mode="w" if num_rows == 0 else "a",
+                                         header=num_rows == 0)
+            num_rows += df.shape[0]
+    logger.info(f"{num_rows} rows are written into {save_path}")
+    return num_rows
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--old-csv-path", help="Relative location of deduplicated csv file of Wikipedia data of the old dump date")
+
+    parser.add_argument("--new-csv-path", help="Relative location of deduplicated csv file of Wikipedia data of the new dump date")
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved delta data
+                        to the `diff_wiki_data.py` script dir""",
+            default="./sea_wiki_delta_data")
+
+    parser.add_argument("--num-partitions", help="""Number of hash partitions on `id`,
+                        the memory used is bounded by the ids & digests of one partition""",
+            default=64, type=int)
+
+    parser.add_argument("--chunk-size", help="Number of rows read from the CSVs at once", default=100000, type=int)
+
+    #default: system temp dir
+    parser.add_argument("--spool-dir-path", help="""Dir path of the temp spool files of the partitions
+                        (needs about the size of the uncompressed new data)""",
+            default=None)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    lang, old_date = get_lang_and_date_from_file_name(args.old_csv_path)
+    _, new_date = get_lang_and_date_from_file_name(args.new_csv_path)
+    if lang is not None:
+        _delta_dir_name = f"wiki_{lang}_{new_date}_delta_from_{old_date}"
+    else:
+        _delta_dir_name = os.path.basename(args.new_csv_path).replace(".csv.gz", "") + "_delta"
+
+    manifest = compute_delta(args.old_csv_path, args.new_csv_path, os.path.join(args.save_dir_path, _delta_dir_name),
+                             num_partitions=args.num_partitions, chunk_size=args.chunk_size,
+                             spool_dir=args.spool_dir_path, logger=logger)
+    logger.info(f"Done computing the delta: {manifest['files']['added']['num_rows']} added, "
+                f"{manifest['files']['changed']['num_rows']} changed, {manifest['files']['removed']['num_rows']} removed "
+                f"and {manifest['num_unchanged']} unchanged articles")
@@ -0,0 +1,244 @@
+'''
+Script on Exporting the Deduplicated Wikipedia Data into Size-Balanced Parquet Shards
+-------------------
+Each language CSV is read twice in chunks: first to measure the byte size of every row, then to route
+the rows into contiguous shards of about equal size, each one written on a thread pool (pyarrow releases
+the GIL while encoding and compressing). Per-language `manifest.json` and a `dataset_info.json`
+summary of all languages are written along the shards so the downstream loaders can plan their reads.
+'''
+
+import os
+import json
+import math
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+
+from dedup_raw_wiki_data import read_csv_ignore_some_nulls, get_lang_and_date_from_file_name
+
+
+_EXPECTED_COLNAMES = ["id", "url", "title", "text"]
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def _read_csv_chunks(csv_path: str, chunk_size: int):
+    #every column is read as text, so a column isn't typed differently per chunk (e.g. year titles as int64)
+    return read_csv_ignore_some_nulls(csv_path, compression="gzip", chunksize=chunk_size, dtype=str)
+
+
+def get_row_nbytes(df: pd.DataFrame, colnames: list=_EXPECTED_COLNAMES):
+    '''
+    Get the UTF-8 byte size of each row, summed over the given colnames
+    '''
+    #the nulls (e.g. empty texts) are 0 bytes
+    return sum(df[colname].fillna("").astype(str).str.encode("utf-8").str.len().to_numpy(dtype=np.int64) for colname in colnames)
+
+
+def plan_shards(row_nbytes: np.ndarray, target_shard_nbytes: int):
+    '''
+    Assign every row into one of contiguous shards of about equal byte size
+
+    Parameters
+    ----------
+    row_nbytes: array of byte size of each row
+    target_shard_nbytes: target (uncompressed) byte size of each shard
+    Returns
+    -------
+    tuple of number of shards and array of shard index of each row
+    '''
+    total_nbytes = int(row_nbytes.sum())
+    num_shards = max(1, math.ceil(total_nbytes / target_shard_nbytes))
+    if total_nbytes == 0:
+        return num_shards, np.zeros(len(row_nbytes), dtype=np.int64)
+    #the shard of a row is determined by its starting byte offset
+    row_offsets = np.cumsum(row_nbytes) - row_nbytes
+    return num_shards, np.minimum(row_offsets * num_shards // total_nbytes, num_shards - 1)
+
+
+def _write_shard(df: pd.DataFrame, path: str, compression: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    #an explicit string schema, so every shard has the same schema (also the empty & all-null columns)
+    schema = pa.schema([(colname, pa.string()) for colname in df.columns])
+    table = pa.Table.from_pandas(df.reset_index(drop=True), schema=schema, preserve_index=False)
+    pq.write_table(table, path, compression=compression)
+    return {
+        "file_name": os.path.basename(path),
+        "num_rows": df.shape[0],
+        "num_bytes": os.path.getsize(path),
+        "uncompressed_num_bytes": int(get_row_nbytes(df).sum()),
+        "first_id": df["id"].iloc[0] if df.shape[0] > 0 else None,
+        "last_id": df["id"].iloc[-1] if df.shape[0] > 0 else None,
+    }
+
+
+def export_parquet_shards(csv_path: str, save_dir: str, shard_prefix: str, target_shard_nbytes: int,
+                          num_workers: int=4, chunk_size: int=100000, compression: str="snappy", logger=None):
+    '''
+    Export a CSV gzip-compressed Wikipedia data into size-balanced Parquet shards with its manifest
+
+    Parameters
+    ----------
+    csv_path: path to CSV gzip-compressed Wikipedia data
+    save_dir: dir to write the shards and `manifest.json` into
+    shard_prefix: file name prefix of the shards
+    target_shard_nbytes: target (uncompressed) byte size of each shard
+    num_workers: number of shards written concurrently (also bounds the shards held in memory)
+    chunk_size: number of rows read from the CSV at once
+    compression: Parquet compression codec
+    Returns
+    -------
+    dict of the manifest
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    os.makedirs(save_dir, exist_ok=True)
+
+    logger.info(f"Measuring row sizes of {csv_path}...")
+    row_nbytes = np.concatenate([get_row_nbytes(df) for df in _read_csv_chunks(csv_path, chunk_size)] or [np.array([], dtype=np.int64)])
+    num_shards, shard_of_rows = plan_shards(row_nbytes, target_shard_nbytes)
+    #last row index (exclusive) of every shard, to know when a shard has been fully read
+    shard_ends = np.searchsorted(shard_of_rows, np.arange(num_shards), side="right")
+    logger.info(f"Writing {len(row_nbytes)} rows into {num_shards} shard(s)...")
+
+    def _shard_path(shard_idx):
+        return os.path.join(save_dir, f"{shard_prefix}-{shard_idx:05d}-of-{num_shards:05d}.parquet")
+
+    shard_infos, pending_parts, futures = {}, {}, {}
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+
+        def _submit(shard_idx, df):
+            #wait for a free worker so at most `num_workers` shards are held in memory
+            while len(futures) >= num_workers:
+                _done, _ = wait(list(futures.keys()), return_when=FIRST_COMPLETED)
+                for future in _done:
+                    shard_infos[futures.pop(future)] = future.result()
+            futures[executor.submit(_write_shard, df, _shard_path(shard_idx), compression)] = shard_idx
+
+        row_offset = 0
+        for df in _read_csv_chunks(csv_path, chunk_size):
+            _chunk_shards = shard_of_rows[row_offset:row_offset+df.shape[0]]
+            for shard_idx in np.unique(_chunk_shards):
+                pending_parts.setdefault(shard_idx, []).append(df[_chunk_shards == shard_idx])
+            row_offset += df.shape[0]
+
+            for shard_idx in [idx for idx in pending_parts if shard_ends[idx] <= row_offset]:
+                _submit(shard_idx, pd.concat(pending_parts.pop(shard_idx)))
+
+        #the empty data still gets one (empty) shard
+        for shard_idx in range(num_shards):
+            if shard_idx not in shard_infos and shard_idx not in futures.values() and shard_idx not in pending_parts:
+                _submit(shard_idx, pd.DataFrame({colname: pd.Series(dtype="str") for colname in _EXPECTED_COLNAMES}))
+
+        for future, shard_idx in futures.items():
+            shard_infos[shard_idx] = future.result()
+
+    shards = [shard_infos[shard_idx] for shard_idx in range(num_shards)]
+    manifest = {
+        "source_file": os.path.basename(csv_path),
+        "num_shards": num_shards,
+        "num_rows": sum(shard["num_rows"] for shard in shards),
+        "num_bytes": sum(shard["num_bytes"] for shard in shards),
+        "uncompressed_num_bytes": sum(shard["uncompressed_num_bytes"] for shard in shards),
+        "compression": compression,
+        "shards": shards,
+    }
+    with open(os.path.join(save_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def build_dataset_info(manifests: dict):
+    '''
+    Build the dataset-info summary (following HF `dataset_info` format) with one split per language
+
+    Parameters
+    ----------
+    manifests: dict of split name to its manifest from `export_parquet_shards`
+    '''
+    return {
+        "features": {colname: {"dtype": "string", "_type": "Value"} for colname in _EXPECTED_COLNAMES},
+        "splits": {
+            split: {"name": split, "num_bytes": manifest["uncompressed_num_bytes"], "num_examples": manifest["num_rows"],
+                    "num_shards": manifest["num_shards"]}
+            for split, manifest in manifests.items()
+        },
+        "download_size": sum(manifest["num_bytes"] for manifest in manifests.values()),
+        "dataset_size": sum(manifest["uncompressed_num_bytes"] for manifest in manifests.values()),
+    }
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--csv-path", help="Relative location of deduplicated csv file(s) of Wikipedia data", nargs="+")
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved Parquet shards
+                        to the `export_parquet_shards.py` script dir""",
+            default="./sea_wiki_parquet_data")
+
+    parser.add_argument("--target-shard-size-mb", help="Target on-disk size (in MB) of each Parquet shard",
+            default=256, type=float)
+
+    parser.add_argument("--estimated-compression-ratio", help="""Estimated ratio of Parquet on-disk size
+                        to the raw text size, used to size the shards""",
+            default=0.4, type=float)
+
+    parser.add_argument("--compression", help="Parquet compression codec", default="snappy",
+            choices=["snappy", "zstd", "gzip", "none"])
+
+    parser.add_argument("--num-workers", help="Number of shards written concurrently", default=4, type=int)
+
+    parser.add_argument("--chunk-size", help="Number of rows read from the CSV at once", default=100000, type=int)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    target_shard_nbytes = int(args.target_shard_size_mb * 1e6 / args.estimated_compression_ratio)
+
+    manifests = {}
+    for csv_path in args.csv_path:
+        lang, date_ver = get_lang_and_date_from_file_name(csv_path)
+        #split naming follows the existing HF repo (one split per language)
+        split_name = lang if lang is not None else os.path.basename(csv_path).replace(".csv.gz", "")
+        _shard_prefix = f"wiki_{lang}_{date_ver}" if lang is not None else split_name
+
+        logger.info(f"Exporting {csv_path} into Parquet shards...")
+        manifests[split_name] = export_parquet_shards(
+            csv_path, os.path.join(args.save_dir_path, split_name), _shard_prefix, target_shard_nbytes,
+            num_workers=args.num_workers, chunk_size=args.chunk_size, compression=args.compression, logger=logger)
+        logger.info(f"Done exporting {manifests[split_name]['num_rows']} rows into {manifests[split_name]['num_shards']} shard(s)")
+
+    with open(os.path.join(args.save_dir_path, "dataset_info.json"), "w") as f:
+        json.dump(build_dataset_info(manifests), f, indent=2)
+    logger.info("Done Export Process")
@@ -0,0 +1,382 @@
+'''
+Script on Extracting and Deduplicating Wikipedia Data in One Streaming Run
+-------------------
+Fuses `extract_raw_wiki_data_batched.py`, `concat_batched_data.py` and `dedup_raw_wiki_data.py`.
+The pages extracted from every split are normalized on the fly and only their hashes & lengths are
+kept in memory (`StreamingDeduplicator`), while the records themselves are spooled into an uncompressed
+local temp file. Once the last split is extracted the rows to keep are resolved from the hashes and
+the spool is streamed into the final deduplicated CSV. Hard dedup drops every copy of a duplicated value,
+hence it can't decide on a row before seeing all of them, so the spool read is the only second pass.
+The raw extraction CSV is only written when `save-raw-data` is turned on (as debug output).
+'''
+
+import os
+import pickle
+import hashlib
+import logging
+import argparse
+import tempfile
+from array import array
+from itertools import chain
+
+from dedup_raw_wiki_data import (argparse_bool_check, add_text_processing_args, get_text_processing_fns,
+                                 get_non_alphanumeric_script, get_dedup_save_file_name, write_csv_chunk, _text_processing_wrapper)
+from pipeline_metrics import PipelineMetrics, add_metrics_args
+
+
+_EXPECTED_COLNAMES = ["id", "url", "title", "text"]
+_HARD_DUPL_COLNAMES = ["url", "title", "text"]
+_SOFT_DUPL_COLNAMES = ["title", "text"]
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def _hash_value(value):
+    #64-bit digest, the collision probability is negligible for the size of a Wikipedia
+    return int.from_bytes(hashlib.blake2b(str(value).encode("utf-8", errors="surrogatepass"), digest_size=8).digest(), "little")
+
+
+class StreamingDeduplicator:
+    '''
+    Streaming state of hard & soft dedup holding only the per-row hashes and raw lengths.
+    Gives the same kept rows as `drop_hard_duplicates` followed by `drop_soft_duplicates`
+
+    Parameters
+    ----------
+    text_processing_fn: normalizer fn of "text" column for soft dedup
+    title_processing_fn: normalizer fn of "title" column for soft dedup
+    drop_hard_dupl: whether to drop the hard duplicates of url, title & text
+    drop_soft_dupl: whether to drop the soft duplicates of title & text
+    '''
+    def __init__(self, text_processing_fn, title_processing_fn, drop_hard_dupl: bool=True, drop_soft_dupl: bool=True):
+        self.drop_hard_dupl = drop_hard_dupl
+        self.drop_soft_dupl = drop_soft_dupl
+        self._processing_fns = {"text": text_processing_fn, "title": title_processing_fn}
+        self._id_hashes = array("Q")
+        self._hard_hashes = {colname: array("Q") for colname in _HARD_DUPL_COLNAMES}
+        self._soft_hashes = {colname: array("Q") for colname in _SOFT_DUPL_COLNAMES}
+        self._raw_lens = {colname: array("q") for colname in _SOFT_DUPL_COLNAMES}
+
+    def __len__(self):
+        return len(self._id_hashes)
+
+    def normalize(self, colname: str, value):
+        return _text_processing_wrapper(str(value), _fn=self._processing_fns[colname], mode=colname)
+
+    def add(self, record: dict):
+        self._id_hashes.append(_hash_value(record["id"]))
+        if self.drop_hard_dupl:
+            for colname in _HARD_DUPL_COLNAMES:
+                self._hard_hashes[colname].append(_hash_value(record[colname]))
+        if self.drop_soft_dupl:
+            for colname in _SOFT_DUPL_COLNAMES:
+                self._soft_hashes[colname].append(_hash_value(self.normalize(colname, record[colname])))
+                self._raw_lens[colname].append(len(str(record[colname])))
+
+    def get_rows_to_keep(self, logger=None, inc_counter=None):
+        '''
+        Resolve the rows to keep after all of the records are added
+
+        Parameters
+        ----------
+        inc_counter: optional fn of `(name, value=1)`, counting the same names as the dedup fns
+        Returns
+        -------
+        tuple of boolean mask of rows to keep and array of re-assigned ids (None if the ids are kept)
+        '''
+        import numpy as np
+
+        logger = logger if logger is not None else logging.getLogger(__name__)
+        inc_counter = inc_counter if inc_counter is not None else (lambda name, value=1: None)
+
+        to_keep = np.ones(len(self), dtype=bool)
+        new_ids = None
+
+        if self.drop_hard_dupl:
+            #checked column by column on the rows surviving the previous columns, as `drop_hard_duplicates`
+            for colname in _HARD_DUPL_COLNAMES:
+                logger.info(f"Checking data integrity on column {colname} on removing hard-duplicate(s)...")
+                _kept_idx = np.flatnonzero(to_keep)
+                _, _inverse, _counts = np.unique(np.frombuffer(self._hard_hashes[colname], dtype=np.uint64)[_kept_idx],
+                                                 return_inverse=True, return_counts=True)
+                _dupl_idx = _kept_idx[_counts[_inverse] > 1]
+                if len(_dupl_idx) > 0:
+                    logger.info(f"Found {len(_dupl_idx)} data duplicated! Will be dropped")
+                    to_keep[_dupl_idx] = False
+                    inc_counter(f"dropped-hard-dupl-{colname}", len(_dupl_idx))
+
+            _id_hashes = np.frombuffer(self._id_hashes, dtype=np.uint64)[to_keep]
+            if len(np.unique(_id_hashes)) != len(_id_hashes):
+                logger.info("Duplicated ID found! Re-assigning ID to the new ones based on the row order!")
+                new_ids = np.cumsum(to_keep) - 1
+                inc_counter("reassigned-ids", int(to_keep.sum()))
+
+        if self.drop_soft_dupl:
+            _kept_idx = np.flatnonzero(to_keep)
+            _soft_to_keep = np.ones(len(_kept_idx), dtype=bool)
+            for colname in _SOFT_DUPL_COLNAMES:
+                logger.info(f"Checking data integrity on column {colname} on removing soft-duplicate(s)...")
+                _, _inverse = np.unique(np.frombuffer(self._soft_hashes[colname], dtype=np.uint64)[_kept_idx], return_inverse=True)
+                _raw_lens = np.frombuffer(self._raw_lens[colname], dtype=np.int64)[_kept_idx]
+                #keep every row having the longest raw value of its group (ties are all kept, as rank method "min")
+                _max_lens = np.zeros(_inverse.max()+1 if len(_inverse) > 0 else 0, dtype=np.int64)
+                np.maximum.at(_max_lens, _inverse, _raw_lens)
+                _col_to_keep = _raw_lens == _max_lens[_inverse]
+                shape_of_dupl_data = int((~_col_to_keep).sum())
+                if shape_of_dupl_data > 0:
+                    logger.info(f"Found {shape_of_dupl_data} data duplicated! Will be dropped")
+                    inc_counter(f"soft-dupl-{colname}", shape_of_dupl_data)
+                else:
+                    logger.info(f"No soft-duplicate found in colname {colname}. Continuing")
+                _soft_to_keep &= _col_to_keep
+
+            logger.info(f"The final data kept is {int(_soft_to_keep.sum())} from {len(_kept_idx)}")
+            inc_counter("dropped-soft-dupl", int((~_soft_to_keep).sum()))
+            to_keep[_kept_idx[~_soft_to_keep]] = False
+
+        return to_keep, new_ids
+
+
+def _spool_records(records: list, spool_file, raw_save_path: str=None, is_first_chunk: bool=False,
+                   colnames: list=_EXPECTED_COLNAMES):
+    pickle.dump(records, spool_file, protocol=pickle.HIGHEST_PROTOCOL)
+    if raw_save_path is not None:
+        write_csv_chunk(records, raw_save_path, is_first_chunk=is_first_chunk, colnames=colnames)
+
+
+def _iter_spooled_records(spool_path: str):
+    with open(spool_path, "rb") as f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                return
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--lang-id", help="Lang ID from Wikipedia Data to extract")
+
+    parser.add_argument("--date-ver", help="Date of Wikipedia Data (YYYYMMDD) generation to extract")
+
+    #default: all
+    parser.add_argument("--split-extr", help="""Split extraction config for choosing
+                        subsets of data to process. It follows python list slicing string args""",
+            default=":")
+
+    parser.add_argument("--force-rerun-split", help="""Flag to identify whether to check existing
+                        splits or forcing to re-create it""",
+            default=False, type=argparse_bool_check)
+
+    #default: dumps.wikimedia.org
+    parser.add_argument("--dump-source", help="""Base URL or local dir mirror (see `local_dump_mirror.py`)
+                        to resolve the Wikipedia dumps from""",
+            default=None)
+
+    #default: download by `datasets.DownloadManager` sequentially
+    parser.add_argument("--download-workers", help="""Number of concurrent connections to download the dump files with,
+                        resuming partial downloads and verifying the checksums (dumps.wikimedia.org allows only a few)""",
+            default=None, type=int)
+
+    parser.add_argument("--zstd-cache", help="""Flag whether to transcode the dump files & splits once into a zstd cache
+                        of seekable frames (needs `zstandard`), read instead of the bz2 files on the later runs""",
+            default=False, type=argparse_bool_check)
+
+    #default: `wikipedia_zstd_cache` in the datasets cache
+    parser.add_argument("--zstd-cache-dir", help="Dir of the zstd cache of the dump files & splits (only with `zstd-cache`)",
+            default=None)
+
+    parser.add_argument("--num-proc", help="""Number of worker processes to clean the pages of each split with,
+                        transported in shared-memory batches (cleaned in the main process if not given)""",
+            default=None, type=int)
+
+    parser.add_argument("--heavy-page-cost", help="""Estimated parse cost (in chars, with templates & tables weighted) from which
+                        a page is cleaned on the dedicated heavy-page workers with a time budget (only with `num-proc`)""",
+            default=500000, type=int)
+
+    #default: same as `num-proc`
+    parser.add_argument("--heavy-num-proc", help="""Number of dedicated worker processes to clean the heavy pages with
+                        (0 to clean them along the rest of the pages)""",
+            default=None, type=int)
+
+    parser.add_argument("--page-time-budget", help="""Time budget (in seconds) of cleaning a heavy page,
+                        the page is cleaned by the regex-based fallback cleaner once it's exceeded""",
+            default=60, type=float)
+
+    parser.add_argument("--with-metadata", help="""Flag whether to add the page metadata columns collected along the cleaning:
+                        JSON lists of `categories` and `headings` (title, level and char offset in `text`), `num_outlinks`
+                        and `num_media_links`""",
+            default=False, type=argparse_bool_check)
+
+    parser.add_argument("--drop-hard-dupl", help="""Flag whether to drop hard duplicates
+                        (exact values of data of relevant text fields, Titles & Desc)""",
+          default=True, type=argparse_bool_check)
+
+    parser.add_argument("--drop-soft-dupl", help="""Flag whether to drop soft duplicates
+                        (duplicates after cleansed and normalized relevant text fields, Titles & Desc)""",
+          default=True, type=argparse_bool_check)
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved Wikipedia CSV data
+                        to the `extract_dedup_wiki_data.py` script dir""",
+            default=os.path.dirname(os.path.abspath(__file__)))
+
+    parser.add_argument("--save-redirects", help="""Flag whether to also save the (redirect title, target title) pairs
+                        of the redirect pages skipped by the extraction, as title aliases (see `wiki_title_index.py`)""",
+            default=False, type=argparse_bool_check)
+
+    #default: `redirects` dir inside `save-dir-path`
+    parser.add_argument("--redirects-save-dir-path", help="""Relative dir path of saved redirect pairs (only with `save-redirects`),
+                        kept apart from the Wikipedia CSV data so the globs over `save-dir-path` only read the data""",
+            default=None)
+
+    parser.add_argument("--save-raw-data", help="""Flag whether to also save the raw extracted data
+                        (as `extract_raw_wiki_data.py` output) for debugging""",
+          default=False, type=argparse_bool_check)
+
+    #default: system temp dir
+    parser.add_argument("--spool-dir-path", help="""Dir path of the temp file spooling the extracted records
+                        until the dedup is resolved (needs about the uncompressed size of the data)""",
+            default=None)
+
+    parser.add_argument("--chunk-size", help="Number of rows spooled/written at once", default=10000, type=int)
+
+    add_text_processing_args(parser)
+
+    add_metrics_args(parser)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    lang_id = args.lang_id
+    date_ver = args.date_ver
+    save_dir = args.save_dir_path
+    redirects_save_dir = args.redirects_save_dir_path or os.path.join(save_dir, "redirects")
+    chunk_size = args.chunk_size
+
+    if (not args.drop_hard_dupl) and (not args.drop_soft_dupl):
+        raise AssertionError("The script won't run with both `drop-hard-dupl` and `drop-soft-dupl` args turned off!")
+
+    non_alphanumeric_script = get_non_alphanumeric_script(args.non_alphanumeric_script_choice, lang_id)
+    _TEXT_PROCESSING_FN, _TITLE_PROCESSING_FN = get_text_processing_fns(args, non_alphanumeric_script)
+    deduplicator = StreamingDeduplicator(_TEXT_PROCESSING_FN, _TITLE_PROCESSING_FN,
+                                         drop_hard_dupl=args.drop_hard_dupl, drop_soft_dupl=args.drop_soft_dupl)
+
+    #the raw file name is used to derive the dedup file name, same as the 3-step pipeline
+    _raw_save_path = f"{save_dir}/wiki_{lang_id}_{date_ver}_raw_dataset.csv.gz"
+    _save_path = f"{save_dir}/" + get_dedup_save_file_name(_raw_save_path, args.overwrite_initial_title_data,
+                                                           args.overwrite_initial_text_data)
+
+    from sea_loader_batched.wiki_loader import Wikipedia, _METADATA_COLNAMES
+    from shared_record_batches import iter_cleaned_examples
+
+    #the metadata columns follow the expected ones, so the positions of the expected ones in a record are kept
+    _colnames = _EXPECTED_COLNAMES + (_METADATA_COLNAMES if args.with_metadata else [])
+    _redirects_save_path = f"{redirects_save_dir}/wiki_{lang_id}_{date_ver}_redirects.csv.gz"
+    if args.save_redirects:
+        os.makedirs(redirects_save_dir, exist_ok=True)
+
+    metrics = PipelineMetrics.from_args(args, run_name=f"extract_dedup_{lang_id}_{date_ver}")
+
+    logger.info("Checking and creating the splits from Wikipedia Splitted Files...")
+    with metrics.stage("split", lang=lang_id):
+        wiki_builder = Wikipedia(language=lang_id, date=date_ver, subset_file_to_process=args.split_extr,
+                        force_rerun_split=args.force_rerun_split, dump_source=args.dump_source,
+                        download_workers=args.download_workers, zstd_cache=args.zstd_cache,
+                        zstd_cache_dir=args.zstd_cache_dir, with_metadata=args.with_metadata)
+        lang, _splitted_files_dict = wiki_builder.check_and_create_splits()
+    splitted_files = list(chain(*_splitted_files_dict.values()))
+
+    with tempfile.TemporaryDirectory(dir=args.spool_dir_path) as spool_dir:
+        spool_path = os.path.join(spool_dir, "records.pkl")
+
+        logger.info("Extracting and normalizing the Wikipedia dataset...")
+        with open(spool_path, "wb") as spool_file:
+            _records, _num_raw_chunks = [], 0
+
+            for idx, splitted_file in enumerate(splitted_files):
+                logger.info(f"Extracting split {idx+1} out of {len(splitted_files)}...")
+                redirects = []
+                _on_redirect = (lambda title, target_title: redirects.append((title, target_title))) if args.save_redirects else None
+                with metrics.stage("extract", lang=lang_id) as inc_counter:
+                    if args.num_proc is not None and args.num_proc > 1:
+                        _examples = iter_cleaned_examples(splitted_file, language=lang, num_proc=args.num_proc,
+                                                          heavy_page_cost=args.heavy_page_cost, heavy_num_proc=args.heavy_num_proc,
+                                                          page_time_budget=args.page_time_budget, zstd_cache_dir=wiki_builder.zstd_cache_dir,
+                                                          with_metadata=args.with_metadata, on_redirect=_on_redirect,
+                                                          inc_counter=inc_counter, logger=logger)
+                    else:
+                        _examples = wiki_builder.generate_examples_from_split(splitted_file, language=lang, inc_counter=inc_counter,
+                                                                              on_redirect=_on_redirect)
+                    for example in _examples:
+                        deduplicator.add(example)
+                        _records.append([example[colname] for colname in _colnames])
+                        if len(_records) >= chunk_size:
+                            _spool_records(_records, spool_file, _raw_save_path if args.save_raw_data else None, _num_raw_chunks == 0,
+                                           colnames=_colnames)
+                            _records, _num_raw_chunks = [], _num_raw_chunks + 1
+                        inc_counter("pages")
+                    inc_counter("bytes_in", os.path.getsize(splitted_file))
+                    if args.save_redirects:
+                        write_csv_chunk(redirects, _redirects_save_path, is_first_chunk=idx == 0, colnames=["title", "target_title"])
+                        inc_counter("redirects", len(redirects))
+            if len(_records) > 0 or _num_raw_chunks == 0:
+                _spool_records(_records, spool_file, _raw_save_path if args.save_raw_data else None, _num_raw_chunks == 0,
+                               colnames=_colnames)
+        logger.info(f"#Data collected: {len(deduplicator)}")
+
+        with metrics.stage("dedup", lang=lang_id) as inc_counter:
+            inc_counter("pages", len(deduplicator))
+            to_keep, new_ids = deduplicator.get_rows_to_keep(logger=logger, inc_counter=inc_counter)
+
+        logger.info("Saving dataset cleansed form...")
+        with metrics.stage("write", lang=lang_id) as inc_counter:
+            _chunk, _num_chunks = [], 0
+            for row_idx, record in enumerate(_iter_spooled_records(spool_path)):
+                if not to_keep[row_idx]:
+                    continue
+                if new_ids is not None:
+                    record[0] = int(new_ids[row_idx])
+                if args.drop_soft_dupl and args.overwrite_initial_title_data:
+                    record[2] = deduplicator.normalize("title", record[2])
+                if args.drop_soft_dupl and args.overwrite_initial_text_data:
+                    record[3] = deduplicator.normalize("text", record[3])
+                _chunk.append(record)
+                if len(_chunk) >= chunk_size:
+                    write_csv_chunk(_chunk, _save_path, is_first_chunk=_num_chunks == 0, colnames=_colnames)
+                    _num_chunks += 1
+                    inc_counter("pages", len(_chunk))
+                    _chunk = []
+            if len(_chunk) > 0 or _num_chunks == 0:
+                write_csv_chunk(_chunk, _save_path, is_first_chunk=_num_chunks == 0, colnames=_colnames)
+                inc_counter("pages", len(_chunk))
+            inc_counter("bytes_out", os.path.getsize(_save_path))
+        logger.info(f"The deduplicated data is saved in {_save_path}")
+
+    metrics.export_if_requested(args, logger)
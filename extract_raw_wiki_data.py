@@ -10,8 +10,7 @@ import os, gc
 import logging
 import argparse
 
-import pandas as pd
-from datasets import load_dataset
+from pipeline_metrics import PipelineMetrics, add_metrics_args
 
 
 def set_logger():
@@ -50,8 +49,24 @@ if __name__ == "__main__":
                         to the `extract_raw_wiki_data.py` script dir""",
             default=os.path.dirname(os.path.abspath(__file__)))
 
+    #default: extract all of the data
+    parser.add_argument("--sample", help="""Number of articles to extract as a preview sample, taken from randomly picked
+                        multistream streams so only those streams are decompressed""",
+            default=None, type=int)
+
+    parser.add_argument("--sample-fraction", help="""Fraction of the multistream streams to extract all of the articles from
+                        as a preview sample (ignored if `sample` is given)""",
+            default=None, type=float)
+
+    parser.add_argument("--sample-seed", help="Seed of the stream picking of the preview sample", default=0, type=int)
+
+    add_metrics_args(parser)
+
     args = parser.parse_args()
 
+    #heavy imports are deferred after the args parsing, so `--help` and invalid args return instantly
+    import pandas as pd
+    from datasets import load_dataset
 
     dset_name = "wikipedia"
 
@@ -62,12 +77,35 @@ if __name__ == "__main__":
     date_ver = args.date_ver
     save_dir = args.save_dir_path
 
-    logger.info("Loading the dataset from Wikipedia...")
-    df = load_dataset(dset_name, language=lang_id, date=date_ver, beam_runner='DirectRunner', split="train").to_pandas()
+    metrics = PipelineMetrics.from_args(args, run_name=f"extract_{lang_id}_{date_ver}")
+
+    if args.sample is not None or args.sample_fraction is not None:
+        #sampling reads the multistream dump directly, hence done by the batched loader
+        from sea_loader_batched.wiki_loader import Wikipedia
+
+        logger.info("Extracting a preview sample of the dataset from Wikipedia...")
+        with metrics.stage("extract", lang=lang_id) as inc_counter:
+            wiki_builder = Wikipedia(language=lang_id, date=date_ver)
+            df = pd.DataFrame(list(wiki_builder.generate_sample_examples(sample=args.sample, sample_fraction=args.sample_fraction,
+                                                                         seed=args.sample_seed, inc_counter=inc_counter)),
+                              columns=["id", "url", "title", "text"])
+            inc_counter("pages", df.shape[0])
+        _save_path = f"{save_dir}/wiki_{lang_id}_{date_ver}_raw_dataset_sample.csv.gz"
+    else:
+        logger.info("Loading the dataset from Wikipedia...")
+        with metrics.stage("extract", lang=lang_id) as inc_counter:
+            df = load_dataset(dset_name, language=lang_id, date=date_ver, beam_runner='DirectRunner', split="train").to_pandas()
+            inc_counter("pages", df.shape[0])
+        _save_path = f"{save_dir}/wiki_{lang_id}_{date_ver}_raw_dataset.csv.gz"
     logger.info("Loading done!")
     logger.info(f"#Data collected: {df.shape[0]}")
     logger.info("Saving dataset raw form...")
-    df.to_csv(f"{save_dir}/wiki_{lang_id}_{date_ver}_raw_dataset.csv.gz", index=False, compression='gzip')
+    with metrics.stage("write", lang=lang_id) as inc_counter:
+        df.to_csv(_save_path, index=False, compression='gzip')
+        inc_counter("pages", df.shape[0])
+        inc_counter("bytes_out", os.path.getsize(_save_path))
 
     del df
     gc.collect()
+
+    metrics.export_if_requested(args, logger)
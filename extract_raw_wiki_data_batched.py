@@ -12,10 +12,8 @@ import argparse
 
 from itertools import chain
 
-import pandas as pd
-from datasets import load_dataset
-
-from sea_loader_batched.wiki_loader import Wikipedia
+from dedup_raw_wiki_data import argparse_bool_check
+from pipeline_metrics import PipelineMetrics, add_metrics_args
 
 
 def set_logger():
@@ -60,14 +58,80 @@ if __name__ == "__main__":
                         splits or forcing to re-create it""",
             default=False)
 
+    #default: dumps.wikimedia.org
+    parser.add_argument("--dump-source", help="""Base URL or local dir mirror (see `local_dump_mirror.py`)
+                        to resolve the Wikipedia dumps from""",
+            default=None)
+
+    #default: download by `datasets.DownloadManager` sequentially
+    parser.add_argument("--download-workers", help="""Number of concurrent connections to download the dump files with,
+                        resuming partial downloads and verifying the checksums (dumps.wikimedia.org allows only a few)""",
+            default=None, type=int)
+
+    parser.add_argument("--zstd-cache", help="""Flag whether to transcode the dump files & splits once into a zstd cache
+                        of seekable frames (needs `zstandard`), read instead of the bz2 files on the later runs""",
+            default=False, type=argparse_bool_check)
+
+    #default: `wikipedia_zstd_cache` in the datasets cache
+    parser.add_argument("--zstd-cache-dir", help="Dir of the zstd cache of the dump files & splits (only with `zstd-cache`)",
+            default=None)
+
+    parser.add_argument("--with-metadata", help="""Flag whether to add the page metadata columns collected along the cleaning:
+                        JSON lists of `categories` and `headings` (title, level and char offset in `text`), `num_outlinks`
+                        and `num_media_links`""",
+            default=False, type=argparse_bool_check)
+
+    parser.add_argument("--save-redirects", help="""Flag whether to also save the (redirect title, target title) pairs
+                        of the redirect pages skipped by the extraction, as title aliases (see `wiki_title_index.py`)""",
+            default=False, type=argparse_bool_check)
+
+    #default: `redirects` dir inside `save-dir-path`
+    parser.add_argument("--redirects-save-dir-path", help="""Relative dir path of saved redirect pairs (only with `save-redirects`),
+                        kept apart from the Wikipedia CSV data so the globs over `save-dir-path` only read the data""",
+            default=None)
+
     parser.add_argument("--save-dir-path", help="""Relative dir path of saved Wikipedia CSV data
                         to the `extract_raw_wiki_data.py` script dir""",
             default=os.path.dirname(os.path.abspath(__file__)))
 
+    parser.add_argument("--num-proc", help="""Number of worker processes to clean the pages of each split with,
+                        transported in shared-memory batches (cleaned in the main process if not given)""",
+            default=None, type=int)
+
+    parser.add_argument("--heavy-page-cost", help="""Estimated parse cost (in chars, with templates & tables weighted) from which
+                        a page is cleaned on the dedicated heavy-page workers with a time budget (only with `num-proc`)""",
+            default=500000, type=int)
+
+    #default: same as `num-proc`
+    parser.add_argument("--heavy-num-proc", help="""Number of dedicated worker processes to clean the heavy pages with
+                        (0 to clean them along the rest of the pages)""",
+            default=None, type=int)
+
+    parser.add_argument("--page-time-budget", help="""Time budget (in seconds) of cleaning a heavy page,
+                        the page is cleaned by the regex-based fallback cleaner once it's exceeded""",
+            default=60, type=float)
+
+    #default: extract all of the data
+    parser.add_argument("--sample", help="""Number of articles to extract as a preview sample, taken from randomly picked
+                        multistream streams so only those streams are decompressed (the splits aren't created)""",
+            default=None, type=int)
+
+    parser.add_argument("--sample-fraction", help="""Fraction of the multistream streams to extract all of the articles from
+                        as a preview sample (ignored if `sample` is given)""",
+            default=None, type=float)
+
+    parser.add_argument("--sample-seed", help="Seed of the stream picking of the preview sample", default=0, type=int)
+
+    add_metrics_args(parser)
+
     args = parser.parse_args()
 
+    #heavy imports are deferred after the args parsing, so `--help` and invalid args return instantly
+    import pandas as pd
+    from sea_loader_batched.wiki_loader import Wikipedia, _METADATA_COLNAMES
+    from shared_record_batches import iter_cleaned_examples
 
-    dset_name = "sea_loader_batched/wiki_loader.py"
+    _EXPECTED_COLNAMES = ["id", "url", "title", "text"] + (_METADATA_COLNAMES if args.with_metadata else [])
 
     logger = set_logger()
     logger.info("Parsing arguments...")
@@ -76,24 +140,76 @@ if __name__ == "__main__":
     date_ver = args.date_ver
     generated_split_extraction = args.split_extr
     force_rerun_split_generation = args.force_rerun_split
+    dump_source = args.dump_source
+    download_workers = args.download_workers
     save_dir = args.save_dir_path
-
-    logger.info("Checking and creating the splits from Wikipedia Splitted Files...")
-    lang, _splitted_files_dict = Wikipedia(language=lang_id, date=date_ver, subset_file_to_process=generated_split_extraction,
-                    force_rerun_split=force_rerun_split_generation).check_and_create_splits()
-    splitted_files = list(chain(*_splitted_files_dict.values()))
-
-    logger.info("Loading the Wikipedia dataset in splitted fashion...")
-
-    _total_split_data = len(splitted_files)
-    for idx in range(len(splitted_files)):
-        logger.info(f"Loading dataset on split {idx+1} out of {_total_split_data}...")
-        df = load_dataset(dset_name, language=lang_id, date=date_ver, beam_runner='DirectRunner',
-                            split="train", subset_file_to_process=idx).to_pandas()
-        logger.info("Loading done!")
+    redirects_save_dir = args.redirects_save_dir_path or os.path.join(save_dir, "redirects")
+    if args.save_redirects:
+        os.makedirs(redirects_save_dir, exist_ok=True)
+
+    metrics = PipelineMetrics.from_args(args, run_name=f"extract_batched_{lang_id}_{date_ver}")
+
+    wiki_builder = Wikipedia(language=lang_id, date=date_ver, subset_file_to_process=generated_split_extraction,
+                    force_rerun_split=force_rerun_split_generation, dump_source=dump_source,
+                    download_workers=download_workers, zstd_cache=args.zstd_cache,
+                    zstd_cache_dir=args.zstd_cache_dir, with_metadata=args.with_metadata)
+
+    if args.sample is not None or args.sample_fraction is not None:
+        logger.info("Extracting a preview sample of the Wikipedia dataset...")
+        with metrics.stage("extract", lang=lang_id) as inc_counter:
+            df = pd.DataFrame(list(wiki_builder.generate_sample_examples(sample=args.sample, sample_fraction=args.sample_fraction,
+                                                                         seed=args.sample_seed, inc_counter=inc_counter)),
+                              columns=_EXPECTED_COLNAMES)
+            inc_counter("pages", df.shape[0])
         logger.info(f"#Data collected: {df.shape[0]}")
-        logger.info("Saving dataset raw form...")
-        df.to_csv(f"{save_dir}/wiki_{lang_id}_{date_ver}_raw_dataset_splitted_idx_{idx+1}.csv.gz", index=False, compression="gzip")
-
-        del df
-        gc.collect()
+        _save_path = f"{save_dir}/wiki_{lang_id}_{date_ver}_raw_dataset_sample.csv.gz"
+        with metrics.stage("write", lang=lang_id) as inc_counter:
+            df.to_csv(_save_path, index=False, compression="gzip")
+            inc_counter("pages", df.shape[0])
+            inc_counter("bytes_out", os.path.getsize(_save_path))
+    else:
+        logger.info("Checking and creating the splits from Wikipedia Splitted Files...")
+        with metrics.stage("split", lang=lang_id):
+            lang, _splitted_files_dict = wiki_builder.check_and_create_splits()
+        splitted_files = list(chain(*_splitted_files_dict.values()))
+
+        logger.info("Loading the Wikipedia dataset in splitted fashion...")
+
+        _total_split_data = len(splitted_files)
+        for idx, splitted_file in enumerate(splitted_files):
+            logger.info(f"Loading dataset on split {idx+1} out of {_total_split_data}...")
+            redirects = []
+            _on_redirect = (lambda title, target_title: redirects.append((title, target_title))) if args.save_redirects else None
+            with metrics.stage("extract", lang=lang_id) as inc_counter:
+                if args.num_proc is not None and args.num_proc > 1:
+                    _examples = iter_cleaned_examples(splitted_file, language=lang, num_proc=args.num_proc,
+                                                      heavy_page_cost=args.heavy_page_cost, heavy_num_proc=args.heavy_num_proc,
+                                                      page_time_budget=args.page_time_budget, zstd_cache_dir=wiki_builder.zstd_cache_dir,
+                                                      with_metadata=args.with_metadata, on_redirect=_on_redirect,
+                                                      inc_counter=inc_counter, logger=logger)
+                else:
+                    _examples = wiki_builder.generate_examples_from_split(splitted_file, language=lang, inc_counter=inc_counter,
+                                                                          on_redirect=_on_redirect)
+                df = pd.DataFrame(list(_examples), columns=_EXPECTED_COLNAMES)
+                #sorted by numeric id, so `concat_batched_data.py` can merge the splits deterministically
+                df = df.sort_values("id", key=lambda ids: ids.astype("int64"), kind="stable", ignore_index=True)
+                inc_counter("pages", df.shape[0])
+                inc_counter("bytes_in", os.path.getsize(splitted_file))
+            logger.info("Loading done!")
+            logger.info(f"#Data collected: {df.shape[0]}")
+            logger.info("Saving dataset raw form...")
+            _save_path = f"{save_dir}/wiki_{lang_id}_{date_ver}_raw_dataset_splitted_idx_{idx+1}.csv.gz"
+            with metrics.stage("write", lang=lang_id) as inc_counter:
+                df.to_csv(_save_path, index=False, compression="gzip")
+                inc_counter("pages", df.shape[0])
+                inc_counter("bytes_out", os.path.getsize(_save_path))
+                if args.save_redirects:
+                    _redirects_save_path = f"{redirects_save_dir}/wiki_{lang_id}_{date_ver}_redirects_splitted_idx_{idx+1}.csv.gz"
+                    pd.DataFrame(redirects, columns=["title", "target_title"]).to_csv(_redirects_save_path, index=False, compression="gzip")
+                    inc_counter("redirects", len(redirects))
+                    logger.info(f"#Redirects collected: {len(redirects)}")
+
+            del df, redirects
+            gc.collect()
+
+    metrics.export_if_requested(args, logger)
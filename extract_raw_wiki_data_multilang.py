@@ -0,0 +1,252 @@
+'''
+Script on Scheduling `extract_raw_wiki_data.py` runs of multiple languages concurrently
+-------------------
+The dump sizes are read from each language `dumpstatus.json`, then the languages are packed
+into N workers from the biggest one (so the small languages fill the idle workers at the end)
+while keeping the estimated memory of running extractions under the given budget.
+All of the workers share one HF datasets cache so the downloaded files are reused.
+'''
+
+import os, sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+
+from dedup_raw_wiki_data import argparse_bool_check
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def get_total_memory_bytes():
+    '''
+    Get the total physical memory of the machine (POSIX only), returns None if it can't be read
+    '''
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def get_dump_sizes(lang_list: list, date_ver: str, cache_dir: str, dump_source: str=None):
+    '''
+    Read the compressed multistream XML size of every language from its `dumpstatus.json`
+
+    Parameters
+    ----------
+    lang_list: list of Wikipedia lang ids
+    date_ver: date of Wikipedia dump (YYYYMMDD)
+    cache_dir: HF datasets cache dir shared with the extraction workers
+    dump_source: base URL or local dir mirror of the dumps (dumps.wikimedia.org if None)
+    Returns
+    -------
+    dict of lang id to its dump size in bytes
+    '''
+    import datasets
+    from sea_loader_batched.wiki_loader import get_multistream_dump_info, get_multistream_xml_size
+
+    dl_manager = datasets.DownloadManager(
+        download_config=datasets.DownloadConfig(cache_dir=os.path.join(cache_dir, "downloads")))
+
+    dump_sizes = {}
+    for lang in lang_list:
+        _, multistream_dump_info = get_multistream_dump_info(lang, date_ver, dl_manager, dump_source=dump_source)
+        dump_sizes[lang] = get_multistream_xml_size(multistream_dump_info)
+    return dump_sizes
+
+
+def schedule_extractions(dump_sizes: dict, num_workers: int, memory_budget: float, memory_factor: float,
+                         build_cmd_fn, env: dict=None, log_dir: str=None, poll_interval: float=1.0, logger=None):
+    '''
+    Run the extraction of each language as a subprocess, biggest dump first, limited by
+    the number of workers and the estimated memory budget of the running extractions
+
+    Parameters
+    ----------
+    dump_sizes: dict of lang id to its dump size in bytes
+    num_workers: max number of concurrently running extractions
+    memory_budget: max sum of estimated memory (in bytes) of running extractions, None for unlimited
+    memory_factor: multiplier of dump size to estimate the peak memory of its extraction
+    build_cmd_fn: fn receiving lang id and returning the command list to be executed
+    env: environment variables of the subprocesses
+    log_dir: dir to write stdout/stderr of each extraction as `{lang}.log` (inherited if None)
+    poll_interval: seconds between checking the running subprocesses
+    Returns
+    -------
+    list of dict containing the execution report of each language
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    pending = sorted(dump_sizes.keys(), key=lambda lang: dump_sizes[lang], reverse=True)
+    running, reports = {}, []
+
+    def _est_memory(lang):
+        return dump_sizes[lang] * memory_factor
+
+    def _pick_next():
+        # the biggest pending language that fits the remaining memory budget,
+        # always allow one job to run even if it's over the budget alone
+        if memory_budget is None or len(running) == 0:
+            return pending[0]
+        _used_memory = sum(_est_memory(lang) for lang in running)
+        for lang in pending:
+            if _used_memory + _est_memory(lang) <= memory_budget:
+                return lang
+        return None
+
+    while pending or running:
+        while pending and len(running) < num_workers:
+            lang = _pick_next()
+            if lang is None:
+                break
+            pending.remove(lang)
+            _log_file = open(os.path.join(log_dir, f"{lang}.log"), "w") if log_dir is not None else None
+            logger.info(f"Starting extraction of {lang} (dump size of {dump_sizes[lang]/1e6:.1f}MB), {len(pending)} language(s) pending")
+            _proc = subprocess.Popen(build_cmd_fn(lang), env=env, stdout=_log_file, stderr=subprocess.STDOUT if _log_file else None)
+            running[lang] = (_proc, time.time(), _log_file)
+
+        time.sleep(poll_interval)
+
+        for lang in list(running.keys()):
+            _proc, _start_time, _log_file = running[lang]
+            if _proc.poll() is None:
+                continue
+            _elapsed = time.time() - _start_time
+            if _log_file is not None:
+                _log_file.close()
+            del running[lang]
+
+            if _proc.returncode != 0:
+                logger.error(f"Extraction of {lang} failed with return code {_proc.returncode}")
+            else:
+                logger.info(f"Done extraction of {lang} in {_elapsed:.1f}s")
+
+            reports.append({
+                "lang": lang,
+                "dump_size_bytes": dump_sizes[lang],
+                "elapsed_seconds": round(_elapsed, 3),
+                "throughput_mb_per_sec": round(dump_sizes[lang] / 1e6 / _elapsed, 3) if _elapsed > 0 else None,
+                "return_code": _proc.returncode,
+            })
+
+    return reports
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--lang-list", help="Lang IDs from Wikipedia Data to extract (space-separated)", nargs="+")
+
+    parser.add_argument("--date-ver", help="Date of Wikipedia Data (YYYYMMDD) generation to extract")
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved Wikipedia CSV data
+                        to the `extract_raw_wiki_data_multilang.py` script dir""",
+            default=os.path.dirname(os.path.abspath(__file__)))
+
+    parser.add_argument("--num-workers", help="Number of languages to be extracted concurrently",
+            default=os.cpu_count(), type=int)
+
+    #default: 80% of physical memory
+    parser.add_argument("--memory-budget-gb", help="""Max total estimated memory (in GB) of the running extractions.
+                        Defaults to 80%% of the physical memory""",
+            default=None, type=float)
+
+    parser.add_argument("--memory-factor", help="""Multiplier of the compressed dump size
+                        to estimate the peak memory of its extraction""",
+            default=4.0, type=float)
+
+    parser.add_argument("--cache-dir", help="HF datasets cache dir shared by all extraction workers",
+            default=os.path.join(os.path.expanduser("~"), ".cache", "huggingface", "datasets"))
+
+    parser.add_argument("--use-batched-extractor", help="""Flag whether to run `extract_raw_wiki_data_batched.py`
+                        instead of `extract_raw_wiki_data.py` for each language""",
+            default=False, type=argparse_bool_check)
+
+    #default: dumps.wikimedia.org
+    parser.add_argument("--dump-source", help="""Base URL or local dir mirror (see `local_dump_mirror.py`)
+                        to resolve the Wikipedia dumps from, only supported by the batched extractor""",
+            default=None)
+
+    parser.add_argument("--report-path", help="Path of JSON report of per-language timing and throughput",
+            default="extraction_report.json")
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    lang_list = args.lang_list
+    date_ver = args.date_ver
+    save_dir = args.save_dir_path
+    cache_dir = args.cache_dir
+    dump_source = args.dump_source
+
+    if dump_source is not None and not args.use_batched_extractor:
+        raise ValueError("The arg `dump-source` is only supported with `use-batched-extractor` turned on!")
+
+    if args.memory_budget_gb is not None:
+        memory_budget = args.memory_budget_gb * 1e9
+    else:
+        _total_memory = get_total_memory_bytes()
+        memory_budget = 0.8 * _total_memory if _total_memory is not None else None
+
+    logger.info(f"Reading dump sizes of {len(lang_list)} language(s)...")
+    dump_sizes = get_dump_sizes(lang_list, date_ver, cache_dir, dump_source=dump_source)
+
+    _script_dir = os.path.dirname(os.path.abspath(__file__))
+    _extractor_script = "extract_raw_wiki_data_batched.py" if args.use_batched_extractor else "extract_raw_wiki_data.py"
+
+    def _build_cmd(lang):
+        _lang_save_dir = save_dir
+        if args.use_batched_extractor:
+            #batched extractor writes multiple files per language, keep it on its own dir
+            _lang_save_dir = os.path.join(save_dir, f"wiki_{lang}_{date_ver}_batched")
+            os.makedirs(_lang_save_dir, exist_ok=True)
+        _cmd = [sys.executable, os.path.join(_script_dir, _extractor_script),
+                "--lang-id", lang, "--date-ver", date_ver, "--save-dir-path", _lang_save_dir]
+        if dump_source is not None:
+            _cmd.extend(["--dump-source", dump_source])
+        return _cmd
+
+    _log_dir = os.path.join(save_dir, "logs")
+    os.makedirs(_log_dir, exist_ok=True)
+
+    _start_time = time.time()
+    reports = schedule_extractions(
+        dump_sizes, num_workers=args.num_workers, memory_budget=memory_budget, memory_factor=args.memory_factor,
+        build_cmd_fn=_build_cmd, env={**os.environ, "HF_DATASETS_CACHE": cache_dir}, log_dir=_log_dir, logger=logger)
+    _total_elapsed = time.time() - _start_time
+
+    logger.info("Per-language extraction report:")
+    for report in sorted(reports, key=lambda val: val["dump_size_bytes"], reverse=True):
+        logger.info(f"{report['lang']:>8} | {report['dump_size_bytes']/1e6:10.1f}MB | {report['elapsed_seconds']:10.1f}s | "
+                    f"{report['throughput_mb_per_sec']}MB/s | return code {report['return_code']}")
+    logger.info(f"Total elapsed time: {_total_elapsed:.1f}s")
+
+    with open(args.report_path, "w") as f:
+        json.dump({"date_ver": date_ver, "num_workers": args.num_workers, "total_elapsed_seconds": round(_total_elapsed, 3),
+                   "languages": reports}, f, indent=2)
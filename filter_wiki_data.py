@@ -0,0 +1,299 @@
+'''
+Script on Filtering Low-Quality Articles of the Deduplicated Wikipedia Data by their Quality Signals
+-------------------
+Stub & boilerplate articles survive the dedup: very short texts, mostly digits or table residue, or texts in
+another script than the wiki's. The quality signals of every article are computed in batch over one UTF-32
+NumPy buffer of the concatenated texts (with a char-class lookup table per script), and the articles failing
+any of the (per-language configurable) thresholds are dropped, counted per threshold.
+Signals:
+    length: number of chars of the text
+    alphabetic_ratio: ratio of letters (incl. combining marks) to the non-whitespace chars
+    script_ratio: ratio of the letters of the wiki's script to all letters
+    line_repetition_ratio: ratio of the non-empty lines repeating an earlier line of the text
+    mean_word_length: mean number of non-whitespace chars per whitespace-separated word
+'''
+
+import os
+import json
+import logging
+import argparse
+import functools
+import unicodedata
+
+import numpy as np
+
+from dedup_raw_wiki_data import (argparse_bool_check, read_csv_ignore_some_nulls, write_csv_chunk, get_lang_and_date_from_file_name,
+                                 _NON_ALPHANUMERIC_SCRIPT_RANGES, _LANG_DEFAULT_NON_ALPHANUMERIC_SCRIPT)
+from pipeline_metrics import PipelineMetrics, add_metrics_args
+
+
+_EXPECTED_COLNAMES = ["id", "url", "title", "text"]
+_SIGNAL_NAMES = ["length", "alphabetic_ratio", "script_ratio", "line_repetition_ratio", "mean_word_length"]
+
+#Latin letters with the diacritics used by the Latin-script SEA languages (e.g. Vietnamese)
+_LATIN_SCRIPT_RANGES = [(0x0041, 0x005A), (0x0061, 0x007A), (0x00C0, 0x024F), (0x0300, 0x036F), (0x1E00, 0x1EFF)]
+
+#threshold name to (signal name, whether it's a lower bound), a threshold of None is disabled
+_THRESHOLD_CHECKS = {
+    "min_length": ("length", True),
+    "min_alphabetic_ratio": ("alphabetic_ratio", True),
+    "min_script_ratio": ("script_ratio", True),
+    "max_line_repetition_ratio": ("line_repetition_ratio", False),
+    "min_mean_word_length": ("mean_word_length", True),
+    "max_mean_word_length": ("mean_word_length", False),
+}
+
+_DEFAULT_THRESHOLDS = {
+    "min_length": 50,
+    "min_alphabetic_ratio": 0.5,
+    "min_script_ratio": 0.5,
+    "max_line_repetition_ratio": 0.5,
+    "min_mean_word_length": 2.0,
+    "max_mean_word_length": 20.0,
+}
+
+#the words of the scripts without word spacing can't be counted by whitespaces
+_LANG_DEFAULT_THRESHOLDS = {
+    lang: {"min_mean_word_length": None, "max_mean_word_length": None} for lang in ["th", "lo", "km", "my", "shn", "mnw"]
+}
+
+#bit flags of the char-class lookup table
+_LETTER_FLAG, _SCRIPT_FLAG, _SPACE_FLAG = 1, 2, 4
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def get_script_ranges(lang_id: str):
+    '''
+    Get the codepoint ranges of the script of a wiki, Latin if it isn't one of `_NON_ALPHANUMERIC_SCRIPT_RANGES`
+    '''
+    _script = _LANG_DEFAULT_NON_ALPHANUMERIC_SCRIPT.get(lang_id)
+    return tuple(_NON_ALPHANUMERIC_SCRIPT_RANGES[_script] if _script is not None else _LATIN_SCRIPT_RANGES)
+
+
+def _get_char_flags(codepoint: int, script_ranges: tuple):
+    char = chr(codepoint)
+    if char.isspace():
+        return _SPACE_FLAG
+    if unicodedata.category(char)[0] not in "LM":
+        return 0
+    if any(start <= codepoint <= end for start, end in script_ranges):
+        return _LETTER_FLAG | _SCRIPT_FLAG
+    return _LETTER_FLAG
+
+
+@functools.lru_cache(maxsize=None)
+def _get_char_flags_table(script_ranges: tuple):
+    #lookup table of the Basic Multilingual Plane, the (rare) chars above it are resolved one by one
+    return np.array([_get_char_flags(codepoint, script_ranges) for codepoint in range(0x10000)], dtype=np.uint8)
+
+
+def _line_repetition_ratio(text: str):
+    lines = [line for line in map(str.strip, text.split("\n")) if line]
+    return 1 - len(set(lines)) / len(lines) if len(lines) > 0 else 0.0
+
+
+def _compute_batch_signals(texts: list, script_ranges: tuple):
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    starts = np.cumsum(lengths) - lengths
+
+    codepoints = np.frombuffer("".join(texts).encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+    flags = _get_char_flags_table(script_ranges)[np.minimum(codepoints, 0xFFFF)]
+    for idx in np.flatnonzero(codepoints > 0xFFFF):
+        flags[idx] = _get_char_flags(int(codepoints[idx]), script_ranges)
+
+    _is_non_empty = lengths > 0
+    def _sum_per_text(mask):
+        #segments of `reduceat` can't be empty, the empty texts are left as 0
+        _sums = np.zeros(len(texts), dtype=np.int64)
+        if len(mask) > 0:
+            _sums[_is_non_empty] = np.add.reduceat(mask, starts[_is_non_empty], dtype=np.int64)
+        return _sums
+
+    is_space = (flags & _SPACE_FLAG) != 0
+    #a word starts on a non-whitespace char following a whitespace or the start of its text
+    follows_space = np.concatenate([[True], is_space[:-1]])
+    follows_space[starts[_is_non_empty]] = True
+
+    num_non_space = lengths - _sum_per_text(is_space)
+    num_letters = _sum_per_text((flags & _LETTER_FLAG) != 0)
+    num_script_letters = _sum_per_text((flags & _SCRIPT_FLAG) != 0)
+    num_words = _sum_per_text(~is_space & follows_space)
+
+    def _ratio(numerators, denominators):
+        return np.divide(numerators, denominators, out=np.zeros(len(numerators), dtype=np.float64), where=denominators > 0)
+
+    return {
+        "length": lengths,
+        "alphabetic_ratio": _ratio(num_letters, num_non_space),
+        "script_ratio": _ratio(num_script_letters, num_letters),
+        "line_repetition_ratio": np.fromiter(map(_line_repetition_ratio, texts), dtype=np.float64, count=len(texts)),
+        "mean_word_length": _ratio(num_non_space, num_words),
+    }
+
+
+def compute_quality_signals(texts: list, lang_id: str=None, batch_nchars: int=1 << 24):
+    '''
+    Compute the quality signals of every text (see the module docstring)
+
+    Parameters
+    ----------
+    texts: list of texts (the nulls, e.g. None or NaN, are read as empty texts)
+    lang_id: lang id of the wiki, to get the script of `script_ratio` from
+    batch_nchars: max number of chars decoded into the UTF-32 buffer at once
+    Returns
+    -------
+    dict of signal name to NumPy array of its value of every text
+    '''
+    texts = [text if isinstance(text, str) else "" for text in texts]
+    script_ranges = get_script_ranges(lang_id)
+
+    #split into batches of at most `batch_nchars` chars (or a single text) to bound the buffer size
+    _ends = np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)))
+    batch_bounds, start = [], 0
+    while start < len(texts):
+        _offset = _ends[start-1] if start > 0 else 0
+        end = max(int(np.searchsorted(_ends, _offset + batch_nchars, side="right")), start + 1)
+        batch_bounds.append((start, end))
+        start = end
+
+    _batch_signals = [_compute_batch_signals(texts[start:end], script_ranges) for start, end in batch_bounds]
+    return {name: np.concatenate([signals[name] for signals in _batch_signals]) if len(_batch_signals) > 0
+                  else np.array([], dtype=np.float64)
+            for name in _SIGNAL_NAMES}
+
+
+def get_lang_thresholds(lang_id: str=None, thresholds_config: dict=None):
+    '''
+    Get the thresholds of a language: the defaults, overridden by the built-in language defaults,
+    then by `default` and by the lang id entries of `thresholds_config`
+    '''
+    thresholds_config = thresholds_config if thresholds_config is not None else {}
+    thresholds = {**_DEFAULT_THRESHOLDS, **_LANG_DEFAULT_THRESHOLDS.get(lang_id, {}),
+                  **thresholds_config.get("default", {}), **thresholds_config.get(lang_id, {})}
+    _unknown_names = [name for name in thresholds if name not in _THRESHOLD_CHECKS]
+    if len(_unknown_names) > 0:
+        raise ValueError(f"Unexpected threshold(s) {', '.join(_unknown_names)}! Expected some of {', '.join(_THRESHOLD_CHECKS)}")
+    return thresholds
+
+
+def get_rows_to_keep(signals: dict, thresholds: dict, inc_counter=None):
+    '''
+    Get the rows passing every threshold
+
+    Parameters
+    ----------
+    signals: dict from `compute_quality_signals`
+    thresholds: dict from `get_lang_thresholds`
+    inc_counter: optional fn of `(name, value=1)` to count the rows failing each threshold
+        (a row failing many thresholds is counted on each one) and the dropped rows
+    Returns
+    -------
+    tuple of boolean mask of rows to keep and list of `;`-joined failed threshold names of each row
+    '''
+    _num_rows = len(signals["length"])
+    to_keep = np.ones(_num_rows, dtype=bool)
+    failed_thresholds = [[] for _ in range(_num_rows)]
+    for name, threshold in thresholds.items():
+        if threshold is None:
+            continue
+        signal_name, is_lower_bound = _THRESHOLD_CHECKS[name]
+        _is_failed = signals[signal_name] < threshold if is_lower_bound else signals[signal_name] > threshold
+        to_keep &= ~_is_failed
+        for idx in np.flatnonzero(_is_failed):
+            failed_thresholds[idx].append(name)
+        if inc_counter is not None:
+            inc_counter(f"dropped-{name.replace('_', '-')}", int(_is_failed.sum()))
+
+    if inc_counter is not None:
+        inc_counter("dropped-quality", int((~to_keep).sum()))
+    return to_keep, [";".join(names) for names in failed_thresholds]
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--csv-path", help="Relative location of deduplicated csv file(s) of Wikipedia data", nargs="+")
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved filtered Wikipedia CSV data
+                        to the `filter_wiki_data.py` script dir""",
+            default="./sea_wiki_filtered_data")
+
+    #default: built-in thresholds only
+    parser.add_argument("--thresholds-path", help="""Path of JSON thresholds overriding the built-in ones, as
+                        `{"default": {"min_length": 100}, "th": {"min_script_ratio": 0.7}}`""",
+            default=None)
+
+    parser.add_argument("--save-dropped-data", help="""Flag whether to save the dropped rows with their signals and
+                        failed thresholds into `*_dropped.csv.gz` (to tune the thresholds with)""",
+            default=False, type=argparse_bool_check)
+
+    parser.add_argument("--chunk-size", help="Number of rows read from the CSV at once", default=100000, type=int)
+
+    add_metrics_args(parser)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    thresholds_config = None
+    if args.thresholds_path is not None:
+        with open(args.thresholds_path) as f:
+            thresholds_config = json.load(f)
+
+    os.makedirs(args.save_dir_path, exist_ok=True)
+    metrics = PipelineMetrics.from_args(args, run_name="filter")
+
+    for csv_path in args.csv_path:
+        lang_id, _ = get_lang_and_date_from_file_name(csv_path)
+        thresholds = get_lang_thresholds(lang_id, thresholds_config)
+        logger.info(f"Filtering {csv_path} with thresholds {thresholds}...")
+
+        _file_name = os.path.basename(csv_path).replace(".csv.gz", "")
+        _save_path = os.path.join(args.save_dir_path, f"{_file_name}_filtered.csv.gz")
+        _dropped_save_path = os.path.join(args.save_dir_path, f"{_file_name}_dropped.csv.gz")
+
+        num_rows, num_kept = 0, 0
+        with metrics.stage("quality-filter", lang=lang_id) as inc_counter:
+            inc_counter("bytes_in", os.path.getsize(csv_path))
+            for idx, df in enumerate(read_csv_ignore_some_nulls(csv_path, compression="gzip", chunksize=args.chunk_size,
+                                                                dtype={"id": str})):
+                signals = compute_quality_signals(df["text"].to_list(), lang_id=lang_id)
+                to_keep, failed_thresholds = get_rows_to_keep(signals, thresholds, inc_counter=inc_counter)
+                write_csv_chunk(df[to_keep], _save_path, is_first_chunk=idx == 0)
+                if args.save_dropped_data:
+                    _dropped_df = df.assign(**signals, failed_thresholds=failed_thresholds)[~to_keep]
+                    write_csv_chunk(_dropped_df, _dropped_save_path, is_first_chunk=idx == 0)
+                num_rows += df.shape[0]
+                num_kept += int(to_keep.sum())
+            inc_counter("pages", num_rows)
+            inc_counter("bytes_out", os.path.getsize(_save_path) if num_rows > 0 else 0)
+        logger.info(f"Kept {num_kept} out of {num_rows} rows into {_save_path}")
+
+    metrics.export_if_requested(args, logger)
+    logger.info("Done Filtering Process")
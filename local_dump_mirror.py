@@ -0,0 +1,393 @@
+'''
+Script on Preparing a Local Wikipedia Dump Source for `sea_loader_batched/wiki_loader.py`
+-------------------
+The local dir follows https://dumps.wikimedia.org/ layout of `{lang}wiki/{date}/dumpstatus.json`,
+so it can be passed as `dump_source` of `WikipediaConfig` (or `--dump-source` of the extract CLIs).
+Available modes:
+  mirror: copy the multistream dump files of a language from dumps.wikimedia.org (or any mirror)
+  synthesize: generate a deterministic synthetic multistream dump of configurable size
+  serve: serve the local dir on a tiny HTTP server as a stand-in of dumps.wikimedia.org
+'''
+
+import os
+import bz2
+import json
+import random
+import hashlib
+import logging
+import argparse
+import urllib.request
+import http.server
+from functools import partial
+from xml.sax.saxutils import escape
+
+
+_REMOTE_DUMP_SOURCE = "https://dumps.wikimedia.org"
+_INFO_FILE = "dumpstatus.json"
+_PAGES_PER_STREAM = 100
+
+#vocab used to generate the synthetic article text, loosely resembling Indonesian/Malay wikis
+_SYNTHETIC_WORDS = [
+    "adalah", "sebuah", "desa", "kecamatan", "kabupaten", "provinsi", "di", "yang", "dan", "dengan",
+    "pada", "tahun", "penduduk", "jiwa", "sungai", "gunung", "kota", "pulau", "bahasa", "sejarah",
+    "merupakan", "salah", "satu", "terletak", "wilayah", "utara", "selatan", "timur", "barat", "pusat",
+    "kerajaan", "masyarakat", "budaya", "pertanian", "nelayan", "sekolah", "masjid", "gereja", "pasar", "jalan",
+]
+_SYNTHETIC_PLACES = ["Aceh", "Bali", "Jawa", "Sulawesi", "Kalimantan", "Sumatra", "Papua", "Maluku", "Nias", "Madura"]
+_SYNTHETIC_STUB_TEXT = "'''{title}''' adalah sebuah desa di kecamatan {place}, [[{place}]], [[Indonesia]].\n\n{{{{desa-stub}}}}"
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def get_dump_dir(root_dir: str, lang: str, date: str):
+    return os.path.join(root_dir, f"{lang.replace('-', '_')}wiki", date)
+
+
+def _file_checksums(path: str, chunk_size: int=1<<20):
+    _md5, _sha1 = hashlib.md5(), hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(partial(f.read, chunk_size), b""):
+            _md5.update(chunk)
+            _sha1.update(chunk)
+    return _md5.hexdigest(), _sha1.hexdigest()
+
+
+def write_dumpstatus(dump_dir: str, lang: str, date: str, filenames: list):
+    '''
+    Write `dumpstatus.json` of files in `dump_dir`, following the format of dumps.wikimedia.org
+    '''
+    _files = {}
+    for fname in filenames:
+        _md5, _sha1 = _file_checksums(os.path.join(dump_dir, fname))
+        _files[fname] = {
+            "size": os.path.getsize(os.path.join(dump_dir, fname)),
+            "url": f"/{lang.replace('-', '_')}wiki/{date}/{fname}",
+            "md5": _md5,
+            "sha1": _sha1,
+        }
+    dump_info = {"jobs": {"articlesmultistreamdump": {"status": "done", "files": _files}}, "version": "0.8"}
+    with open(os.path.join(dump_dir, _INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump(dump_info, f, indent=2)
+    return dump_info
+
+
+def mirror_remote_dump(root_dir: str, lang: str, date: str, source: str=_REMOTE_DUMP_SOURCE, num_workers: int=2, logger=None):
+    '''
+    Copy `dumpstatus.json` and the multistream dump files (XML and index) of a language into local dir
+    with `num_workers` concurrent connections, resuming partial downloads and verifying their checksums.
+    The files verified on previous runs are skipped, so reruns don't re-download them
+
+    Returns
+    -------
+    path of the local dump dir
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    dump_dir = get_dump_dir(root_dir, lang, date)
+    os.makedirs(dump_dir, exist_ok=True)
+    base_url = f"{source.rstrip('/')}/{lang.replace('-', '_')}wiki/{date}/"
+
+    with urllib.request.urlopen(base_url + _INFO_FILE) as resp:
+        dump_info = json.load(resp)
+    multistream_dump_info = dump_info["jobs"]["articlesmultistreamdump"]
+    if multistream_dump_info["status"] != "done":
+        raise ValueError(f"Specified dump ({base_url}) multistream status is not 'done': {multistream_dump_info['status']}")
+
+    #imported here since it needs the `datasets` package
+    from sea_loader_batched.wiki_loader import download_dump_files
+    logger.info(f"Downloading {len(multistream_dump_info['files'])} file(s) into {dump_dir}...")
+    download_dump_files(multistream_dump_info["files"], base_url, dump_dir, num_workers=num_workers)
+
+    #write it last, so an interrupted mirror isn't considered as a complete one
+    with open(os.path.join(dump_dir, _INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump(dump_info, f, indent=2)
+    return dump_dir
+
+
+def _synthetic_sentence(rng: random.Random, n_words: int):
+    _sentence = " ".join(rng.choice(_SYNTHETIC_WORDS) for _ in range(n_words))
+    return _sentence[0].upper() + _sentence[1:] + "."
+
+
+def _synthetic_article(rng: random.Random, title: str, n_paragraphs: int):
+    place = rng.choice(_SYNTHETIC_PLACES)
+    parts = [f"{{{{Infobox desa\n| nama = {title}\n| provinsi = {place}\n}}}}"]
+    parts.append(f"'''{title}''' {_synthetic_sentence(rng, rng.randint(8, 20))} [[{place}]] "
+                 f"{_synthetic_sentence(rng, rng.randint(5, 15))}<ref>{_synthetic_sentence(rng, 4)}</ref>")
+    for idx in range(n_paragraphs):
+        if idx % 3 == 0:
+            parts.append(f"== {rng.choice(_SYNTHETIC_WORDS).capitalize()} ==")
+        parts.append(" ".join(_synthetic_sentence(rng, rng.randint(6, 25)) for _ in range(rng.randint(2, 6))))
+        if rng.random() < 0.1:
+            parts.append("{| class=\"wikitable\"\n|-\n! Tahun !! Penduduk\n"
+                         + "".join(f"|-\n| {1990+_yr} || {rng.randint(100, 99999)}\n" for _yr in range(rng.randint(2, 8)))
+                         + "|}")
+        if rng.random() < 0.2:
+            parts.append(f"[[Berkas:{rng.choice(_SYNTHETIC_WORDS)}.jpg|jmpl|{_synthetic_sentence(rng, 3)}]]")
+    parts.append(f"[[Kategori:Desa di {place}]]")
+    return "\n\n".join(parts)
+
+
+def generate_synthetic_pages(num_pages: int, seed: int=0, mean_paragraphs: int=6,
+                             redirect_ratio: float=0.3, non_article_ratio: float=0.15,
+                             stub_ratio: float=0.2, duplicate_ratio: float=0.03):
+    '''
+    Generate deterministic synthetic MediaWiki pages with a mix of articles, stubs, redirects,
+    non-main namespace pages and duplicated articles
+
+    Returns
+    -------
+    generator of dict with keys `id`, `title`, `ns`, `redirect` (target title or None) and `text`
+    '''
+    rng = random.Random(seed)
+    article_titles, article_texts = [], []
+    for page_id in range(1, num_pages+1):
+        title = f"{rng.choice(_SYNTHETIC_PLACES)} {rng.choice(_SYNTHETIC_WORDS).capitalize()} {page_id}"
+        _draw = rng.random()
+        if _draw < redirect_ratio and article_titles:
+            target = rng.choice(article_titles)
+            yield {"id": page_id, "title": title, "ns": 0, "redirect": target, "text": f"#ALIH [[{target}]]"}
+            continue
+        _draw -= redirect_ratio
+        if _draw < non_article_ratio:
+            ns, prefix = rng.choice([(10, "Templat"), (14, "Kategori"), (2, "Pengguna"), (4, "Wikipedia")])
+            yield {"id": page_id, "title": f"{prefix}:{title}", "ns": ns, "redirect": None,
+                   "text": _synthetic_sentence(rng, rng.randint(5, 30))}
+            continue
+        _draw -= non_article_ratio
+        if _draw < stub_ratio:
+            text = _SYNTHETIC_STUB_TEXT.format(title=title, place=rng.choice(_SYNTHETIC_PLACES))
+        elif _draw - stub_ratio < duplicate_ratio and article_texts:
+            text = rng.choice(article_texts)
+        else:
+            text = _synthetic_article(rng, title, max(1, int(rng.expovariate(1/mean_paragraphs))))
+        article_titles.append(title)
+        if len(article_texts) < 1000:
+            article_texts.append(text)
+        yield {"id": page_id, "title": title, "ns": 0, "redirect": None, "text": text}
+
+
+def _page_to_xml(page: dict):
+    _redirect = ""
+    if page["redirect"] is not None:
+        #always double-quoted with `&quot;` as in the real dumps, `quoteattr` switches to single quotes on a `"` in the title
+        _redirect = '    <redirect title="' + escape(page["redirect"], {'"': "&quot;"}) + '" />\n'
+    _text = page["text"]
+    return (
+        "  <page>\n"
+        f"    <title>{escape(page['title'])}</title>\n"
+        f"    <ns>{page['ns']}</ns>\n"
+        f"    <id>{page['id']}</id>\n"
+        f"{_redirect}"
+        "    <revision>\n"
+        f"      <id>{page['id']*10}</id>\n"
+        "      <timestamp>2023-11-01T00:00:00Z</timestamp>\n"
+        "      <model>wikitext</model>\n"
+        "      <format>text/x-wiki</format>\n"
+        f"      <text bytes=\"{len(_text.encode('utf-8'))}\" xml:space=\"preserve\">{escape(_text)}</text>\n"
+        "    </revision>\n"
+        "  </page>\n"
+    )
+
+
+def _dump_header(lang: str):
+    return (
+        f"<mediawiki xmlns=\"http://www.mediawiki.org/xml/export-0.10/\" version=\"0.10\" xml:lang=\"{lang}\">\n"
+        "  <siteinfo>\n"
+        "    <sitename>Wikipedia</sitename>\n"
+        f"    <dbname>{lang.replace('-', '_')}wiki</dbname>\n"
+        f"    <base>https://{lang}.wikipedia.org/wiki/</base>\n"
+        "    <generator>MediaWiki</generator>\n"
+        "    <case>first-letter</case>\n"
+        "  </siteinfo>\n"
+    )
+
+
+def write_multistream_dump(pages, xml_path: str, index_path: str, lang: str, pages_per_stream: int=_PAGES_PER_STREAM):
+    '''
+    Write pages as a multistream dump (header, one bz2 stream per `pages_per_stream` pages, and footer)
+    along with its `offset:page_id:title` index
+
+    Returns
+    -------
+    number of pages written
+    '''
+    n_pages, _stream = 0, []
+    with open(xml_path, "wb") as xml_f, bz2.open(index_path, "wt", encoding="utf-8") as index_f:
+
+        def _flush_stream():
+            _offset = xml_f.tell()
+            xml_f.write(bz2.compress("".join(_page_to_xml(page) for page in _stream).encode("utf-8")))
+            for page in _stream:
+                index_f.write(f"{_offset}:{page['id']}:{page['title']}\n")
+            _stream.clear()
+
+        xml_f.write(bz2.compress(_dump_header(lang).encode("utf-8")))
+        for page in pages:
+            _stream.append(page)
+            n_pages += 1
+            if len(_stream) == pages_per_stream:
+                _flush_stream()
+        if _stream:
+            _flush_stream()
+        xml_f.write(bz2.compress(b"</mediawiki>\n"))
+    return n_pages
+
+
+def build_synthetic_dump(root_dir: str, lang: str, date: str, num_pages: int, num_files: int=1, seed: int=0, **page_kwargs):
+    '''
+    Generate a synthetic multistream dump of a language in local dump layout, split into `num_files` parts
+    (named like the dumps of big wikis) when more than one
+
+    Returns
+    -------
+    path of the local dump dir
+    '''
+    dump_dir = get_dump_dir(root_dir, lang, date)
+    os.makedirs(dump_dir, exist_ok=True)
+    _prefix = f"{lang.replace('-', '_')}wiki-{date}-pages-articles-multistream"
+
+    pages = generate_synthetic_pages(num_pages, seed=seed, **page_kwargs)
+    _pages_per_file = -(-num_pages // num_files)
+    filenames = []
+    for file_idx in range(num_files):
+        _start, _end = file_idx*_pages_per_file + 1, min((file_idx+1)*_pages_per_file, num_pages)
+        if num_files == 1:
+            xml_name, index_name = f"{_prefix}.xml.bz2", f"{_prefix}-index.txt.bz2"
+        else:
+            xml_name = f"{_prefix}{file_idx+1}.xml-p{_start}p{_end}.bz2"
+            index_name = f"{_prefix}-index{file_idx+1}.txt-p{_start}p{_end}.bz2"
+        _file_pages = (next(pages) for _ in range(_end - _start + 1))
+        write_multistream_dump(_file_pages, os.path.join(dump_dir, xml_name), os.path.join(dump_dir, index_name), lang)
+        filenames.extend([xml_name, index_name])
+
+    write_dumpstatus(dump_dir, lang, date, filenames)
+    return dump_dir
+
+
+class _RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    '''
+    `SimpleHTTPRequestHandler` with support of single `Range: bytes=start-[end]` requests,
+    so resumed downloads can be tested against the local server
+    '''
+    def send_head(self):
+        self._range_remaining = None
+        _range = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if _range is None or not _range.startswith("bytes=") or not os.path.isfile(path):
+            return super().send_head()
+
+        _file_size = os.path.getsize(path)
+        _start, _, _end = _range[len("bytes="):].partition("-")
+        try:
+            _start = int(_start)
+            _end = min(int(_end), _file_size - 1) if _end else _file_size - 1
+        except ValueError:
+            return super().send_head()
+        if _start >= _file_size or _start > _end:
+            self.send_error(416, "Requested Range Not Satisfiable")
+            return None
+
+        f = open(path, "rb")
+        f.seek(_start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {_start}-{_end}/{_file_size}")
+        self.send_header("Content-Length", str(_end - _start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self._range_remaining = _end - _start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        _remaining = getattr(self, "_range_remaining", None)
+        if _remaining is None:
+            return super().copyfile(source, outputfile)
+        self._range_remaining = None
+        while _remaining > 0:
+            chunk = source.read(min(1 << 16, _remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            _remaining -= len(chunk)
+
+
+def serve_dump_dir(root_dir: str, host: str="127.0.0.1", port: int=8000):
+    '''
+    Create a threaded HTTP server serving `root_dir` (not started yet, call `serve_forever` on it),
+    with support of HTTP range requests
+    '''
+    handler = partial(_RangeRequestHandler, directory=root_dir)
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--mode", help="Mode of execution", choices=["mirror", "synthesize", "serve"])
+
+    parser.add_argument("--root-dir-path", help="Root dir of the local dump mirror", default="./wiki_dump_mirror")
+
+    parser.add_argument("--lang-id", help="Lang ID from Wikipedia Data to mirror or synthesize")
+
+    parser.add_argument("--date-ver", help="Date of Wikipedia Data (YYYYMMDD) to mirror or synthesize")
+
+    parser.add_argument("--source", help="Base URL of the dump source to be mirrored", default=_REMOTE_DUMP_SOURCE)
+
+    parser.add_argument("--num-workers", help="Number of concurrent connections to mirror the dump files", default=2, type=int)
+
+    parser.add_argument("--num-pages", help="Number of synthetic pages to be generated", default=10000, type=int)
+
+    parser.add_argument("--num-files", help="Number of synthetic multistream dump files", default=1, type=int)
+
+    parser.add_argument("--mean-paragraphs", help="Mean paragraphs of synthetic articles (controls dump size)", default=6, type=int)
+
+    parser.add_argument("--seed", help="Seed of synthetic dump generation", default=0, type=int)
+
+    parser.add_argument("--host", help="Host of the local HTTP server", default="127.0.0.1")
+
+    parser.add_argument("--port", help="Port of the local HTTP server", default=8000, type=int)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    if args.mode == "mirror":
+        dump_dir = mirror_remote_dump(args.root_dir_path, args.lang_id, args.date_ver, source=args.source,
+                                      num_workers=args.num_workers, logger=logger)
+        logger.info(f"Dump has been mirrored in {dump_dir}")
+    elif args.mode == "synthesize":
+        dump_dir = build_synthetic_dump(args.root_dir_path, args.lang_id, args.date_ver, num_pages=args.num_pages,
+                                        num_files=args.num_files, seed=args.seed, mean_paragraphs=args.mean_paragraphs)
+        logger.info(f"Synthetic dump has been generated in {dump_dir}")
+    else:
+        server = serve_dump_dir(args.root_dir_path, host=args.host, port=args.port)
+        logger.info(f"Serving {args.root_dir_path} on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,321 @@
+'''
+Script on Packing `tiktoken` Tokens of Deduplicated Wikipedia Data into Fixed-Length Training Sequences
+-------------------
+The articles of each language are streamed in chunks and encoded in batches by `encode_ordinary_batch` on a
+thread pool (tiktoken releases the GIL). The tokens of every article, followed by the EOS token, are concatenated
+and cut into sequences of `seq-len` tokens, written as `uint32` NumPy shards of (num_sequences, seq_len) shape
+to be read by `np.load(path, mmap_mode="r")`, and listed in `index.json` along the per-language token counts.
+The chunks of the languages are interleaved in proportion to their data size times their mixing weight, so the
+shards have about the same language mix. A weight below 1 subsamples the articles of a language, and a weight
+above 1 repeats them over more passes (e.g. 2.5 is two full passes and a half one).
+Usage example:
+    python pack_tokens_wiki_data.py --csv-path sea_wiki_dedup_data/*.csv.gz --mixing-weights-path weights.json
+'''
+
+import os
+import json
+import math
+import time
+import zlib
+import heapq
+import logging
+import argparse
+from itertools import chain
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from dedup_raw_wiki_data import read_csv_ignore_some_nulls, get_lang_and_date_from_file_name
+from pipeline_metrics import PipelineMetrics, add_metrics_args
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def get_mixing_weights(lang_keys: list, config: dict=None):
+    '''
+    Get the mixing weight of each language, from `config` of `{"default": 1.0, "th": 2.0}` format
+    (keyed by the lang ID or by the `{lang}_{date}` key), defaulting to 1.0
+    '''
+    config = config if config is not None else {}
+    _default = config.get("default", 1.0)
+    weights = {}
+    for lang_key in lang_keys:
+        _lang_id = lang_key.rsplit("_", 1)[0]
+        weights[lang_key] = float(config.get(lang_key, config.get(_lang_id, _default)))
+        if weights[lang_key] < 0:
+            raise ValueError(f"Mixing weight of {lang_key} has to be non-negative! Received {weights[lang_key]}!")
+    return weights
+
+
+def get_articles_to_keep(ids: list, pass_idx: int, rate: float):
+    '''
+    Deterministically sample about `rate` of the articles on a pass, by the hash of their id and the pass index
+    '''
+    _hashes = np.fromiter((zlib.crc32(f"{id_}:{pass_idx}".encode("utf-8")) for id_ in ids), dtype=np.uint64, count=len(ids))
+    return _hashes < rate * (1 << 32)
+
+
+def encode_texts(texts: list, encoder, executor: ThreadPoolExecutor, batch_size: int=1000):
+    '''
+    Encode each text by encoding the batches concurrently on the given thread pool
+
+    Returns
+    -------
+    list of token list of each text (in the same order)
+    '''
+    batches = [texts[idx:idx+batch_size] for idx in range(0, len(texts), batch_size)]
+    return list(chain.from_iterable(executor.map(lambda batch: encoder.encode_ordinary_batch(batch, num_threads=1), batches)))
+
+
+def iter_lang_token_chunks(csv_paths: list, mixing_weight: float, encoder, executor: ThreadPoolExecutor,
+                           batch_size: int=1000, chunk_size: int=10000, inc_counter=None):
+    '''
+    Stream the articles of a language in chunks, over `ceil(mixing_weight)` passes
+
+    Yields
+    -------
+    `uint32` array of the tokens of a chunk of articles, each one followed by the EOS token
+    '''
+    for pass_idx in range(math.ceil(mixing_weight)):
+        _rate = min(1.0, mixing_weight - pass_idx)
+        for csv_path in csv_paths:
+            for df in read_csv_ignore_some_nulls(csv_path, compression="gzip", chunksize=chunk_size, dtype={"id": str},
+                                                 usecols=lambda colname: colname in ["id", "text"]):
+                df = df[df["text"].notna()]
+                if _rate < 1.0:
+                    df = df[get_articles_to_keep(df["id"].to_list(), pass_idx, _rate)]
+                if df.shape[0] == 0:
+                    continue
+                token_lists = encode_texts(df["text"].fillna("").astype(str).to_list(), encoder, executor, batch_size=batch_size)
+                _num_tokens = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(token_lists))
+                tokens = np.fromiter(chain.from_iterable(token_lists), dtype=np.uint32, count=int(_num_tokens.sum()))
+                tokens = np.insert(tokens, np.cumsum(_num_tokens), np.uint32(encoder.eot_token))
+                if inc_counter is not None:
+                    inc_counter("articles", df.shape[0])
+                    inc_counter("tokens", len(tokens))
+                yield tokens
+
+
+def iter_mixed_token_chunks(lang_chunk_iters: dict, lang_shares: dict):
+    '''
+    Interleave the token chunks of the languages, picking the language of the least tokens emitted relative to
+    its share each time (as a stride scheduler), so every language is spread evenly over the whole output
+
+    Yields
+    -------
+    tuple of lang key and its token chunk
+    '''
+    _heap = [(0.0, lang_key) for lang_key in lang_chunk_iters if lang_shares[lang_key] > 0]
+    heapq.heapify(_heap)
+    while _heap:
+        _virtual_time, lang_key = heapq.heappop(_heap)
+        tokens = next(lang_chunk_iters[lang_key], None)
+        if tokens is None:
+            continue
+        yield lang_key, tokens
+        heapq.heappush(_heap, (_virtual_time + len(tokens) / lang_shares[lang_key], lang_key))
+
+
+class SequencePacker:
+    '''
+    Packer of token chunks into fixed-length sequences, written into `uint32` `.npy` shards of
+    `shard_num_sequences` sequences each (the last one may have fewer)
+
+    Parameters
+    ----------
+    save_dir: dir of the shards
+    seq_len: number of tokens of a sequence
+    shard_num_sequences: number of sequences of a shard
+    '''
+    def __init__(self, save_dir: str, seq_len: int=2048, shard_num_sequences: int=8192, logger=None):
+        self.save_dir = save_dir
+        self.seq_len = seq_len
+        self.shard_num_sequences = shard_num_sequences
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.shards = []
+        self.num_dropped_tokens = 0
+        self._tail = np.empty(0, dtype=np.uint32)
+        self._buffer = np.empty((shard_num_sequences, seq_len), dtype=np.uint32)
+        self._num_buffered = 0
+        #tokens of each language in the buffered sequences, the tail is counted on the language completing it
+        self._buffered_tokens_by_lang = defaultdict(int)
+
+    def add(self, tokens: np.ndarray, lang_key: str=None):
+        tokens = np.concatenate([self._tail, tokens]) if len(self._tail) > 0 else tokens
+        _num_sequences = len(tokens) // self.seq_len
+        sequences = tokens[:_num_sequences * self.seq_len].reshape(_num_sequences, self.seq_len)
+        self._tail = tokens[_num_sequences * self.seq_len:].copy()
+
+        while len(sequences) > 0:
+            _num_rows = min(len(sequences), self.shard_num_sequences - self._num_buffered)
+            self._buffer[self._num_buffered:self._num_buffered + _num_rows] = sequences[:_num_rows]
+            self._num_buffered += _num_rows
+            self._buffered_tokens_by_lang[lang_key] += _num_rows * self.seq_len
+            sequences = sequences[_num_rows:]
+            if self._num_buffered == self.shard_num_sequences:
+                self._write_shard()
+
+    def _write_shard(self):
+        _file_name = f"shard_{len(self.shards):05d}.npy"
+        _save_path = os.path.join(self.save_dir, _file_name)
+        with open(_save_path + ".incomplete", "wb") as f:
+            np.save(f, self._buffer[:self._num_buffered])
+        os.replace(_save_path + ".incomplete", _save_path)
+        self.shards.append({"file_name": _file_name, "num_sequences": self._num_buffered,
+                            "num_tokens_by_lang": dict(self._buffered_tokens_by_lang)})
+        self.logger.info(f"Shard {_file_name} of {self._num_buffered} sequences is saved")
+        self._num_buffered = 0
+        self._buffered_tokens_by_lang = defaultdict(int)
+
+    def close(self):
+        '''
+        Write the last (partial) shard, dropping the tokens left short of a full sequence
+        '''
+        if self._num_buffered > 0:
+            self._write_shard()
+        self.num_dropped_tokens += len(self._tail)
+        self._tail = np.empty(0, dtype=np.uint32)
+
+    @property
+    def num_sequences(self):
+        return sum(shard["num_sequences"] for shard in self.shards)
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--csv-path", help="Relative location of deduplicated csv file(s) of Wikipedia data", nargs="+")
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved token sequence shards & index
+                        to the `pack_tokens_wiki_data.py` script dir""",
+            default="./sea_wiki_packed_data")
+
+    parser.add_argument("--encoding-name", help="Name of `tiktoken` encoding to encode the texts with",
+            default="cl100k_base")
+
+    parser.add_argument("--seq-len", help="Number of tokens of each packed sequence", default=2048, type=int)
+
+    parser.add_argument("--shard-num-sequences", help="Number of sequences of each `.npy` shard", default=8192, type=int)
+
+    #default: weight 1.0 of every language
+    parser.add_argument("--mixing-weights-path", help="""Path of JSON language mixing weights, as
+                        `{"default": 1.0, "th": 2.0, "ms": 0.5}` (0 to leave a language out)""",
+            default=None)
+
+    parser.add_argument("--batch-size", help="Number of texts per `encode_ordinary_batch` call", default=1000, type=int)
+
+    parser.add_argument("--num-threads", help="Number of threads to encode the batches concurrently",
+            default=os.cpu_count(), type=int)
+
+    parser.add_argument("--chunk-size", help="""Number of rows read from the CSV at once,
+                        which is also the unit of interleaving the languages""",
+            default=10000, type=int)
+
+    add_metrics_args(parser)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    mixing_weights_config = None
+    if args.mixing_weights_path is not None:
+        with open(args.mixing_weights_path) as f:
+            mixing_weights_config = json.load(f)
+
+    lang_csv_paths = defaultdict(list)
+    for csv_path in args.csv_path:
+        lang, date_ver = get_lang_and_date_from_file_name(csv_path)
+        lang_csv_paths[f"{lang}_{date_ver}" if lang is not None else os.path.basename(csv_path).replace(".csv.gz", "")].append(csv_path)
+    mixing_weights = get_mixing_weights(list(lang_csv_paths.keys()), mixing_weights_config)
+    #expected token share of each language, from its compressed data size
+    lang_shares = {lang_key: mixing_weights[lang_key] * sum(os.path.getsize(csv_path) for csv_path in csv_paths)
+                   for lang_key, csv_paths in lang_csv_paths.items()}
+
+    import tiktoken
+    encoder = tiktoken.get_encoding(args.encoding_name)
+
+    os.makedirs(args.save_dir_path, exist_ok=True)
+    metrics = PipelineMetrics.from_args(args, run_name="pack_tokens")
+    packer = SequencePacker(args.save_dir_path, seq_len=args.seq_len, shard_num_sequences=args.shard_num_sequences, logger=logger)
+
+    lang_counters = {lang_key: defaultdict(int) for lang_key in lang_csv_paths}
+
+    def _get_lang_counter_fn(lang_key):
+        #counted into the metrics as well as into the index
+        _metrics_inc_counter = metrics.counter_fn("pack", lang=lang_key)
+        def _inc_counter(name, value=1):
+            lang_counters[lang_key][name] += value
+            _metrics_inc_counter(name, value)
+        return _inc_counter
+
+    _start_time = time.perf_counter()
+    with metrics.stage("pack") as inc_counter, ThreadPoolExecutor(max_workers=args.num_threads) as executor:
+        lang_chunk_iters = {
+            lang_key: iter_lang_token_chunks(csv_paths, mixing_weights[lang_key], encoder, executor, batch_size=args.batch_size,
+                                             chunk_size=args.chunk_size, inc_counter=_get_lang_counter_fn(lang_key))
+            for lang_key, csv_paths in lang_csv_paths.items()
+        }
+        for lang_key, tokens in iter_mixed_token_chunks(lang_chunk_iters, lang_shares):
+            packer.add(tokens, lang_key=lang_key)
+            inc_counter("tokens", len(tokens))
+        packer.close()
+        inc_counter("sequences", packer.num_sequences)
+        inc_counter("shards", len(packer.shards))
+    _elapsed = time.perf_counter() - _start_time
+    _num_tokens = sum(counters["tokens"] for counters in lang_counters.values())
+
+    index = {
+        "encoding_name": args.encoding_name,
+        "dtype": "uint32",
+        "seq_len": args.seq_len,
+        "eos_token_id": encoder.eot_token,
+        "num_sequences": packer.num_sequences,
+        "num_tokens": packer.num_sequences * args.seq_len,
+        "num_dropped_tokens": packer.num_dropped_tokens,
+        "elapsed_seconds": _elapsed,
+        #of the tokens encoded, incl the EOS tokens
+        "tokens_per_sec": _num_tokens / _elapsed if _elapsed > 0 else None,
+        "shards": packer.shards,
+        "languages": {
+            lang_key: {
+                "mixing_weight": mixing_weights[lang_key],
+                "num_passes": math.ceil(mixing_weights[lang_key]),
+                "n_articles": lang_counters[lang_key]["articles"],
+                "n_tokens": lang_counters[lang_key]["tokens"],
+                "files": csv_paths,
+            }
+            for lang_key, csv_paths in lang_csv_paths.items()
+        },
+    }
+    with open(os.path.join(args.save_dir_path, "index.json"), "w") as f:
+        json.dump(index, f, indent=2)
+    logger.info(f"#Sequences: {packer.num_sequences}, #Tokens: {_num_tokens} in {_elapsed:.1f}s ({index['tokens_per_sec'] or 0:.0f} tokens/sec)")
+
+    metrics.export_if_requested(args, logger)
+    logger.info("Done Packing Tokens")
@@ -0,0 +1,302 @@
+'''
+Shared instrumentation of the pipeline scripts: per-stage (and per-language) timers, counters,
+peak RSS and optional profiling, exported as JSON or Prometheus textfile
+-------------------
+Usage example:
+    metrics = PipelineMetrics(run_name="extract_id_20231101", profiler="cprofile", profile_dir="./profiles")
+    with metrics.stage("extract", lang="id"):
+        ...
+        metrics.inc("extract", "pages", lang="id")
+    metrics.export("metrics.prom")
+The `counter_fn` of a stage is compatible with `inc_counter` args of `sea_loader_batched/wiki_loader.py`
+and the dedup fns, so their counts (e.g. `parser-error`, `filtered-redirects`) are collected too.
+'''
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:
+    #not available on Windows
+    resource = None
+
+
+_PROFILER_CHOICES = ["none", "cprofile", "pyinstrument"]
+_PROMETHEUS_PREFIX = "sea_wiki"
+_RSS_SAMPLING_INTERVAL = 0.1
+
+
+def get_peak_rss_mb(children: bool=False):
+    '''
+    Get the peak RSS (in MB) so far of the current process, or of its largest terminated child process
+    if `children`, returns None if it can't be read
+    '''
+    if resource is None:
+        return None
+    #ru_maxrss is in kB on Linux and in bytes on macOS
+    _maxrss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return _maxrss / (1024*1024) if os.uname().sysname == "Darwin" else _maxrss / 1024
+
+
+def _get_child_pids(pid: int):
+    _child_pids = []
+    for task_id in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task_id}/children") as f:
+            _child_pids.extend(map(int, f.read().split()))
+    return _child_pids
+
+
+def _get_rss_pages(pid: int):
+    #the 2nd field of statm is the resident pages
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1])
+
+
+def get_process_tree_rss_mb():
+    '''
+    Get the current RSS (in MB) of the current process and all of its live descendants (e.g. the `num-proc`
+    workers) from `/proc`, returns None if it can't be read (e.g. not on Linux). The pages shared by
+    the forked workers are counted in each of them
+    '''
+    try:
+        _rss_pages = _get_rss_pages(os.getpid())
+        _pids = _get_child_pids(os.getpid())
+    except (OSError, ValueError):
+        return None
+    while len(_pids) > 0:
+        pid = _pids.pop()
+        try:
+            _rss_pages += _get_rss_pages(pid)
+            _pids.extend(_get_child_pids(pid))
+        except (OSError, ValueError):
+            #the process exited in between
+            continue
+    return _rss_pages * os.sysconf("SC_PAGE_SIZE") / (1024*1024)
+
+
+class _PeakRSSSampler:
+    '''
+    Background thread sampling `get_process_tree_rss_mb` every `interval` seconds until stopped. The high-water
+    marks of `getrusage` complete it for the spikes between the samples: the one of the current process
+    (or of the terminated children) is the peak of the stage if it grew during the stage
+    '''
+    def __init__(self, interval: float=_RSS_SAMPLING_INTERVAL):
+        self.interval = interval
+        self._peak_rss_mb = get_process_tree_rss_mb()
+        self._start_maxrss_mb = [get_peak_rss_mb(), get_peak_rss_mb(children=True)]
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _update(self, rss_mb):
+        if rss_mb is not None and (self._peak_rss_mb is None or rss_mb > self._peak_rss_mb):
+            self._peak_rss_mb = rss_mb
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._update(get_process_tree_rss_mb())
+
+    def stop(self):
+        '''
+        Stop the sampling, returns the peak RSS (in MB) of the stage or None if it can't be read
+        '''
+        self._stop_event.set()
+        self._thread.join()
+        self._update(get_process_tree_rss_mb())
+        for start_maxrss_mb, end_maxrss_mb in zip(self._start_maxrss_mb, [get_peak_rss_mb(), get_peak_rss_mb(children=True)]):
+            if end_maxrss_mb is not None and end_maxrss_mb > start_maxrss_mb:
+                self._update(end_maxrss_mb)
+        return self._peak_rss_mb
+
+
+def add_metrics_args(parser):
+    '''
+    Add the CLI args of metrics export and profiling into an `argparse.ArgumentParser`
+    '''
+    parser.add_argument("--metrics-output-path", help="""Path to export per-stage metrics into,
+                        as Prometheus textfile if it ends with `.prom` or as JSON otherwise (not exported if not given)""",
+            default=None)
+
+    parser.add_argument("--profiler", help="Profiler to be enabled on each stage", choices=_PROFILER_CHOICES,
+            default="none")
+
+    parser.add_argument("--profile-dir-path", help="Dir path to save the profiler output of each stage",
+            default="./profiles")
+    return parser
+
+
+class PipelineMetrics:
+    '''
+    Collector of timers and counters of pipeline stages, keyed by (stage, lang)
+
+    Parameters
+    ----------
+    run_name: identifier of the run, put into the exported metrics
+    profiler: profiler to be enabled on every stage, one of "none", "cprofile" or "pyinstrument"
+    profile_dir: dir to write the profiler output of each stage into
+    '''
+    def __init__(self, run_name: str=None, profiler: str="none", profile_dir: str=None):
+        if profiler not in _PROFILER_CHOICES:
+            raise ValueError(f"Unexpected profiler {profiler}! Expected one of {', '.join(_PROFILER_CHOICES)}")
+        self.run_name = run_name
+        self.profiler = profiler
+        self.profile_dir = profile_dir if profile_dir is not None else "."
+        self._elapsed = defaultdict(float)
+        self._cpu_time = defaultdict(float)
+        self._peak_rss_mb = {}
+        self._counters = defaultdict(lambda: defaultdict(int))
+        self._profilers = {}
+
+    def inc(self, stage: str, name: str, value=1, lang: str=None):
+        self._counters[(stage, lang)][name] += value
+
+    def counter_fn(self, stage: str, lang: str=None):
+        '''
+        Get a fn of `(name, value=1)` incrementing the counters of a stage
+        '''
+        def _inc_counter(name, value=1):
+            self._counters[(stage, lang)][name] += value
+        return _inc_counter
+
+    @contextmanager
+    def stage(self, stage: str, lang: str=None):
+        '''
+        Context manager measuring the elapsed time, CPU time and peak RSS of a stage (accumulated if re-entered),
+        optionally under a profiler. The peak RSS is of the process with its worker processes while the stage runs
+        (see `_PeakRSSSampler`)
+        '''
+        _profiler = self._start_profiler(stage, lang)
+        _rss_sampler = _PeakRSSSampler()
+        _start_time, _start_cpu_time = time.perf_counter(), time.process_time()
+        try:
+            yield self.counter_fn(stage, lang)
+        finally:
+            self._elapsed[(stage, lang)] += time.perf_counter() - _start_time
+            self._cpu_time[(stage, lang)] += time.process_time() - _start_cpu_time
+            _peak_rss_mb = _rss_sampler.stop()
+            if _peak_rss_mb is not None:
+                self._peak_rss_mb[(stage, lang)] = max(_peak_rss_mb, self._peak_rss_mb.get((stage, lang)) or 0)
+            self._stop_profiler(_profiler, stage, lang)
+
+    def _start_profiler(self, stage: str, lang: str=None):
+        #the profiler of a stage is reused when re-entered, so its output covers all of the runs
+        if self.profiler == "none":
+            return None
+        _profiler = self._profilers.get((stage, lang))
+        if self.profiler == "cprofile":
+            if _profiler is None:
+                import cProfile
+                _profiler = cProfile.Profile()
+            _profiler.enable()
+        else:
+            if _profiler is None:
+                try:
+                    import pyinstrument
+                except ImportError as e:
+                    raise ImportError("Profiler `pyinstrument` is chosen but it isn't installed! Run `pip install pyinstrument`") from e
+                _profiler = pyinstrument.Profiler()
+            _profiler.start()
+        self._profilers[(stage, lang)] = _profiler
+        return _profiler
+
+    def _stop_profiler(self, profiler, stage: str, lang: str=None):
+        if profiler is None:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        _file_name = os.path.join(self.profile_dir, f"{self.run_name or 'run'}_{stage}{'_'+lang if lang else ''}")
+        if self.profiler == "cprofile":
+            profiler.disable()
+            profiler.dump_stats(_file_name + ".prof")
+        else:
+            profiler.stop()
+            with open(_file_name + ".html", "w") as f:
+                f.write(profiler.output_html())
+
+    def to_dict(self):
+        '''
+        Get all of the metrics as list of per-(stage, lang) records, incl derived throughput of counts
+        `pages`, `bytes_in` and `bytes_out` when they're recorded
+        '''
+        records = []
+        for key in sorted(set(self._elapsed) | set(self._counters), key=lambda val: (val[0], val[1] or "")):
+            stage, lang = key
+            _elapsed = self._elapsed.get(key)
+            _counters = dict(self._counters.get(key, {}))
+            record = {"stage": stage, "lang": lang, "elapsed_seconds": _elapsed, "cpu_seconds": self._cpu_time.get(key),
+                      "peak_rss_mb": self._peak_rss_mb.get(key), "counters": _counters}
+            if _elapsed:
+                for name, per_sec_name in [("pages", "pages_per_sec"), ("bytes_in", "mb_in_per_sec"), ("bytes_out", "mb_out_per_sec")]:
+                    if name in _counters:
+                        record[per_sec_name] = _counters[name] / _elapsed / (1e6 if name.startswith("bytes") else 1)
+            records.append(record)
+        return {"run_name": self.run_name, "stages": records}
+
+    def export_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def export_prometheus(self, path: str):
+        '''
+        Write the metrics in Prometheus textfile collector format
+        '''
+        def _labels(record, **extra_labels):
+            _label_dict = {"run": self.run_name, "stage": record["stage"], "lang": record["lang"], **extra_labels}
+            return ",".join(f'{key}="{val}"' for key, val in _label_dict.items() if val is not None)
+
+        gauges = [("elapsed_seconds", "elapsed_seconds"), ("cpu_seconds", "cpu_seconds"), ("peak_rss_mb", "peak_rss_megabytes"),
+                  ("pages_per_sec", "pages_per_second"), ("mb_in_per_sec", "input_megabytes_per_second"),
+                  ("mb_out_per_sec", "output_megabytes_per_second")]
+        records = self.to_dict()["stages"]
+
+        lines = []
+        for key, metric_name in gauges:
+            lines.append(f"# TYPE {_PROMETHEUS_PREFIX}_stage_{metric_name} gauge")
+            for record in records:
+                if record.get(key) is not None:
+                    lines.append(f"{_PROMETHEUS_PREFIX}_stage_{metric_name}{{{_labels(record)}}} {record[key]}")
+        lines.append(f"# TYPE {_PROMETHEUS_PREFIX}_stage_count gauge")
+        for record in records:
+            for name, value in record["counters"].items():
+                lines.append(f"{_PROMETHEUS_PREFIX}_stage_count{{{_labels(record, name=name)}}} {value}")
+
+        #write then rename, so the textfile collector never reads a partial file
+        with open(path + ".tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def export(self, path: str):
+        '''
+        Export into Prometheus textfile if the path ends with `.prom`, otherwise into JSON
+        '''
+        if path.endswith(".prom"):
+            self.export_prometheus(path)
+        else:
+            self.export_json(path)
+
+    @classmethod
+    def from_args(cls, args, run_name: str=None):
+        '''
+        Construct from the parsed CLI args added by `add_metrics_args`
+        '''
+        return cls(run_name=run_name, profiler=args.profiler, profile_dir=args.profile_dir_path)
+
+    def export_if_requested(self, args, logger=None):
+        '''
+        Log the summary and export it into `metrics-output-path` CLI arg (if given)
+        '''
+        self.log_summary(logger)
+        if args.metrics_output_path is not None:
+            self.export(args.metrics_output_path)
+
+    def log_summary(self, logger=None):
+        logger = logger if logger is not None else logging.getLogger(__name__)
+        for record in self.to_dict()["stages"]:
+            _lang = f" ({record['lang']})" if record["lang"] else ""
+            logger.info(f"Stage {record['stage']}{_lang}: {record['elapsed_seconds'] or 0:.2f}s elapsed, "
+                        f"peak RSS {record['peak_rss_mb']}MB, counters {record['counters']}")
@@ -0,0 +1,257 @@
+'''
+Script on Removing the Repeated Boilerplate Paragraphs of the Deduplicated Wikipedia Data
+-------------------
+The soft-dedup works on whole articles, so the bot-generated stubs sharing the same boilerplate paragraphs
+(e.g. "X adalah sebuah desa di ...") but a unique first line survive it, and dominate small wikis like `war` & `ceb`.
+Every `\\n\\n`-separated paragraph of the texts (as produced by the cleaning of the extraction) is hashed, and the
+number of articles containing it is counted by a fixed-size Count-Min sketch on the first pass over the CSV.
+On the second pass, the paragraphs found in more than `max-paragraph-count` articles are stripped, and the
+articles left empty are dropped. Both passes read the CSV by chunks, so the memory is bounded by the sketch
+(`sketch-width` x `sketch-depth` x 4 bytes) and the chunk size, whatever the size of the wiki.
+Usage example:
+    python remove_boilerplate_wiki_data.py --csv-path sea_wiki_dedup_data/wiki_war_20231101_dataset_dedup_cleansed.csv.gz \
+        --max-paragraph-count 100
+'''
+
+#annotations aren't evaluated on import, so numpy & pandas are only imported when the data is processed
+from __future__ import annotations
+import os
+import logging
+import argparse
+from itertools import chain
+
+from dedup_raw_wiki_data import argparse_bool_check, read_csv_ignore_some_nulls, write_csv_chunk, get_lang_and_date_from_file_name
+from pipeline_metrics import PipelineMetrics, add_metrics_args
+
+
+_PARAGRAPH_SEP = "\n\n"
+_DEFAULT_SKETCH_WIDTH = 1 << 22
+_DEFAULT_SKETCH_DEPTH = 4
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+class CountMinSketch:
+    '''
+    Count-Min sketch of 64-bit hashes: `depth` rows of `width` counters, each row indexed by its own
+    multiply-shift hash of the key. The count of a key is the min of its counters, never below its true count
+    and above it by at most e/`width` of the total count with probability 1 - e^-`depth`
+
+    Parameters
+    ----------
+    width: number of counters of each row (a power of 2)
+    depth: number of rows
+    seed: seed of the row hash multipliers
+    '''
+    def __init__(self, width: int=_DEFAULT_SKETCH_WIDTH, depth: int=_DEFAULT_SKETCH_DEPTH, seed: int=0):
+        import numpy as np
+
+        if width < 2 or width & (width - 1) != 0:
+            raise ValueError(f"Sketch width has to be a power of 2 (and at least 2), got {width}!")
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        #odd multipliers, the top log2(width) bits of the 64-bit product are the counter index
+        self._multipliers = np.random.default_rng(seed).integers(0, 1 << 63, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._shift = np.uint64(64 - (width.bit_length() - 1))
+
+    def _get_counter_idx(self, hashes: np.ndarray):
+        import numpy as np
+
+        #uint64 products wrap around, as expected by the multiply-shift hashing
+        return ((hashes[np.newaxis, :] * self._multipliers[:, np.newaxis]) >> self._shift).astype(np.intp)
+
+    def add(self, hashes: np.ndarray):
+        import numpy as np
+
+        for row, counter_idx in zip(self.table, self._get_counter_idx(hashes)):
+            #a dense count of the row is cheaper than `np.add.at` on the batches of many keys
+            if len(counter_idx) * 16 >= len(row):
+                np.add(row, np.bincount(counter_idx, minlength=len(row)), out=row, casting="unsafe")
+            else:
+                np.add.at(row, counter_idx, 1)
+
+    def query(self, hashes: np.ndarray):
+        import numpy as np
+
+        counter_idx = self._get_counter_idx(hashes)
+        return self.table[np.arange(self.table.shape[0])[:, np.newaxis], counter_idx].min(axis=0)
+
+
+def hash_paragraphs(paragraphs: list):
+    '''
+    Get the 64-bit hashes of the (stripped) paragraphs
+    '''
+    import numpy as np
+    import pandas as pd
+
+    if len(paragraphs) == 0:
+        return np.array([], dtype=np.uint64)
+    return pd.util.hash_array(np.array(paragraphs, dtype=object))
+
+
+def _split_paragraphs(text):
+    return text.split(_PARAGRAPH_SEP) if isinstance(text, str) else []
+
+
+def _get_countable_mask(paragraphs: list, min_paragraph_length: int):
+    import numpy as np
+
+    #short paragraphs (e.g. leftover section titles) are legitimately shared by many articles
+    _lengths = np.fromiter(map(len, paragraphs), dtype=np.int64, count=len(paragraphs))
+    return _lengths >= max(min_paragraph_length, 1)
+
+
+def count_paragraphs(texts: list, sketch: CountMinSketch, min_paragraph_length: int=20):
+    '''
+    Add the distinct paragraphs of every text into the sketch, so a paragraph is counted once per article
+
+    Returns
+    -------
+    number of paragraphs added
+    '''
+    paragraphs = list(chain.from_iterable(dict.fromkeys(map(str.strip, _split_paragraphs(text))) for text in texts))
+    _is_countable = _get_countable_mask(paragraphs, min_paragraph_length)
+    sketch.add(hash_paragraphs(paragraphs)[_is_countable])
+    return int(_is_countable.sum())
+
+
+def strip_boilerplate_paragraphs(texts: list, sketch: CountMinSketch, max_paragraph_count: int, min_paragraph_length: int=20):
+    '''
+    Strip the paragraphs of every text counted in more than `max_paragraph_count` articles by the sketch
+
+    Parameters
+    ----------
+    texts: list of texts (the nulls, e.g. None or NaN, are read as empty texts)
+    sketch: sketch filled by `count_paragraphs` over all of the texts of the wiki
+    max_paragraph_count: max number of articles a paragraph is found in to be kept
+    min_paragraph_length: min number of chars of a paragraph to be counted & stripped
+    Returns
+    -------
+    tuple of list of stripped texts and NumPy array of number of stripped paragraphs of each text
+    '''
+    import numpy as np
+
+    paragraphs_of_texts = [_split_paragraphs(text) for text in texts]
+    _num_paragraphs = np.fromiter(map(len, paragraphs_of_texts), dtype=np.int64, count=len(texts))
+    _starts = np.cumsum(_num_paragraphs) - _num_paragraphs
+
+    paragraphs = [paragraph.strip() for paragraph in chain.from_iterable(paragraphs_of_texts)]
+    _is_boilerplate = _get_countable_mask(paragraphs, min_paragraph_length)
+    if len(paragraphs) > 0:
+        _is_boilerplate &= sketch.query(hash_paragraphs(paragraphs)) > max_paragraph_count
+    _text_idx = np.repeat(np.arange(len(texts)), _num_paragraphs)
+    num_stripped = np.bincount(_text_idx[_is_boilerplate], minlength=len(texts))
+
+    stripped_texts = list(texts)
+    for text_idx in np.flatnonzero(num_stripped):
+        _is_kept = ~_is_boilerplate[_starts[text_idx]:_starts[text_idx] + _num_paragraphs[text_idx]]
+        stripped_texts[text_idx] = _PARAGRAPH_SEP.join(paragraph for paragraph, is_kept
+                                                       in zip(paragraphs_of_texts[text_idx], _is_kept) if is_kept)
+    return stripped_texts, num_stripped
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--csv-path", help="Relative location of deduplicated csv file(s) of Wikipedia data", nargs="+")
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved Wikipedia CSV data with the boilerplate removed
+                        to the `remove_boilerplate_wiki_data.py` script dir""",
+            default="./sea_wiki_deboilerplated_data")
+
+    parser.add_argument("--max-paragraph-count", help="""Max number of articles of a wiki a paragraph is found in
+                        to be kept, the paragraphs found in more articles are stripped as boilerplate""",
+            default=100, type=int)
+
+    parser.add_argument("--min-paragraph-length", help="""Min number of chars of a paragraph to be counted, the shorter ones
+                        (e.g. leftover section titles) are always kept""",
+            default=20, type=int)
+
+    parser.add_argument("--sketch-width", help="""Number of counters of each row of the Count-Min sketch (a power of 2),
+                        a wider sketch overcounts less the rare paragraphs""",
+            default=_DEFAULT_SKETCH_WIDTH, type=int)
+
+    parser.add_argument("--sketch-depth", help="Number of rows of the Count-Min sketch", default=_DEFAULT_SKETCH_DEPTH, type=int)
+
+    parser.add_argument("--save-dropped-data", help="""Flag whether to save the original rows of the articles left empty
+                        by the boilerplate removal into `*_dropped.csv.gz`""",
+            default=False, type=argparse_bool_check)
+
+    parser.add_argument("--chunk-size", help="Number of rows read from the CSV at once", default=100000, type=int)
+
+    add_metrics_args(parser)
+
+    args = parser.parse_args()
+
+    #heavy imports are deferred after the args parsing, so `--help` and invalid args return instantly
+    import numpy as np
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    os.makedirs(args.save_dir_path, exist_ok=True)
+    metrics = PipelineMetrics.from_args(args, run_name="remove_boilerplate")
+
+    for csv_path in args.csv_path:
+        lang_id, _ = get_lang_and_date_from_file_name(csv_path)
+        _file_name = os.path.basename(csv_path).replace(".csv.gz", "")
+        _save_path = os.path.join(args.save_dir_path, f"{_file_name}_deboilerplated.csv.gz")
+        _dropped_save_path = os.path.join(args.save_dir_path, f"{_file_name}_dropped.csv.gz")
+
+        logger.info(f"Counting the paragraphs of {csv_path}...")
+        sketch = CountMinSketch(width=args.sketch_width, depth=args.sketch_depth)
+        with metrics.stage("paragraph-count", lang=lang_id) as inc_counter:
+            inc_counter("bytes_in", os.path.getsize(csv_path))
+            for df in read_csv_ignore_some_nulls(csv_path, compression="gzip", chunksize=args.chunk_size,
+                                                 usecols=lambda colname: colname == "text"):
+                inc_counter("paragraphs", count_paragraphs(df["text"].to_list(), sketch,
+                                                           min_paragraph_length=args.min_paragraph_length))
+                inc_counter("pages", df.shape[0])
+
+        logger.info(f"Stripping the paragraphs found in more than {args.max_paragraph_count} articles of {csv_path}...")
+        num_rows, num_kept, num_dropped_saved = 0, 0, 0
+        with metrics.stage("boilerplate-strip", lang=lang_id) as inc_counter:
+            inc_counter("bytes_in", os.path.getsize(csv_path))
+            for idx, df in enumerate(read_csv_ignore_some_nulls(csv_path, compression="gzip", chunksize=args.chunk_size,
+                                                                dtype={"id": str})):
+                stripped_texts, num_stripped = strip_boilerplate_paragraphs(df["text"].to_list(), sketch, args.max_paragraph_count,
+                                                                            min_paragraph_length=args.min_paragraph_length)
+                to_keep = np.array([text.strip() != "" if isinstance(text, str) else False for text in stripped_texts], dtype=bool)
+                #the articles empty before the stripping aren't dropped here, so the counts only reflect the stripping
+                to_keep |= num_stripped == 0
+                write_csv_chunk(df.assign(text=stripped_texts)[to_keep], _save_path, is_first_chunk=idx == 0)
+                if args.save_dropped_data:
+                    write_csv_chunk(df[~to_keep], _dropped_save_path, is_first_chunk=idx == 0)
+                inc_counter("stripped-paragraphs", int(num_stripped.sum()))
+                inc_counter("stripped-pages", int((num_stripped > 0).sum()))
+                inc_counter("dropped-empty", int((~to_keep).sum()))
+                num_rows += df.shape[0]
+                num_kept += int(to_keep.sum())
+            inc_counter("pages", num_rows)
+            inc_counter("bytes_out", os.path.getsize(_save_path) if num_rows > 0 else 0)
+        logger.info(f"Kept {num_kept} out of {num_rows} rows into {_save_path}")
+
+    metrics.export_if_requested(args, logger)
+    logger.info("Done Boilerplate Removal Process")
@@ -16,12 +16,21 @@
 # Lint as: python3
 """Wikipedia dataset containing cleaned articles of all languages."""
 
+import io
 import os
 import sys
 import bz2
-import codecs
 import json
 import re
+import time
+import random
+import hashlib
+import functools
+import html
+import urllib.error
+import urllib.request
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
 import xml.etree.cElementTree as etree
 from urllib.parse import quote
 
@@ -884,13 +893,31 @@ class WikipediaConfig(datasets.BuilderConfig):
 
     def __init__(self, language=None, date=None, version=_VERSION,
                 split_size:int=0.5*_GiB_SIZE_IDENTIFIER, subset_file_to_process:str=":",
-                force_rerun_split: bool=False, **kwargs):
+                force_rerun_split: bool=False, dump_source: str=None, download_workers: int=None,
+                zstd_cache: bool=False, zstd_cache_dir: str=None, with_metadata: bool=False, **kwargs):
         """BuilderConfig for Wikipedia.
 
         Args:
           language: string, the language code for the Wikipedia dump to use.
           date: string, date of the Wikipedia dump in YYYYMMDD format. A list of
             available dates can be found at https://dumps.wikimedia.org/enwiki/.
+          dump_source: string, where the dumps are resolved from. Either None for
+            dumps.wikimedia.org, a base URL (e.g. a local HTTP stand-in) or a local
+            directory mirror with `{lang}wiki/{date}/dumpstatus.json` layout. Both
+            may also be given as template containing `{lang}` and `{date}`.
+          download_workers: int, if set, the dump files are fetched concurrently with
+            this many connections by `download_dump_files`, which resumes partial
+            downloads and verifies the checksums of `dumpstatus.json`. Otherwise the
+            files are fetched one after another by `datasets.DownloadManager`.
+          zstd_cache: bool, whether to transcode the dump files & splits once into a
+            zstd cache of seekable frames (see `create_zstd_caches`), which is read
+            instead of the bz2 files on the later runs. Needs `zstandard` installed,
+            the bz2 files are read otherwise.
+          zstd_cache_dir: string, dir of the zstd cache, defaults to `wikipedia_zstd_cache`
+            in the datasets cache.
+          with_metadata: bool, whether to add the page metadata columns (categories,
+            headings with their char offsets, outlink & media link counts) collected
+            along the cleaning pass, see `_parse_and_clean_wikicode`.
           **kwargs: keyword arguments forwarded to super.
         """
         super().__init__(
@@ -903,6 +930,11 @@ class WikipediaConfig(datasets.BuilderConfig):
         self.language = language
         self.split_size = split_size
         self.force_rerun_split = force_rerun_split
+        self.dump_source = dump_source
+        self.download_workers = download_workers
+        self.zstd_cache = zstd_cache
+        self.zstd_cache_dir = zstd_cache_dir
+        self.with_metadata = with_metadata
 
         _subsets = str(subset_file_to_process).split(":")
         if len(_subsets) > 2:
@@ -925,30 +957,82 @@ class WikipediaConfig(datasets.BuilderConfig):
 _DATE = "20220301"
 
 
+class _LazyBuilderConfigs(Sequence):
+    """Sequence of the `WikipediaConfig` of each language, each one is built on first access.
+
+    Building the configs of every language on import is wasted when only one language is requested,
+    and the CLIs import this script once per language. `datasets` reads `len` of it, and looks the
+    configs up by name through `builder_configs` (see `_LazyBuilderConfigsByName`).
+    """
+
+    def __init__(self, languages, date):
+        self._languages = languages
+        self._date = date
+        self._configs = {}
+
+    def __len__(self):
+        return len(self._languages)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        lang = self._languages[idx]
+        if lang not in self._configs:
+            self._configs[lang] = WikipediaConfig(language=lang, date=self._date)
+        return self._configs[lang]
+
+
+class _LazyBuilderConfigsByName(Mapping):
+    """Mapping of config name to the config of `_LazyBuilderConfigs`, only the looked up config is built.
+
+    It replaces the `builder_configs` classproperty of `datasets.DatasetBuilder`, which builds
+    `{config.name: config}` of all of `BUILDER_CONFIGS` on the first `in` check of a builder.
+    """
+
+    def __init__(self, configs):
+        self._configs = configs
+        self._idx_of_name = {f"{configs._date}.{lang}": idx for idx, lang in enumerate(configs._languages)}
+
+    def __len__(self):
+        return len(self._idx_of_name)
+
+    def __iter__(self):
+        return iter(self._idx_of_name)
+
+    def __contains__(self, name):
+        return name in self._idx_of_name
+
+    def __getitem__(self, name):
+        return self._configs[self._idx_of_name[name]]
+
+
 class Wikipedia(datasets.BeamBasedBuilder):
     """Wikipedia dataset."""
 
     # Use mirror (your.org) to avoid download caps.
     BUILDER_CONFIG_CLASS = WikipediaConfig
-    BUILDER_CONFIGS = [
-        WikipediaConfig(
-            language=lang,
-            date=_DATE,
-        )  # pylint:disable=g-complex-comprehension
-        for lang in WIKIPEDIA_LANGUAGES
-    ]
+    BUILDER_CONFIGS = _LazyBuilderConfigs(WIKIPEDIA_LANGUAGES, _DATE)
+    #shadows the classproperty of `datasets.DatasetBuilder`, so a builder doesn't build every config
+    builder_configs = _LazyBuilderConfigsByName(BUILDER_CONFIGS)
 
     def _info(self):
+        features = {
+            "id": datasets.Value("string"),
+            "url": datasets.Value("string"),
+            "title": datasets.Value("string"),
+            "text": datasets.Value("string"),
+        }
+        if self.config.with_metadata:
+            features.update({
+                # JSON-encoded list of category names and of {"title", "level", "offset"} of the headings
+                "categories": datasets.Value("string"),
+                "headings": datasets.Value("string"),
+                "num_outlinks": datasets.Value("int32"),
+                "num_media_links": datasets.Value("int32"),
+            })
         return datasets.DatasetInfo(
             description=_DESCRIPTION,
-            features=datasets.Features(
-                {
-                    "id": datasets.Value("string"),
-                    "url": datasets.Value("string"),
-                    "title": datasets.Value("string"),
-                    "text": datasets.Value("string"),
-                }
-            ),
+            features=datasets.Features(features),
             # No default supervised_keys.
             supervised_keys=None,
             homepage="https://dumps.wikimedia.org",
@@ -957,28 +1041,14 @@ class Wikipedia(datasets.BeamBasedBuilder):
 
 
     def check_and_create_splits(self):
-        def _base_url(lang):
-            return _BASE_URL_TMPL.format(lang=lang.replace("-", "_"), date=self.config.date)
-
         lang = self.config.language
         dl_manager = datasets.DownloadManager()
 
-        info_url = _base_url(lang) + _INFO_FILE
-        # Use dictionary since testing mock always returns the same result.
-        downloaded_files = dl_manager.download_and_extract({"info": info_url})
+        base_url, multistream_dump_info = get_multistream_dump_info(lang, self.config.date, dl_manager,
+                                                                    dump_source=self.config.dump_source)
 
-        xml_urls, is_split_xml = [], []
+        xml_urls, xml_infos, is_split_xml = [], {}, []
         total_bytes = 0
-        with open(downloaded_files["info"], encoding="utf-8") as f:
-            dump_info = json.load(f)
-        multistream_dump_info = dump_info["jobs"]["articlesmultistreamdump"]
-        assert (
-            multistream_dump_info["status"] == "done"
-        ), "Specified dump (%s) multistream status is not 'done': %s" % (
-            _base_url(lang),
-            multistream_dump_info["status"],
-        )
-
         for fname, info in multistream_dump_info["files"].items():
             if ".xml" not in fname:
                 continue
@@ -987,10 +1057,10 @@ class Wikipedia(datasets.BeamBasedBuilder):
             else:
                 is_split_xml.append(False)
             total_bytes += info["size"]
-            xml_urls.append(_base_url(lang) + fname)
+            xml_urls.append(base_url + fname)
+            xml_infos[fname] = info
 
-        # Use dictionary since testing mock always returns the same result.
-        downloaded_files = dl_manager.download({"xml": xml_urls})
+        downloaded_files = {"xml": self._download_dump_files(xml_infos, base_url, dl_manager)}
 
         logger.info("found %s file(s) needs to be splitted", str(sum(is_split_xml)))
 
@@ -1003,88 +1073,704 @@ class Wikipedia(datasets.BeamBasedBuilder):
                 raise ValueError("The config of file splits resulting in zero file to be processed!")
             downloaded_files["xml"] = _new_files
 
+        if self.zstd_cache_dir is not None:
+            create_zstd_caches(downloaded_files["xml"], self.zstd_cache_dir, num_workers=self.config.download_workers or 1)
+
         return lang, downloaded_files
 
 
+    @property
+    def zstd_cache_dir(self):
+        """Dir of the zstd cache of the dump files & splits, None if the cache isn't enabled."""
+        if not self.config.zstd_cache:
+            return None
+        return self.config.zstd_cache_dir or get_default_zstd_cache_dir()
+
+
+    def _download_dump_files(self, file_infos, base_url, dl_manager):
+        """Returns the local paths of the given dump files, in the same order as `file_infos`."""
+        urls = [base_url + fname for fname in file_infos]
+        if _is_local_dump_source(self.config.dump_source):
+            # local mirror files are read in-place, without going through the download manager
+            return urls
+        elif self.config.download_workers:
+            _cache_dir = os.path.join(dl_manager.download_config.cache_dir or datasets.config.DOWNLOADED_DATASETS_PATH,
+                                      "wikipedia_dumps", f"{self.config.language.replace('-', '_')}wiki", self.config.date)
+            _downloaded_paths = download_dump_files(file_infos, base_url, _cache_dir, num_workers=self.config.download_workers)
+            return [_downloaded_paths[fname] for fname in file_infos]
+        else:
+            # Use dictionary since testing mock always returns the same result.
+            return dl_manager.download({"files": urls})["files"]
+
+
+    def get_multistream_files(self):
+        """Returns (xml path, index path) pairs of the multistream dump files, without splitting them."""
+        dl_manager = datasets.DownloadManager()
+        base_url, multistream_dump_info = get_multistream_dump_info(self.config.language, self.config.date, dl_manager,
+                                                                    dump_source=self.config.dump_source)
+
+        xml_infos, index_infos = {}, {}
+        for fname, info in multistream_dump_info["files"].items():
+            if ".xml" not in fname:
+                continue
+            index_fname = _multistream_index_file_name(fname)
+            if index_fname not in multistream_dump_info["files"]:
+                raise ValueError(f"Multistream index file {index_fname} of {fname} isn't found in the dump info!")
+            xml_infos[fname] = info
+            index_infos[index_fname] = multistream_dump_info["files"][index_fname]
+
+        xml_paths = self._download_dump_files(xml_infos, base_url, dl_manager)
+        index_paths = self._download_dump_files(index_infos, base_url, dl_manager)
+        return list(zip(xml_paths, index_paths))
+
+
+    def generate_sample_examples(self, sample=None, sample_fraction=None, seed=0, inc_counter=None):
+        """Yields cleaned examples of randomly picked multistream streams, decompressing only those streams.
+
+        The streams (of ~100 pages each) are listed from the multistream index files and visited in a random
+        order determined by `seed`, so the same seed always gives the same sample.
+
+        Args:
+          sample: number of examples to yield, taken from as many streams as needed.
+          sample_fraction: fraction of the streams to take all of the examples from (if `sample` isn't given).
+          seed: seed of the stream picking.
+          inc_counter: optional fn of `(name, value=1)` to collect the same counts as the Beam metrics.
+        """
+        import mwparserfromhell
+
+        if sample is None and sample_fraction is None:
+            raise ValueError("Either `sample` or `sample_fraction` has to be given!")
+        inc_counter = inc_counter if inc_counter is not None else _noop_counter
+
+        stream_ranges = []
+        for xml_path, index_path in self.get_multistream_files():
+            _xml_size = os.path.getsize(xml_path)
+            stream_ranges.extend((xml_path, start, end) for start, end in get_multistream_stream_ranges(index_path, _xml_size))
+
+        stream_order = random.Random(seed).sample(range(len(stream_ranges)), len(stream_ranges))
+        if sample is None:
+            stream_order = stream_order[:max(1, round(sample_fraction * len(stream_ranges)))]
+        logger.info("sampling from %s out of %s stream(s)", str(len(stream_order)), str(len(stream_ranges)))
+
+        num_examples = 0
+        for stream_idx in stream_order:
+            xml_path, start, end = stream_ranges[stream_idx]
+            inc_counter("sampled-streams")
+            for inputs in _extract_raw_pages(io.BytesIO(_read_byte_range(xml_path, start, end)), inc_counter=inc_counter):
+                example = _clean_raw_page(inputs, parser=mwparserfromhell, language=self.config.language, inc_counter=inc_counter,
+                                          with_metadata=self.config.with_metadata)
+                if example is None:
+                    continue
+                yield example
+                num_examples += 1
+                if sample is not None and num_examples >= sample:
+                    return
+
+
+    def generate_examples_from_split(self, filepath, language=None, inc_counter=None, on_redirect=None):
+        """Yields cleaned examples of a single split file directly, bypassing Beam and the HF cache.
+
+        Meant to be called on each path returned by `check_and_create_splits`, so the dump
+        resolution and splitting are done only once for all of the splits.
+
+        Args:
+          filepath: path of the (splitted) bz2 WikiMedia XML file.
+          language: language code used for cleaning, defaults to the config language.
+          inc_counter: optional fn of `(name, value=1)` to collect the same counts as the Beam metrics.
+          on_redirect: optional fn called with (redirect title, target title) of every redirect of the split.
+        """
+        import mwparserfromhell
+
+        language = language or self.config.language
+        inc_counter = inc_counter if inc_counter is not None else _noop_counter
+
+        logger.info("generating examples from = %s", filepath)
+        for inputs in iter_raw_pages_from_file(filepath, inc_counter=inc_counter, zstd_cache_dir=self.zstd_cache_dir,
+                                               on_redirect=on_redirect):
+            example = _clean_raw_page(inputs, parser=mwparserfromhell, language=language, inc_counter=inc_counter,
+                                      with_metadata=self.config.with_metadata)
+            if example is not None:
+                yield example
+
+
     def _split_generators(self, dl_manager, pipeline):
         lang, downloaded_files = self.check_and_create_splits()
 
+        # the cached files are read by groups of frames, so a large file is extracted by several workers
+        zstd_frame_groups = []
+        if self.zstd_cache_dir is not None and pipeline.is_local() and _import_zstandard() is not None:
+            _uncached_files = []
+            for filepath in downloaded_files["xml"]:
+                index = get_zstd_cache_index(filepath, self.zstd_cache_dir)
+                if index is None:
+                    _uncached_files.append(filepath)
+                else:
+                    zstd_frame_groups.extend(get_zstd_frame_groups(index))
+            downloaded_files = {"xml": _uncached_files}
+
         if not pipeline.is_local():
             downloaded_files = dl_manager.ship_files_with_pipeline(downloaded_files, pipeline)
 
         return [
             datasets.SplitGenerator(  # pylint:disable=g-complex-comprehension
-                name=datasets.Split.TRAIN, gen_kwargs={"filepaths": downloaded_files["xml"], "language": lang}
+                name=datasets.Split.TRAIN,
+                gen_kwargs={"filepaths": downloaded_files["xml"], "language": lang, "zstd_frame_groups": zstd_frame_groups}
             )
         ]
 
-    def _build_pcollection(self, pipeline, filepaths, language):
+    def _build_pcollection(self, pipeline, filepaths, language, zstd_frame_groups=()):
         """Build PCollection of examples in the raw (text) form."""
         import apache_beam as beam
         import mwparserfromhell
 
+        with_metadata = self.config.with_metadata
+
+        def _inc_counter(name, value=1):
+            beam.metrics.Metrics.counter(language, name).inc(value)
+
         def _extract_content(filepath):
             """Extracts article content from a single WikiMedia XML file."""
             logger.info("generating examples from = %s", filepath)
             with beam.io.filesystems.FileSystems.open(filepath) as f:
-                f = bz2.BZ2File(filename=f)
-                # Workaround due to: https://github.com/tensorflow/tensorflow/issues/33563
-                utf_f = codecs.getreader("utf-8")(f)
-                context = etree.iterparse(utf_f, events=("end",))
-                for _unused_event, elem in context:
-                    if not elem.tag.endswith("page"):
-                        continue
-                    namespace = elem.tag[:-4]
-                    title = elem.find(f"./{namespace}title").text
-                    ns = elem.find(f"./{namespace}ns").text
-                    id_ = elem.find(f"./{namespace}id").text
-                    red_ = elem.find(f"./{namespace}redirect")
-
-                    # Filter pages that are not in the "main" namespace.
-                    if ns != "0":
-                        elem.clear()
-                        continue
-
-                    raw_content = elem.find(f"./{namespace}revision/{namespace}text").text
-                    elem.clear()
-
-                    # Filter redirects.
-                    if raw_content is None or red_ is not None:
-                        beam.metrics.Metrics.counter(language, "filtered-redirects").inc()
-                        continue
-
-                    beam.metrics.Metrics.counter(language, "extracted-examples").inc()
-                    yield (id_, title, raw_content)
+                yield from _extract_raw_pages(f, inc_counter=_inc_counter)
+
+        def _extract_zstd_frames(frame_group):
+            """Extracts article content from a group of frames of a zstd cache file."""
+            cache_path, frames = frame_group
+            logger.info("generating examples from = %s (%d frame(s) from offset %d)", cache_path, len(frames), frames[0]["offset"])
+            yield from _extract_raw_pages_from_zstd_frames(cache_path, frames, inc_counter=_inc_counter)
 
         def _clean_content(inputs, language):
             """Cleans raw wikicode to extract text."""
-            id_, title, raw_content = inputs
-            try:
-                text = _parse_and_clean_wikicode(raw_content, parser=mwparserfromhell, language=language)
-            except (mwparserfromhell.parser.ParserError) as e:
-                beam.metrics.Metrics.counter(language, "parser-error").inc()
-                logger.error("mwparserfromhell ParseError: %s", e)
-                return
-
-            if not text:
-                beam.metrics.Metrics.counter(language, "empty-clean-examples").inc()
-                return
-
-            url = _construct_url(title, language)
-
-            beam.metrics.Metrics.counter(language, "cleaned-examples").inc()
-
-            yield id_, {"id": id_, "url": url, "title": title, "text": text}
+            example = _clean_raw_page(inputs, parser=mwparserfromhell, language=language, inc_counter=_inc_counter,
+                                      with_metadata=with_metadata)
+            if example is not None:
+                yield example["id"], example
+
+        raw_pages = pipeline | "Initialize" >> beam.Create(filepaths) | "Extract content" >> beam.FlatMap(_extract_content)
+        if len(zstd_frame_groups) > 0:
+            raw_pages = (
+                (
+                    raw_pages,
+                    pipeline
+                    | "Initialize zstd frames" >> beam.Create(zstd_frame_groups)
+                    | "Reshuffle zstd frames" >> beam.transforms.Reshuffle()
+                    | "Extract zstd content" >> beam.FlatMap(_extract_zstd_frames),
+                )
+                | "Merge content" >> beam.Flatten()
+            )
 
         return (
-            pipeline
-            | "Initialize" >> beam.Create(filepaths)
-            | "Extract content" >> beam.FlatMap(_extract_content)
+            raw_pages
             | "Distribute" >> beam.transforms.Reshuffle()
             | "Clean content" >> beam.FlatMap(_clean_content, language=language)
         )
 
 
+def _is_local_dump_source(dump_source):
+    return dump_source is not None and "://" not in dump_source
+
+
+def _base_url(lang, date, dump_source=None):
+    if dump_source is None:
+        url_tmpl = _BASE_URL_TMPL
+    elif "{lang}" in dump_source:
+        url_tmpl = dump_source
+    else:
+        url_tmpl = dump_source.rstrip("/") + "/{lang}wiki/{date}/"
+    return url_tmpl.format(lang=lang.replace("-", "_"), date=date)
+
+
+def get_multistream_dump_info(lang, date, dl_manager, dump_source=None):
+    """Fetches `dumpstatus.json` of a language dump and returns its base URL and multistream job info."""
+    base_url = _base_url(lang, date, dump_source)
+    info_url = base_url + _INFO_FILE
+    if _is_local_dump_source(dump_source):
+        info_path = info_url
+    else:
+        # Use dictionary since testing mock always returns the same result.
+        info_path = dl_manager.download_and_extract({"info": info_url})["info"]
+
+    with open(info_path, encoding="utf-8") as f:
+        dump_info = json.load(f)
+    multistream_dump_info = dump_info["jobs"]["articlesmultistreamdump"]
+    assert (
+        multistream_dump_info["status"] == "done"
+    ), "Specified dump (%s) multistream status is not 'done': %s" % (
+        base_url,
+        multistream_dump_info["status"],
+    )
+    return base_url, multistream_dump_info
+
+
+def get_multistream_xml_size(multistream_dump_info):
+    """Returns total bytes of the compressed XML files listed in a multistream job info."""
+    return sum(info["size"] for fname, info in multistream_dump_info["files"].items() if ".xml" in fname)
+
+
+def _get_expected_checksum(info):
+    for algo in ("sha1", "md5"):
+        if info.get(algo):
+            return algo, info[algo]
+    return None, None
+
+
+def _download_file_with_checksum(url, path, info, max_retries=3, chunk_size=1 << 20, timeout=60, backoff=2.0):
+    """Downloads a file into `path`, resuming `path.incomplete` by HTTP range requests and hashing the
+    bytes while streaming. Retries on network errors and restarts from scratch on checksum mismatch."""
+    algo, expected_checksum = _get_expected_checksum(info)
+    expected_size = info.get("size")
+    marker_path = path + ".verified"
+    partial_path = path + ".incomplete"
+
+    # the marker holds the checksum verified on the previous run, so warm reruns don't re-hash the file
+    if os.path.exists(path) and os.path.exists(marker_path):
+        with open(marker_path) as f:
+            if f.read().strip() == f"{algo}:{expected_checksum}" and os.path.getsize(path) == expected_size:
+                logger.info("file %s has been downloaded and verified, skipping", path)
+                return path
+
+    for attempt in range(1, max_retries + 1):
+        hasher = hashlib.new(algo) if algo is not None else None
+        # re-hash the already downloaded bytes, so the checksum covers the whole file when resumed
+        offset = 0
+        if os.path.exists(partial_path):
+            with open(partial_path, "rb") as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    offset += len(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+
+        try:
+            if expected_size is None or offset < expected_size:
+                request = urllib.request.Request(url, headers={"Range": f"bytes={offset}-"} if offset > 0 else {})
+                with urllib.request.urlopen(request, timeout=timeout) as resp:
+                    if offset > 0 and resp.status != 206:
+                        # the server ignores the range, so restart from scratch
+                        logger.info("server doesn't support resuming %s, restarting the download", url)
+                        offset, hasher = 0, hashlib.new(algo) if algo is not None else None
+                    with open(partial_path, "ab" if offset > 0 else "wb") as f:
+                        for chunk in iter(lambda: resp.read(chunk_size), b""):
+                            f.write(chunk)
+                            if hasher is not None:
+                                hasher.update(chunk)
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning("download of %s failed on attempt %d: %s", url, attempt, e)
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * attempt)
+            continue
+
+        _size = os.path.getsize(partial_path)
+        if expected_size is not None and _size < expected_size:
+            logger.warning("download of %s is incomplete (%d of %d bytes) on attempt %d", url, _size, expected_size, attempt)
+            continue
+        if (expected_size is not None and _size != expected_size) or \
+                (hasher is not None and hasher.hexdigest() != expected_checksum):
+            logger.warning("checksum mismatch of %s on attempt %d, restarting the download", url, attempt)
+            os.remove(partial_path)
+            continue
+
+        os.replace(partial_path, path)
+        with open(marker_path, "w") as f:
+            f.write(f"{algo}:{expected_checksum}")
+        return path
+
+    raise IOError(f"Failed to download {url} with a matching checksum after {max_retries} attempts!")
+
+
+def download_dump_files(file_infos, base_url, cache_dir, num_workers=2, **kwargs):
+    """Downloads dump files concurrently on a bounded pool of connections, verifying each file against
+    its `dumpstatus.json` checksum while streaming.
+
+    Note that dumps.wikimedia.org only allows a few concurrent connections per client.
+
+    Args:
+      file_infos: dict of file name to its `dumpstatus.json` info (size, sha1/md5).
+      base_url: base URL of the dump files.
+      cache_dir: dir to download the files into.
+      num_workers: number of concurrent connections.
+      **kwargs: keyword arguments forwarded to `_download_file_with_checksum`.
+
+    Returns:
+      dict of file name to its local path.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            fname: executor.submit(_download_file_with_checksum, base_url + fname, os.path.join(cache_dir, fname), info, **kwargs)
+            for fname, info in file_infos.items()
+        }
+        return {fname: future.result() for fname, future in futures.items()}
+
+
+def _multistream_index_file_name(xml_fname):
+    # e.g. "idwiki-20231101-pages-articles-multistream1.xml-p1p100.bz2"
+    # into "idwiki-20231101-pages-articles-multistream-index1.txt-p1p100.bz2"
+    return xml_fname.replace("multistream", "multistream-index", 1).replace(".xml", ".txt", 1)
+
+
+def iter_multistream_index(index_path):
+    """Yields (stream offset, page id, title) of each line of a bz2 multistream index file."""
+    with bz2.open(index_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            # titles may contain ":" as well
+            offset, id_, title = line.rstrip("\n").split(":", 2)
+            yield int(offset), id_, title
+
+
+def get_multistream_stream_ranges(index_path, xml_size):
+    """Returns sorted (start, end) byte ranges of the bz2 streams of a multistream XML file.
+
+    The last range goes until the end of the file, so it also holds the closing `</mediawiki>` stream.
+    """
+    offsets = sorted({offset for offset, _, _ in iter_multistream_index(index_path)})
+    return list(zip(offsets, offsets[1:] + [xml_size]))
+
+
+def _read_byte_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _noop_counter(name, value=1):
+    pass
+
+
+_PAGE_START_TAG, _PAGE_END_TAG = b"<page>", b"</page>"
+_NS_START_TAG, _NS_END_TAG = b"<ns>", b"</ns>"
+_REDIRECT_MARKER = b"<redirect"
+# target of a redirect, as in `<redirect title="Target" />`, and title of a page, both XML-escaped
+_RE_REDIRECT_TITLE = re.compile(rb'<redirect title="([^"]*)"')
+_RE_PAGE_TITLE = re.compile(rb"<title>([^<]*)</title>")
+
+
+def _iter_page_bytes(chunks):
+    """Yields the raw bytes of every `<page>...</page>` element of the decompressed chunks of a WikiMedia XML stream."""
+    buf = bytearray()
+    # position to resume searching the end tag of a page spanning multiple chunks
+    search_end_from = 0
+    for chunk in chunks:
+        buf += chunk
+        pos = 0
+        while True:
+            page_start = buf.find(_PAGE_START_TAG, pos)
+            if page_start == -1:
+                # keep the tail that may hold a partial start tag
+                pos = max(pos, len(buf) - len(_PAGE_START_TAG) + 1)
+                search_end_from = 0
+                break
+            page_end = buf.find(_PAGE_END_TAG, max(page_start, search_end_from))
+            if page_end == -1:
+                pos = page_start
+                search_end_from = max(page_start, len(buf) - len(_PAGE_END_TAG) + 1)
+                break
+            page_end += len(_PAGE_END_TAG)
+            yield bytes(buf[page_start:page_end])
+            pos, search_end_from = page_end, 0
+        if search_end_from:
+            search_end_from -= pos
+        del buf[:pos]
+
+
+def _extract_raw_pages(fileobj, inc_counter=_noop_counter, on_redirect=None):
+    """Yields (id, title, raw_content) of main namespace, non-redirect pages from a bz2 WikiMedia XML file object.
+
+    Page boundaries, `<ns>` and `<redirect` markers are scanned on the decompressed bytes, so pages outside
+    the main namespace and redirects are skipped without being decoded nor XML-parsed. This is safe since
+    the markup within `<text>` is always escaped in the dumps. If `on_redirect` fn is given, it's called with
+    (redirect title, target title) of every main namespace redirect, read from the same scanned bytes.
+    """
+    f = bz2.BZ2File(filename=fileobj)
+    yield from _filter_raw_pages(_iter_page_bytes(iter(lambda: f.read(1 << 20), b"")), inc_counter=inc_counter,
+                                 on_redirect=on_redirect)
+
+
+def _get_redirect_titles(page):
+    """Returns (title, target title) of the raw bytes of a redirect page, or None if either one isn't found."""
+    title, target = _RE_PAGE_TITLE.search(page), _RE_REDIRECT_TITLE.search(page)
+    if title is None or target is None:
+        return None
+    return html.unescape(title.group(1).decode("utf-8")), html.unescape(target.group(1).decode("utf-8"))
+
+
+def _filter_raw_pages(pages, inc_counter=_noop_counter, on_redirect=None):
+    """Yields (id, title, raw_content) of the main namespace, non-redirect pages out of raw `<page>` bytes."""
+    for page in pages:
+        ns_start = page.find(_NS_START_TAG)
+        ns = page[ns_start + len(_NS_START_TAG):page.find(_NS_END_TAG, ns_start)]
+
+        # Filter pages that are not in the "main" namespace.
+        if ns != b"0":
+            continue
+
+        # Filter redirects.
+        if _REDIRECT_MARKER in page:
+            inc_counter("filtered-redirects")
+            if on_redirect is not None:
+                redirect_titles = _get_redirect_titles(page)
+                if redirect_titles is not None:
+                    inc_counter("extracted-redirects")
+                    on_redirect(*redirect_titles)
+            continue
+
+        elem = etree.fromstring(page)
+        title = elem.find("./title").text
+        id_ = elem.find("./id").text
+        raw_content = elem.find("./revision/text").text
+
+        # Filter pages with empty content, counted as redirects as well.
+        if raw_content is None:
+            inc_counter("filtered-redirects")
+            continue
+
+        inc_counter("extracted-examples")
+        yield (id_, title, raw_content)
+
+
+# uncompressed bytes of a zstd cache frame, the unit of seeking & parallel reads of the cache
+_ZSTD_FRAME_SIZE = 16 << 20
+_ZSTD_CACHE_VERSION = 1
+
+
+def _import_zstandard():
+    """Returns the `zstandard` module, or None if it isn't installed (the zstd cache is optional)."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def get_default_zstd_cache_dir():
+    """Dir of the zstd cache in the datasets cache, next to the downloaded dumps."""
+    return os.path.join(datasets.config.DOWNLOADED_DATASETS_PATH, "wikipedia_zstd_cache")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_file_checksum(path, size, mtime_ns):
+    # size & mtime are only part of the cache key, so a rewritten file (e.g. re-splitted) is hashed again
+    marker_path = path + ".verified"
+    if os.path.exists(marker_path) and os.stat(marker_path).st_mtime_ns >= mtime_ns:
+        # the checksum verified by `download_dump_files`, so the dump isn't re-hashed
+        with open(marker_path) as f:
+            algo, checksum = f.read().strip().split(":", 1)
+        if algo != "None":
+            return f"{algo}:{checksum}"
+    hasher = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return f"sha1:{hasher.hexdigest()}"
+
+
+def get_source_checksum(path):
+    """Returns `{algo}:{checksum}` of a dump file, hashed once per process for the same file size & mtime."""
+    stat = os.stat(path)
+    return _get_file_checksum(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def _zstd_cache_paths(cache_dir, checksum):
+    _name = checksum.replace(":", "-")
+    return os.path.join(cache_dir, f"{_name}.xml.zst"), os.path.join(cache_dir, f"{_name}.index.json")
+
+
+def get_zstd_cache_index(source_path, cache_dir):
+    """Returns the frame index of the zstd cache of a bz2 dump file, or None if it isn't cached (yet).
+
+    The cache is looked up by the checksum of the source file, so a changed source never reads a stale cache.
+    """
+    cache_path, index_path = _zstd_cache_paths(cache_dir, get_source_checksum(source_path))
+    if not os.path.exists(index_path) or not os.path.exists(cache_path):
+        return None
+    with open(index_path, encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != _ZSTD_CACHE_VERSION:
+        return None
+    index["cache_path"] = cache_path
+    return index
+
+
+def transcode_to_zstd_cache(source_path, cache_dir, level=3, frame_size=_ZSTD_FRAME_SIZE, chunk_size=1 << 20):
+    """Transcodes a bz2 WikiMedia XML file into a zstd cache of independently decompressible frames.
+
+    Each frame holds about `frame_size` uncompressed bytes and is cut right after a `</page>`, so every frame
+    holds whole pages only and a range of frames can be read on its own. The frame offsets are kept in a JSON
+    index next to the cache, written last so an interrupted transcode is redone on the next run.
+
+    Args:
+      source_path: path of the (splitted) bz2 WikiMedia XML file.
+      cache_dir: dir of the zstd cache files, named by the checksum of their source.
+      level: zstd compression level.
+      frame_size: uncompressed bytes of a frame.
+
+    Returns:
+      the frame index, or None if `zstandard` isn't installed.
+    """
+    zstandard = _import_zstandard()
+    if zstandard is None:
+        return None
+    index = get_zstd_cache_index(source_path, cache_dir)
+    if index is not None:
+        logger.info("zstd cache of %s is found, skipping", source_path)
+        return index
+
+    checksum = get_source_checksum(source_path)
+    cache_path, index_path = _zstd_cache_paths(cache_dir, checksum)
+    os.makedirs(cache_dir, exist_ok=True)
+    compressor = zstandard.ZstdCompressor(level=level, write_content_size=True, write_checksum=True)
+    frames, offset, buf = [], 0, bytearray()
+
+    logger.info("transcoding %s into zstd cache %s", source_path, cache_path)
+    with bz2.BZ2File(source_path) as src, open(cache_path + ".incomplete", "wb") as dst:
+
+        def _write_frame(data):
+            nonlocal offset
+            compressed = compressor.compress(data)
+            dst.write(compressed)
+            frames.append({"offset": offset, "size": len(compressed), "uncompressed_size": len(data)})
+            offset += len(compressed)
+
+        for chunk in iter(lambda: src.read(chunk_size), b""):
+            buf += chunk
+            if len(buf) < frame_size:
+                continue
+            cut = buf.rfind(_PAGE_END_TAG)
+            # a page larger than a frame is kept whole, so the frame grows until its end tag
+            if cut != -1:
+                cut += len(_PAGE_END_TAG)
+                _write_frame(bytes(buf[:cut]))
+                del buf[:cut]
+        if len(buf) > 0:
+            _write_frame(bytes(buf))
+    os.replace(cache_path + ".incomplete", cache_path)
+
+    index = {
+        "version": _ZSTD_CACHE_VERSION,
+        "source": os.path.basename(source_path),
+        "checksum": checksum,
+        "level": level,
+        "frames": frames,
+    }
+    with open(index_path + ".incomplete", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".incomplete", index_path)
+    logger.info("transcoded %s into %d zstd frame(s) of %d bytes", source_path, len(frames), offset)
+
+    index["cache_path"] = cache_path
+    return index
+
+
+def create_zstd_caches(source_paths, cache_dir, num_workers=1, level=3):
+    """Transcodes the bz2 dump files (not cached yet) into zstd caches concurrently, see `transcode_to_zstd_cache`.
+
+    Returns:
+      dict of source path to its frame index, which is None for all of them if `zstandard` isn't installed.
+    """
+    if _import_zstandard() is None:
+        logger.warning("zstandard isn't installed, the dumps are read from their bz2 files instead of the zstd cache")
+        return {path: None for path in source_paths}
+    # bz2 & zstd release the GIL, so the files are transcoded on threads
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {path: executor.submit(transcode_to_zstd_cache, path, cache_dir, level=level) for path in source_paths}
+        return {path: future.result() for path, future in futures.items()}
+
+
+def get_zstd_frame_groups(index, frames_per_group=4):
+    """Splits the frames of a zstd cache index into (cache path, frames) groups, each one readable on its own."""
+    frames = index["frames"]
+    return [(index["cache_path"], frames[idx:idx + frames_per_group]) for idx in range(0, len(frames), frames_per_group)]
+
+
+def _iter_zstd_frames(cache_path, frames):
+    """Yields the decompressed bytes of each of the given frames of a zstd cache file, seeking to each one."""
+    decompressor = _import_zstandard().ZstdDecompressor()
+    with open(cache_path, "rb") as f:
+        for frame in frames:
+            f.seek(frame["offset"])
+            yield decompressor.decompress(f.read(frame["size"]))
+
+
+def _extract_raw_pages_from_zstd_frames(cache_path, frames, inc_counter=_noop_counter, on_redirect=None):
+    """Yields (id, title, raw_content) of the given frames of a zstd cache file, as `_extract_raw_pages`."""
+    yield from _filter_raw_pages(_iter_page_bytes(_iter_zstd_frames(cache_path, frames)), inc_counter=inc_counter,
+                                 on_redirect=on_redirect)
+
+
+def iter_raw_pages_from_file(filepath, inc_counter=_noop_counter, zstd_cache_dir=None, on_redirect=None):
+    """Yields (id, title, raw_content) of a bz2 WikiMedia XML file, read from its zstd cache if there is one.
+
+    Args:
+      filepath: path of the (splitted) bz2 WikiMedia XML file.
+      inc_counter: optional fn of `(name, value=1)` to collect the same counts as the Beam metrics.
+      zstd_cache_dir: dir of the zstd cache (see `create_zstd_caches`), the bz2 file is read if None,
+        if it isn't cached or if `zstandard` isn't installed.
+      on_redirect: optional fn called with (redirect title, target title) of every main namespace redirect.
+    """
+    index = None
+    if zstd_cache_dir is not None and _import_zstandard() is not None:
+        index = get_zstd_cache_index(filepath, zstd_cache_dir)
+    if index is not None:
+        inc_counter("zstd-cache-hits")
+        yield from _extract_raw_pages_from_zstd_frames(index["cache_path"], index["frames"], inc_counter=inc_counter,
+                                                       on_redirect=on_redirect)
+    else:
+        with open(filepath, "rb") as f:
+            yield from _extract_raw_pages(f, inc_counter=inc_counter, on_redirect=on_redirect)
+
+
+def _clean_raw_page(inputs, parser, language, inc_counter=_noop_counter, with_metadata=False):
+    """Cleans raw wikicode of a page into an example, returns None if the page is filtered out.
+
+    The example has the `_METADATA_COLNAMES` columns as well if `with_metadata` is set.
+    """
+    id_, title, raw_content = inputs
+    metadata = {} if with_metadata else None
+    _start_time = time.perf_counter()
+    try:
+        text = _parse_and_clean_wikicode(raw_content, parser=parser, language=language, metadata=metadata)
+    except (parser.parser.ParserError) as e:
+        inc_counter("parser-error")
+        logger.error("mwparserfromhell ParseError: %s", e)
+        return None
+    finally:
+        inc_counter("parser-microseconds", int((time.perf_counter() - _start_time) * 1e6))
+
+    if not text:
+        inc_counter("empty-clean-examples")
+        return None
+
+    url = _construct_url(title, language)
+
+    inc_counter("cleaned-examples")
+
+    example = {"id": id_, "url": url, "title": title, "text": text}
+    if with_metadata:
+        example.update(metadata)
+    return example
+
+
+def _clean_raw_page_fallback(inputs, language, inc_counter=_noop_counter, with_metadata=False):
+    """Cleans raw wikicode of a page with the regex-based `_fallback_clean_wikicode`, as `_clean_raw_page`.
+
+    The fallback doesn't collect the metadata, so its `_METADATA_COLNAMES` columns are None if `with_metadata` is set.
+    """
+    id_, title, raw_content = inputs
+    text = _fallback_clean_wikicode(raw_content, language=language)
+
+    if not text:
+        inc_counter("empty-clean-examples")
+        return None
+
+    inc_counter("fallback-cleaned-examples")
+
+    example = {"id": id_, "url": _construct_url(title, language), "title": title, "text": text}
+    if with_metadata:
+        example.update({colname: None for colname in _METADATA_COLNAMES})
+    return example
+
+
 def split_bz2_files(downloaded_files_dict:dict, is_split_xml_identifier:bool, 
                     desired_uncompressed_filesize_per_split:int, force_rerun: bool=False):
     assert len(downloaded_files_dict.keys())==1, "Unexpected format of arg `downloaded_files_dict`!"
@@ -1167,6 +1853,8 @@ def split_bz2_files(downloaded_files_dict:dict, is_split_xml_identifier:bool,
 
         #check if the file isn't closed yet
         _close_and_add_closing_tag(chunk_file, is_expected_to_be_opened=False)
+        # the last chunk holds the remaining pages up to the source closing tag
+        split_filename.append(chunk_file_name)
 
         return split_filename
 
@@ -1197,16 +1885,39 @@ def split_bz2_files(downloaded_files_dict:dict, is_split_xml_identifier:bool,
     return {dict_key: new_filename_collection}
 
 
-def _parse_and_clean_wikicode(raw_content, parser, language):
-    """Strips formatting and unwanted sections from raw page content."""
-    wikicode = parser.parse(raw_content)
+# Filters for magic words that are parser instructions -- e.g., __NOTOC__
+_RE_RM_MAGIC = re.compile("__[A-Z]*__", flags=re.UNICODE)
 
-    # Filters for magic words that are parser instructions -- e.g., __NOTOC__
-    re_rm_magic = re.compile("__[A-Z]*__", flags=re.UNICODE)
 
-    # Filters for file/image links.
+@functools.lru_cache(maxsize=None)
+def _get_media_link_regex(language):
+    """Compiled regex of file/image link prefixes of a language, built once per language."""
     media_prefixes = "|".join(["File", "Image", "Media"] + MEDIA_ALIASES.get(language, []))
-    re_rm_wikilink = re.compile(f"^(?:{media_prefixes}):", flags=re.IGNORECASE | re.UNICODE)
+    return re.compile(f"^(?:{media_prefixes}):", flags=re.IGNORECASE | re.UNICODE)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_category_link_regex(language):
+    """Compiled regex of category link prefixes of a language, built once per language."""
+    cat_prefixes = "|".join(["Category"] + CAT_ALIASES.get(language, []))
+    return re.compile(f"^(?:{cat_prefixes}):", flags=re.IGNORECASE | re.UNICODE)
+
+
+# Optional columns of the page metadata collected along the cleaning, see `_parse_and_clean_wikicode`
+_METADATA_COLNAMES = ["categories", "headings", "num_outlinks", "num_media_links"]
+
+
+def _parse_and_clean_wikicode(raw_content, parser, language, metadata=None):
+    """Strips formatting and unwanted sections from raw page content.
+
+    If `metadata` dict is given, it's filled along the same pass with the category names, the headings
+    (title, level and char offset of their section in the returned text) and the counts of the links
+    to other pages & of the removed media links.
+    """
+    wikicode = parser.parse(raw_content)
+
+    # Filters for file/image links.
+    re_rm_wikilink = _get_media_link_regex(language)
 
     def rm_wikilink(obj):
         return bool(re_rm_wikilink.match(str(obj.title)))
@@ -1216,8 +1927,7 @@ def _parse_and_clean_wikicode(raw_content, parser, language):
         return str(obj.tag) in {"ref", "table"}
 
     # Leave category links in-place but remove the category prefixes
-    cat_prefixes = "|".join(["Category"] + CAT_ALIASES.get(language, []))
-    re_clean_wikilink = re.compile(f"^(?:{cat_prefixes}):", flags=re.IGNORECASE | re.UNICODE)
+    re_clean_wikilink = _get_category_link_regex(language)
 
     def is_category(obj):
         return bool(re_clean_wikilink.match(str(obj.title)))
@@ -1242,17 +1952,146 @@ def _parse_and_clean_wikicode(raw_content, parser, language):
             pass
 
     section_text = []
+    categories, headings, num_outlinks, num_media_links = [], [], 0, 0
+    # char offset of the next section in the joined text
+    offset = 0
     # Filter individual sections to clean.
     for section in wikicode.get_sections(flat=True, include_lead=True, include_headings=True):
         for obj in section.ifilter_wikilinks(recursive=True):
             if rm_wikilink(obj):
                 try_remove_obj(obj, section)
+                num_media_links += 1
             elif is_category(obj):
+                if metadata is not None:
+                    categories.append(re.sub(re_clean_wikilink, "", str(obj.title)).strip())
                 try_replace_obj(obj)
+            else:
+                num_outlinks += 1
         for obj in section.ifilter_tags(matches=rm_tag, recursive=True):
             try_remove_obj(obj, section)
 
-        section_text.append(re.sub(re_rm_magic, "", section.strip_code().strip()))
+        section_text.append(re.sub(_RE_RM_MAGIC, "", section.strip_code().strip()))
+        # a flat section other than the lead starts with its heading
+        if metadata is not None and section.nodes and isinstance(section.nodes[0], parser.nodes.Heading):
+            heading = section.nodes[0]
+            headings.append({"title": heading.title.strip_code().strip(), "level": heading.level, "offset": offset})
+        offset += len(section_text[-1]) + 2
+
+    if metadata is not None:
+        # the lists are JSON-encoded, so the columns are flat strings in the CSVs and the record batches
+        metadata["categories"] = json.dumps(list(dict.fromkeys(categories)), ensure_ascii=False)
+        metadata["headings"] = json.dumps(headings, ensure_ascii=False)
+        metadata["num_outlinks"] = num_outlinks
+        metadata["num_media_links"] = num_media_links
+    return "\n\n".join(section_text)
+
+
+# Rough parse cost (in chars of plain text) of each template & table, whose nesting dominates the parse time
+_TEMPLATE_PARSE_COST = 100
+_TABLE_PARSE_COST = 1000
+
+
+def estimate_parse_cost(raw_content):
+    """Estimates the `_parse_and_clean_wikicode` cost of raw page content from cheap features.
+
+    Used to schedule the pathological pages (huge lists, deeply nested templates, giant tables) apart from
+    the rest, the cost is in chars of plain text: content length plus a fixed cost of every template & table.
+    """
+    return (len(raw_content) + _TEMPLATE_PARSE_COST * raw_content.count("{{")
+            + _TABLE_PARSE_COST * raw_content.count("{|"))
+
+
+_RE_NESTED_TEMPLATE = re.compile(r"\{\{|\}\}")
+_RE_NESTED_TABLE = re.compile(r"\{\||\|\}")
+_RE_COMMENT = re.compile(r"<!--.*?(?:-->|$)", flags=re.DOTALL)
+_RE_RM_TAG_DELIMITER = re.compile(r"<(/?)(ref|table)\b[^>]*?(/?)>", flags=re.IGNORECASE)
+_RE_HTML_TAG = re.compile(r"</?[a-zA-Z][^>]*>")
+_RE_INNERMOST_WIKILINK = re.compile(r"\[\[([^\[\]]*)\]\]")
+_RE_EXTERNAL_LINK = re.compile(r"\[(?:[a-zA-Z][a-zA-Z0-9+.-]*:)?//[^\s\]]*(?:\s+([^\]]*))?\]")
+_RE_BOLD_ITALIC = re.compile(r"'{2,}")
+_RE_HEADING = re.compile(r"^=+([^\n]*?)=+[ \t]*$", flags=re.MULTILINE)
+
+
+def _strip_nested(text, re_delimiters, open_delimiter):
+    """Removes the (possibly nested) spans of text enclosed by delimiters, e.g. templates, in one pass.
+
+    An unclosed span is kept as text, as mwparserfromhell does.
+    """
+    parts, depth, start, span_start = [], 0, 0, 0
+    for match in re_delimiters.finditer(text):
+        if match.group() == open_delimiter:
+            if depth == 0:
+                parts.append(text[start:match.start()])
+                span_start = match.start()
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                start = match.end()
+    parts.append(text[span_start if depth > 0 else start:])
+    return "".join(parts)
+
+
+def _strip_tags(text, re_delimiters):
+    """Removes the self-closing tags and the spans up to the next closing tag of the same name, in one pass.
+
+    An opening tag without any closing tag after it is kept as text (and left to the HTML tag removal),
+    as `_parse_and_clean_wikicode` keeps the unclosed tags.
+    """
+    matches = list(re_delimiters.finditer(text))
+    last_close_start = {match.group(2).lower(): match.start() for match in matches if match.group(1)}
+    parts, start, open_name = [], 0, None
+    for match in matches:
+        is_close, name, is_self_closing = bool(match.group(1)), match.group(2).lower(), bool(match.group(3))
+        if open_name is not None:
+            if is_close and name == open_name:
+                start, open_name = match.end(), None
+        elif is_self_closing and not is_close:
+            parts.append(text[start:match.start()])
+            start = match.end()
+        elif not is_close and last_close_start.get(name, -1) > match.start():
+            parts.append(text[start:match.start()])
+            open_name = name
+    parts.append(text[start:])
+    return "".join(parts)
+
+
+def _fallback_clean_wikicode(raw_content, language):
+    """Regex-based approximation of `_parse_and_clean_wikicode`, linear in the content length.
+
+    Used on the pages exceeding their parse time budget. It strips the same markup (templates, tables, refs,
+    file links, formatting, magic words & heading markup, keeping the heading titles) without building the
+    wikicode tree, so its output may differ slightly from mwparserfromhell on malformed markup.
+    """
+    re_rm_wikilink = _get_media_link_regex(language)
+    re_clean_wikilink = _get_category_link_regex(language)
+
+    def clean_wikilink(match):
+        target, _, label = match.group(1).partition("|")
+        if re_rm_wikilink.match(target.strip()):
+            return ""
+        text = label if label else target
+        if re_clean_wikilink.match(target.strip()):
+            text = re.sub(re_clean_wikilink, "", text.strip())
+        return text
+
+    text = _RE_COMMENT.sub("", raw_content)
+    text = _strip_nested(text, _RE_NESTED_TEMPLATE, "{{")
+    text = _strip_nested(text, _RE_NESTED_TABLE, "{|")
+    text = _strip_tags(text, _RE_RM_TAG_DELIMITER)
+    text = _RE_HTML_TAG.sub("", text)
+    # inner links (e.g. within file captions) are resolved first
+    n_subs = 1
+    while n_subs:
+        text, n_subs = _RE_INNERMOST_WIKILINK.subn(clean_wikilink, text)
+    text = _RE_EXTERNAL_LINK.sub(lambda match: match.group(1) or "", text)
+    text = _RE_BOLD_ITALIC.sub("", text)
+    text = html.unescape(text)
+
+    # split into the lead, then (heading title, section body) pairs, the heading title is kept as `strip_code` does
+    splits = _RE_HEADING.split(text)
+    sections = [splits[0]] + [title + body for title, body in zip(splits[1::2], splits[2::2])]
+    section_text = [re.sub(_RE_RM_MAGIC, "", section.strip()) for section in sections]
     return "\n\n".join(section_text)
 
 
@@ -0,0 +1,344 @@
+'''
+Shared-memory record batches between the page reader and the cleaning worker processes
+-------------------
+The raw pages read from a (splitted) dump file are packed Arrow-style into one `multiprocessing.shared_memory`
+block per batch: for every column, int64 offsets of its rows into one contiguous UTF-8 buffer plus a null mask.
+Only the small handle of the block (its name & layout) is pickled to the workers, and the cleaned examples
+come back the same way, so there's no per-record pickling between the processes.
+The pages of high estimated parse cost (see `estimate_parse_cost`) are cleaned one by one on dedicated workers
+with a time budget per page, so a few pathological pages don't hold the tail of a split: each of them is parsed
+on its own process, killed once the budget is exceeded, and the page is cleaned by the regex-based fallback
+cleaner instead.
+Usage example:
+    for example in iter_cleaned_examples(splitted_file, language="id", num_proc=8):
+        ...
+'''
+
+import os
+import time
+import logging
+import contextlib
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from sea_loader_batched.wiki_loader import iter_raw_pages_from_file, _noop_counter, estimate_parse_cost, _METADATA_COLNAMES
+
+
+_EXAMPLE_COLNAMES = ["id", "url", "title", "text"]
+#metadata columns of int values, carried as str in the record batches
+_METADATA_COUNT_COLNAMES = ["num_outlinks", "num_media_links"]
+#max number of (finished or not) batches held per worker, to bound the results queued behind a slow heavy page
+_MAX_PENDING_BATCHES_PER_PROC = 8
+
+
+def _align(pos: int, alignment: int=8):
+    return -(-pos // alignment) * alignment
+
+
+class SharedRecordBatch:
+    '''
+    Columns of nullable strings packed into one shared memory block
+
+    Parameters
+    ----------
+    shm: `multiprocessing.shared_memory.SharedMemory` holding the batch
+    handle: picklable tuple of the block name, number of rows and layout of each column
+    '''
+    def __init__(self, shm, handle: tuple):
+        self._shm = shm
+        self.handle = handle
+
+    @property
+    def num_rows(self):
+        return self.handle[1]
+
+    @property
+    def column_names(self):
+        return [layout[0] for layout in self.handle[2]]
+
+    @classmethod
+    def from_columns(cls, columns: dict):
+        '''
+        Pack dict of column name to list of str (or None) of the same length into a new shared memory block
+        '''
+        num_rows = len(next(iter(columns.values()))) if columns else 0
+        encoded, layouts, pos = {}, [], 0
+        for name, values in columns.items():
+            if len(values) != num_rows:
+                raise ValueError(f"Column {name} has {len(values)} rows, expected {num_rows}!")
+            encoded[name] = [b"" if val is None else val.encode("utf-8", errors="surrogatepass") for val in values]
+            offsets_pos = _align(pos)
+            nulls_pos = offsets_pos + (num_rows + 1) * 8
+            data_pos = nulls_pos + num_rows
+            pos = data_pos + sum(map(len, encoded[name]))
+            layouts.append((name, offsets_pos, nulls_pos, data_pos))
+
+        #shared memory block can't be empty
+        shm = shared_memory.SharedMemory(create=True, size=max(pos, 1))
+        for name, offsets_pos, nulls_pos, data_pos in layouts:
+            _encoded = encoded.pop(name)
+            _offsets = np.ndarray(num_rows + 1, dtype=np.int64, buffer=shm.buf, offset=offsets_pos)
+            _offsets[0] = 0
+            np.cumsum(np.fromiter(map(len, _encoded), dtype=np.int64, count=num_rows), out=_offsets[1:])
+            _nulls = np.ndarray(num_rows, dtype=np.uint8, buffer=shm.buf, offset=nulls_pos)
+            _nulls[:] = [val is None for val in columns[name]]
+            _data_len = int(_offsets[-1])
+            shm.buf[data_pos:data_pos + _data_len] = b"".join(_encoded)
+            #views on the buffer have to be released before the block can be closed
+            del _offsets, _nulls
+        return cls(shm, (shm.name, num_rows, tuple(layouts)))
+
+    @classmethod
+    def attach(cls, handle: tuple):
+        return cls(shared_memory.SharedMemory(name=handle[0]), handle)
+
+    def column(self, name: str):
+        '''
+        Get the values of a column as list of str (or None)
+        '''
+        for _name, offsets_pos, nulls_pos, data_pos in self.handle[2]:
+            if _name == name:
+                break
+        else:
+            raise KeyError(f"Column {name} isn't found in the batch!")
+        _offsets = np.ndarray(self.num_rows + 1, dtype=np.int64, buffer=self._shm.buf, offset=offsets_pos)
+        _nulls = np.ndarray(self.num_rows, dtype=np.uint8, buffer=self._shm.buf, offset=nulls_pos)
+        offsets, nulls = _offsets.tolist(), _nulls.tolist()
+        del _offsets, _nulls
+        data = bytes(self._shm.buf[data_pos:data_pos + offsets[-1]])
+        return [None if nulls[idx] else data[offsets[idx]:offsets[idx+1]].decode("utf-8", errors="surrogatepass")
+                for idx in range(self.num_rows)]
+
+    def to_columns(self):
+        return {name: self.column(name) for name in self.column_names}
+
+    def close(self):
+        self._shm.close()
+
+    def unlink(self):
+        #removes the block once every process has closed it
+        self._shm.unlink()
+
+
+def _clean_page_to_pipe(conn, inputs, language, with_metadata: bool=False):
+    #executed on the page process started by `_clean_raw_page_with_time_budget`
+    import mwparserfromhell
+    from sea_loader_batched.wiki_loader import _clean_raw_page
+
+    counters = defaultdict(int)
+    def _inc_counter(name, value=1):
+        counters[name] += value
+
+    example = _clean_raw_page(inputs, parser=mwparserfromhell, language=language, inc_counter=_inc_counter,
+                              with_metadata=with_metadata)
+    conn.send((example, dict(counters)))
+    conn.close()
+
+
+def _get_page_process_context():
+    #forking from the (single-threaded) worker is cheap, the parser & the loader are already imported
+    return multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+
+
+def _clean_raw_page_with_time_budget(inputs, language, time_budget: float, inc_counter, with_metadata: bool=False):
+    #the page is cleaned on its own process, killed once the budget is exceeded, so the budget also holds
+    #within the C tokenizer of mwparserfromhell (which can't be interrupted from Python) and nothing is raised here
+    from sea_loader_batched.wiki_loader import _clean_raw_page_fallback
+
+    _start_time = time.perf_counter()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = _get_page_process_context().Process(target=_clean_page_to_pipe, args=(sender, inputs, language, with_metadata),
+                                                  daemon=True)
+    process.start()
+    sender.close()
+    result, fallback_reason = None, None
+    try:
+        if receiver.poll(time_budget):
+            result = receiver.recv()
+        else:
+            fallback_reason = "timeout"
+    except EOFError:
+        #the page process died without a result (e.g. out of memory or an exception of the parser)
+        fallback_reason = "crash"
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        receiver.close()
+
+    if result is not None:
+        example, counters = result
+        for name, value in counters.items():
+            inc_counter(name, value)
+    else:
+        inc_counter("parser-timeouts" if fallback_reason == "timeout" else "parser-crashes")
+        example = _clean_raw_page_fallback(inputs, language=language, inc_counter=inc_counter, with_metadata=with_metadata)
+    inc_counter("heavy-cleaning-microseconds", int((time.perf_counter() - _start_time) * 1e6))
+    return example, fallback_reason
+
+
+def _clean_record_batch(handle: tuple, language: str, time_budget: float=None, with_metadata: bool=False):
+    #executed on the worker processes
+    import mwparserfromhell
+    from sea_loader_batched.wiki_loader import _clean_raw_page
+
+    counters = defaultdict(int)
+    def _inc_counter(name, value=1):
+        counters[name] += value
+
+    batch = SharedRecordBatch.attach(handle)
+    try:
+        columns = batch.to_columns()
+    finally:
+        batch.close()
+
+    examples, fallback_pages = [], []
+    for inputs in zip(columns["id"], columns["title"], columns["raw_content"]):
+        if time_budget is None:
+            example = _clean_raw_page(inputs, parser=mwparserfromhell, language=language, inc_counter=_inc_counter,
+                                      with_metadata=with_metadata)
+        else:
+            example, fallback_reason = _clean_raw_page_with_time_budget(inputs, language=language, time_budget=time_budget,
+                                                                        inc_counter=_inc_counter, with_metadata=with_metadata)
+            if fallback_reason is not None:
+                fallback_pages.append((inputs[0], inputs[1], len(inputs[2]), fallback_reason))
+        if example is not None:
+            examples.append(example)
+
+    _colnames = _EXAMPLE_COLNAMES + (_METADATA_COLNAMES if with_metadata else [])
+    result_batch = SharedRecordBatch.from_columns(
+        {colname: [None if example[colname] is None else str(example[colname]) for example in examples] for colname in _colnames})
+    result_batch.close()
+    return result_batch.handle, dict(counters), fallback_pages
+
+
+def _release_result(handle: tuple):
+    result_batch = SharedRecordBatch.attach(handle)
+    try:
+        return result_batch.to_columns()
+    finally:
+        result_batch.close()
+        result_batch.unlink()
+
+
+def iter_cleaned_examples(filepath: str, language: str, num_proc: int=None, batch_nbytes: int=8 << 20,
+                          max_batch_size: int=10000, heavy_page_cost: int=None, heavy_num_proc: int=None,
+                          page_time_budget: float=None, zstd_cache_dir: str=None, with_metadata: bool=False,
+                          on_redirect=None, inc_counter=None, logger=None):
+    '''
+    Yield the cleaned examples of a (splitted) bz2 dump file, in the order of the file, with the pages
+    cleaned on `num_proc` worker processes through shared-memory record batches
+
+    Parameters
+    ----------
+    filepath: path of the (splitted) bz2 WikiMedia XML file
+    language: language code used for cleaning
+    num_proc: number of cleaning worker processes (defaults to CPU count)
+    batch_nbytes: max byte size of raw content of a batch
+    max_batch_size: max number of pages of a batch
+    heavy_page_cost: estimated parse cost (see `estimate_parse_cost`) from which a page is cleaned on the
+        dedicated heavy-page workers, all pages are cleaned on the `num_proc` workers if None
+    heavy_num_proc: number of dedicated heavy-page worker processes (defaults to `num_proc`, no dedicated workers if 0)
+    page_time_budget: time budget (in seconds) of cleaning a heavy page on its own process, killed once it's
+        exceeded and the page is cleaned by the fallback cleaner instead, no budget if None
+    zstd_cache_dir: dir of the zstd cache of the dump files (see `create_zstd_caches`), read instead of
+        the bz2 file if it's cached
+    with_metadata: whether to add the page metadata columns (see `_parse_and_clean_wikicode`) to the examples
+    on_redirect: optional fn called with (redirect title, target title) of every redirect, on the reading process
+    inc_counter: optional fn of `(name, value=1)` collecting the counts of the reader and of the workers
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    inc_counter = inc_counter if inc_counter is not None else _noop_counter
+    num_proc = num_proc or os.cpu_count()
+    heavy_num_proc = num_proc if heavy_num_proc is None else heavy_num_proc
+
+    with contextlib.ExitStack() as stack:
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=num_proc))
+        heavy_executor = (stack.enter_context(ProcessPoolExecutor(max_workers=heavy_num_proc))
+                          if heavy_page_cost is not None and heavy_num_proc > 0 else None)
+        #(input batch, future, whether it's a heavy page) in submission order, bounded to keep the memory in check
+        pending = deque()
+
+        def _submit(records, is_heavy=False):
+            batch = SharedRecordBatch.from_columns({"id": [record[0] for record in records],
+                                                    "title": [record[1] for record in records],
+                                                    "raw_content": [record[2] for record in records]})
+            batch.close()
+            pool, time_budget = (heavy_executor, page_time_budget) if is_heavy else (executor, None)
+            pending.append((batch, pool.submit(_clean_record_batch, batch.handle, language, time_budget, with_metadata), is_heavy))
+
+        def _collect():
+            batch, future, _ = pending.popleft()
+            try:
+                result_handle, counters, fallback_pages = future.result()
+            finally:
+                batch.unlink()
+            for name, value in counters.items():
+                inc_counter(name, value)
+            for id_, title, num_chars, fallback_reason in fallback_pages:
+                _reason = f"exceeded the time budget of {page_time_budget}s" if fallback_reason == "timeout" else "crashed the parser"
+                logger.warning(f"Page {id_} ({title}, {num_chars} chars) {_reason}, cleaned by the fallback cleaner")
+            columns = _release_result(result_handle)
+            for colname in _METADATA_COUNT_COLNAMES:
+                if colname in columns:
+                    columns[colname] = [None if val is None else int(val) for val in columns[colname]]
+            _colnames = list(columns.keys())
+            for values in zip(*columns.values()):
+                yield dict(zip(_colnames, values))
+
+        def _collect_finished():
+            while pending and pending[0][1].done():
+                yield from _collect()
+
+        def _get_running(is_heavy):
+            return [future for _, future, _is_heavy in pending if _is_heavy == is_heavy and not future.done()]
+
+        def _throttle():
+            #the running batches of each pool are bounded by waiting on any of them rather than on the head of the
+            #queue, so a slow heavy page at the head doesn't leave the batch workers idle (and vice versa)
+            for is_heavy, max_running in ((False, 2 * num_proc), (True, 2 * heavy_num_proc)):
+                running = _get_running(is_heavy)
+                while len(running) > max_running:
+                    wait(running, return_when=FIRST_COMPLETED)
+                    yield from _collect_finished()
+                    running = _get_running(is_heavy)
+            while len(pending) > _MAX_PENDING_BATCHES_PER_PROC * (num_proc + heavy_num_proc):
+                yield from _collect()
+            yield from _collect_finished()
+
+        try:
+            records, _nbytes = [], 0
+            for record in iter_raw_pages_from_file(filepath, inc_counter=inc_counter, zstd_cache_dir=zstd_cache_dir,
+                                                   on_redirect=on_redirect):
+                if heavy_executor is not None and estimate_parse_cost(record[2]) >= heavy_page_cost:
+                    inc_counter("heavy-pages")
+                    inc_counter("heavy-page-chars", len(record[2]))
+                    #the pages read before it are submitted first, to keep the order of the file
+                    if len(records) > 0:
+                        _submit(records)
+                        records, _nbytes = [], 0
+                    _submit([record], is_heavy=True)
+                    yield from _throttle()
+                else:
+                    records.append(record)
+                    _nbytes += len(record[2])
+                    if _nbytes >= batch_nbytes or len(records) >= max_batch_size:
+                        _submit(records)
+                        records, _nbytes = [], 0
+                        yield from _throttle()
+            if len(records) > 0:
+                _submit(records)
+            while pending:
+                yield from _collect()
+        finally:
+            #release the blocks of the batches left when the iteration is stopped early
+            while pending:
+                batch, future, _ = pending.popleft()
+                future.cancel()
+                batch.unlink()
+                if not future.cancelled() and future.exception() is None:
+                    _release_result(future.result()[0])
@@ -0,0 +1,214 @@
+'''
+Script on Looking Up a Single Wikipedia Article by its Page ID or Title
+-------------------
+A persistent SQLite lookup index is built once per language & date from the multistream `-index.txt.bz2` files,
+mapping each page id and title into the byte range of the bz2 stream (of ~100 pages) holding it.
+`get_article` then decompresses only that stream and cleans only the requested page, e.g. for debugging
+a dedup decision or a parser error logged during the extraction.
+Usage example:
+    python wiki_article_lookup.py --lang-id id --date-ver 20231101 --title "Indonesia"
+'''
+
+import os
+import io
+import json
+import sqlite3
+import logging
+import argparse
+
+from dedup_raw_wiki_data import argparse_bool_check
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+_DEFAULT_LOOKUP_DIR = "./wiki_lookup_index"
+
+
+def get_lookup_db_path(lookup_dir: str, lang: str, date: str):
+    return os.path.join(lookup_dir, f"{lang.replace('-', '_')}wiki_{date}_lookup.sqlite")
+
+
+def build_lookup_index(lang: str, date: str, lookup_dir: str=_DEFAULT_LOOKUP_DIR, dump_source: str=None,
+                       download_workers: int=None, logger=None):
+    '''
+    Build the SQLite lookup index of a language dump from its multistream index files
+
+    Parameters
+    ----------
+    lang: Wikipedia lang id
+    date: date of Wikipedia dump (YYYYMMDD)
+    lookup_dir: dir to write the lookup index into
+    dump_source: base URL or local dir mirror of the dumps (dumps.wikimedia.org if None)
+    download_workers: number of concurrent connections to download the dump files with (see `download_dump_files`)
+    Returns
+    -------
+    path of the SQLite lookup index
+    '''
+    #the loader (and `datasets`) is only imported when used, so `--help` and invalid args return instantly
+    from sea_loader_batched.wiki_loader import Wikipedia, iter_multistream_index, get_multistream_stream_ranges
+
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    os.makedirs(lookup_dir, exist_ok=True)
+    db_path = get_lookup_db_path(lookup_dir, lang, date)
+
+    wiki_builder = Wikipedia(language=lang, date=date, dump_source=dump_source, download_workers=download_workers)
+    multistream_files = wiki_builder.get_multistream_files()
+
+    #built into a temp file then renamed, so an interrupted build never leaves a partial index
+    if os.path.exists(db_path + ".tmp"):
+        os.remove(db_path + ".tmp")
+    conn = sqlite3.connect(db_path + ".tmp")
+    try:
+        conn.execute("CREATE TABLE streams (stream_id INTEGER PRIMARY KEY, file_path TEXT, start INTEGER, end INTEGER)")
+        conn.execute("CREATE TABLE pages (page_id INTEGER, title TEXT, stream_id INTEGER)")
+        conn.execute("CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)")
+        conn.executemany("INSERT INTO metadata VALUES (?, ?)", [("lang", lang), ("date", date)])
+
+        _num_streams = 0
+        for xml_path, index_path in multistream_files:
+            logger.info(f"Indexing streams of {xml_path}...")
+            _xml_path = os.path.abspath(xml_path)
+            _stream_ids = {}
+            for start, end in get_multistream_stream_ranges(index_path, os.path.getsize(xml_path)):
+                _stream_ids[start] = _num_streams
+                conn.execute("INSERT INTO streams VALUES (?, ?, ?, ?)", (_num_streams, _xml_path, start, end))
+                _num_streams += 1
+            conn.executemany("INSERT INTO pages VALUES (?, ?, ?)",
+                             ((int(id_), title, _stream_ids[offset]) for offset, id_, title in iter_multistream_index(index_path)))
+
+        conn.execute("CREATE INDEX pages_page_id ON pages (page_id)")
+        conn.execute("CREATE INDEX pages_title ON pages (title)")
+        conn.commit()
+        _num_pages = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+    finally:
+        conn.close()
+    os.replace(db_path + ".tmp", db_path)
+    logger.info(f"Lookup index of {_num_pages} pages in {_num_streams} streams is saved in {db_path}")
+    return db_path
+
+
+def get_article(lang: str, date: str, page_id: int=None, title: str=None, lookup_dir: str=_DEFAULT_LOOKUP_DIR,
+                dump_source: str=None, download_workers: int=None, logger=None):
+    '''
+    Get one cleaned article by its page id or title, decompressing only the bz2 stream holding it.
+    The lookup index is built first if it doesn't exist yet
+
+    Parameters
+    ----------
+    lang: Wikipedia lang id
+    date: date of Wikipedia dump (YYYYMMDD)
+    page_id: page id of the article (takes precedence over `title`)
+    title: title of the article (underscores are read as spaces, as in its URL)
+    lookup_dir: dir of the lookup index
+    dump_source: base URL or local dir mirror of the dumps, only used to build the lookup index
+    download_workers: number of concurrent download connections, only used to build the lookup index
+    Returns
+    -------
+    dict of `id/url/title/text` as the extraction output with the raw `wikitext` of the article (`text` is None
+    if the cleaning gives nothing), or None if the page isn't found or isn't an article (e.g. a redirect)
+    '''
+    import mwparserfromhell
+    from sea_loader_batched.wiki_loader import _read_byte_range, _extract_raw_pages, _clean_raw_page, _construct_url
+
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    if page_id is None and title is None:
+        raise ValueError("Either `page_id` or `title` has to be given!")
+
+    db_path = get_lookup_db_path(lookup_dir, lang, date)
+    if not os.path.exists(db_path):
+        logger.info(f"Lookup index {db_path} doesn't exist! Building it...")
+        build_lookup_index(lang, date, lookup_dir=lookup_dir, dump_source=dump_source, download_workers=download_workers,
+                           logger=logger)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        _query = "SELECT pages.page_id, streams.file_path, streams.start, streams.end FROM pages JOIN streams USING (stream_id) "
+        if page_id is not None:
+            row = conn.execute(_query + "WHERE pages.page_id = ?", (int(page_id),)).fetchone()
+        else:
+            row = conn.execute(_query + "WHERE pages.title = ?", (title.replace("_", " "),)).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        logger.info(f"Page {page_id if page_id is not None else title} isn't found in the lookup index")
+        return None
+    _page_id, xml_path, start, end = row
+
+    for id_, _title, raw_content in _extract_raw_pages(io.BytesIO(_read_byte_range(xml_path, start, end))):
+        if int(id_) != _page_id:
+            continue
+        example = _clean_raw_page((id_, _title, raw_content), parser=mwparserfromhell, language=lang)
+        if example is None:
+            example = {"id": id_, "url": _construct_url(_title, lang), "title": _title, "text": None}
+        example["wikitext"] = raw_content
+        return example
+
+    logger.info(f"Page {_page_id} isn't an article of main namespace (or it's a redirect)")
+    return None
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--lang-id", help="Lang ID from Wikipedia Data to look up")
+
+    parser.add_argument("--date-ver", help="Date of Wikipedia Data (YYYYMMDD) generation to look up")
+
+    #default: only build the lookup index
+    parser.add_argument("--page-id", help="Page ID of the article to get", default=None, type=int)
+
+    parser.add_argument("--title", help="Title of the article to get (if `page-id` isn't given)", default=None)
+
+    parser.add_argument("--lookup-dir-path", help="Dir path of the SQLite lookup index", default=_DEFAULT_LOOKUP_DIR)
+
+    parser.add_argument("--rebuild-index", help="Flag whether to rebuild the lookup index even if it exists",
+            default=False, type=argparse_bool_check)
+
+    #default: dumps.wikimedia.org
+    parser.add_argument("--dump-source", help="""Base URL or local dir mirror (see `local_dump_mirror.py`)
+                        to resolve the Wikipedia dumps from""",
+            default=None)
+
+    #default: download by `datasets.DownloadManager` sequentially
+    parser.add_argument("--download-workers", help="""Number of concurrent connections to download the dump files with,
+                        resuming partial downloads and verifying the checksums (dumps.wikimedia.org allows only a few)""",
+            default=None, type=int)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    if args.rebuild_index or not os.path.exists(get_lookup_db_path(args.lookup_dir_path, args.lang_id, args.date_ver)):
+        build_lookup_index(args.lang_id, args.date_ver, lookup_dir=args.lookup_dir_path, dump_source=args.dump_source,
+                           download_workers=args.download_workers, logger=logger)
+
+    if args.page_id is not None or args.title is not None:
+        article = get_article(args.lang_id, args.date_ver, page_id=args.page_id, title=args.title,
+                              lookup_dir=args.lookup_dir_path, logger=logger)
+        print(json.dumps(article, ensure_ascii=False, indent=2))
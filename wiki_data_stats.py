@@ -0,0 +1,262 @@
+'''
+Script on Computing Corpus Statistics of Wikipedia Data extracted/deduplicated by this repo
+-------------------
+Each CSV gzip-compressed data (raw, batched splits or deduplicated) is streamed in chunks, and the char & byte lengths
+of its `title` and `text` are summarized into mergeable stats: exact counts, sums, min & max, log2-binned histograms
+and a log-bucket quantile sketch of bounded relative error (as DDSketch). The files are summarized on a process pool
+and their partial stats merged per language & date into one JSON report each, so no language is ever fully held
+in memory. Run the raw and the deduplicated data into separate `save-dir-path`, as they're merged by language & date.
+Usage example:
+    python wiki_data_stats.py --csv-path sea_wiki_dedup_data/*.csv.gz --num-proc 8
+'''
+
+import os
+import json
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dedup_raw_wiki_data import read_csv_ignore_some_nulls, get_lang_and_date_from_file_name
+
+
+_STATS_COLNAMES = ["title", "text"]
+_DEFAULT_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+class LengthSketch:
+    '''
+    Mergeable summary of non-negative lengths, with exact count, sum, min & max, a histogram of power-of-2 bins
+    and a log-bucket quantile sketch whose quantile estimates are within `relative_accuracy` of the true value
+
+    Parameters
+    ----------
+    relative_accuracy: relative accuracy of the quantile estimates
+    max_length: max length to be summarized (larger lengths are counted in the last bucket)
+    '''
+    def __init__(self, relative_accuracy: float=0.01, max_length: int=1 << 40):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self._gamma)
+        #bucket 0 holds the zero lengths, bucket i >= 1 holds the lengths in (gamma^(i-2), gamma^(i-1)]
+        self.sketch_counts = np.zeros(int(np.ceil(np.log(max_length) / self._log_gamma)) + 2, dtype=np.int64)
+        #bin 0 holds the zero lengths, bin k >= 1 holds the lengths in [2^(k-1), 2^k)
+        self.histogram_counts = np.zeros(max_length.bit_length() + 1, dtype=np.int64)
+        self.count, self.sum, self.min, self.max = 0, 0, None, None
+
+    def update(self, lengths: np.ndarray):
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if len(lengths) == 0:
+            return
+        self.count += len(lengths)
+        self.sum += int(lengths.sum())
+        _min, _max = int(lengths.min()), int(lengths.max())
+        self.min = _min if self.min is None else min(self.min, _min)
+        self.max = _max if self.max is None else max(self.max, _max)
+
+        _positive = lengths[lengths > 0]
+        _num_zeros = len(lengths) - len(_positive)
+        _buckets = np.minimum(np.ceil(np.log(_positive) / self._log_gamma).astype(np.int64) + 1, len(self.sketch_counts) - 1)
+        self.sketch_counts += np.bincount(_buckets, minlength=len(self.sketch_counts))
+        self.sketch_counts[0] += _num_zeros
+        #exponent of frexp is the bit length of an int
+        _bins = np.minimum(np.frexp(_positive.astype(np.float64))[1], len(self.histogram_counts) - 1)
+        self.histogram_counts += np.bincount(_bins, minlength=len(self.histogram_counts))
+        self.histogram_counts[0] += _num_zeros
+
+    def merge(self, other: "LengthSketch"):
+        if other.relative_accuracy != self.relative_accuracy or len(other.sketch_counts) != len(self.sketch_counts):
+            raise ValueError("Only the sketches of the same relative accuracy & max length can be merged!")
+        self.sketch_counts += other.sketch_counts
+        self.histogram_counts += other.histogram_counts
+        self.count += other.count
+        self.sum += other.sum
+        for attr, fn in [("min", min), ("max", max)]:
+            _vals = [val for val in [getattr(self, attr), getattr(other, attr)] if val is not None]
+            setattr(self, attr, fn(_vals) if len(_vals) > 0 else None)
+        return self
+
+    def quantiles(self, qs: list):
+        '''
+        Estimate the quantiles of the lengths, each one within `relative_accuracy` of its true value
+        '''
+        if self.count == 0:
+            return [None for _ in qs]
+        _cum_counts = np.cumsum(self.sketch_counts)
+        _buckets = np.searchsorted(_cum_counts, np.asarray(qs, dtype=np.float64) * (self.count - 1), side="right")
+        _estimates = np.where(_buckets == 0, 0.0, 2 * self._gamma ** (_buckets - 1.0) / (self._gamma + 1))
+        return np.clip(_estimates, self.min, self.max).tolist()
+
+    def to_dict(self, qs: list=_DEFAULT_QUANTILES):
+        _last_bin = int(np.flatnonzero(self.histogram_counts).max()) + 1 if self.count > 0 else 0
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count > 0 else None,
+            "min": self.min,
+            "max": self.max,
+            "quantiles": {f"p{q*100:g}": val for q, val in zip(qs, self.quantiles(qs))},
+            "histogram": {
+                #edges of [lower, upper) of every bin
+                "bin_edges": [0, 1] + [1 << bin_idx for bin_idx in range(1, _last_bin)],
+                "counts": self.histogram_counts[:_last_bin].tolist(),
+            },
+        }
+
+
+class CorpusStats:
+    '''
+    Mergeable stats of Wikipedia data: number of articles, and null counts with char & byte `LengthSketch`
+    of each of `colnames` (the empty values are read as nulls by `read_csv_ignore_some_nulls`)
+    '''
+    def __init__(self, colnames: list=_STATS_COLNAMES, relative_accuracy: float=0.01):
+        self.colnames = colnames
+        self.num_articles = 0
+        self.source_files = []
+        self.num_nulls = {colname: 0 for colname in colnames}
+        self.chars = {colname: LengthSketch(relative_accuracy) for colname in colnames}
+        self.bytes = {colname: LengthSketch(relative_accuracy) for colname in colnames}
+
+    def update(self, df):
+        self.num_articles += df.shape[0]
+        for colname in self.colnames:
+            _values = df[colname]
+            _is_null = _values.isna().to_numpy()
+            _values = _values[~_is_null].astype("str")
+            _num_chars = _values.str.len().to_numpy(dtype=np.int64)
+            self.num_nulls[colname] += int(_is_null.sum())
+            self.chars[colname].update(_num_chars)
+            self.bytes[colname].update(_values.str.encode("utf-8", errors="surrogatepass").str.len().to_numpy(dtype=np.int64))
+
+    def merge(self, other: "CorpusStats"):
+        self.num_articles += other.num_articles
+        self.source_files.extend(other.source_files)
+        for colname in self.colnames:
+            self.num_nulls[colname] += other.num_nulls[colname]
+            self.chars[colname].merge(other.chars[colname])
+            self.bytes[colname].merge(other.bytes[colname])
+        return self
+
+    def to_dict(self, qs: list=_DEFAULT_QUANTILES):
+        return {
+            "num_articles": self.num_articles,
+            "source_files": sorted(self.source_files),
+            "columns": {
+                colname: {
+                    "num_nulls": self.num_nulls[colname],
+                    "chars": self.chars[colname].to_dict(qs),
+                    "bytes": self.bytes[colname].to_dict(qs),
+                }
+                for colname in self.colnames
+            },
+        }
+
+
+def compute_file_stats(csv_path: str, chunk_size: int=100000, relative_accuracy: float=0.01):
+    '''
+    Stream a CSV gzip-compressed Wikipedia data in chunks into its `CorpusStats`
+    '''
+    stats = CorpusStats(relative_accuracy=relative_accuracy)
+    stats.source_files.append(os.path.basename(csv_path))
+    for df in read_csv_ignore_some_nulls(csv_path, compression="gzip", chunksize=chunk_size,
+                                         usecols=lambda colname: colname in _STATS_COLNAMES):
+        stats.update(df)
+    return stats
+
+
+def compute_stats(csv_paths: list, num_proc: int=None, chunk_size: int=100000, relative_accuracy: float=0.01,
+                  logger=None):
+    '''
+    Compute the stats of every file on a process pool, merged per language & date
+
+    Returns
+    -------
+    dict of `{lang}_{date}` (or file name, if it doesn't follow `wiki_{lang}_{date}_*` format) to its `CorpusStats`
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    merged_stats = {}
+    with ProcessPoolExecutor(max_workers=num_proc or os.cpu_count()) as executor:
+        #the largest files first, so the biggest language isn't the last one to start
+        _csv_paths = sorted(csv_paths, key=os.path.getsize, reverse=True)
+        _futures = [executor.submit(compute_file_stats, csv_path, chunk_size, relative_accuracy) for csv_path in _csv_paths]
+        for csv_path, future in zip(_csv_paths, _futures):
+            lang, date_ver = get_lang_and_date_from_file_name(csv_path)
+            _key = f"{lang}_{date_ver}" if lang is not None else os.path.basename(csv_path).replace(".csv.gz", "")
+            stats = future.result()
+            logger.info(f"Done computing the stats of {csv_path} ({stats.num_articles} articles)")
+            merged_stats[_key] = merged_stats[_key].merge(stats) if _key in merged_stats else stats
+    return merged_stats
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--csv-path", help="Relative location of csv file(s) containing Wikipedia data", nargs="+")
+
+    parser.add_argument("--save-dir-path", help="""Relative dir path of saved JSON stats reports
+                        to the `wiki_data_stats.py` script dir""",
+            default="./sea_wiki_stats")
+
+    parser.add_argument("--num-proc", help="Number of processes to compute the stats of the files with",
+            default=os.cpu_count(), type=int)
+
+    parser.add_argument("--chunk-size", help="Number of rows read from the CSV at once", default=100000, type=int)
+
+    parser.add_argument("--relative-accuracy", help="Relative accuracy of the quantile estimates of the lengths",
+            default=0.01, type=float)
+
+    parser.add_argument("--quantiles", help="Quantiles of the lengths to report", nargs="+",
+            default=_DEFAULT_QUANTILES, type=float)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    os.makedirs(args.save_dir_path, exist_ok=True)
+    merged_stats = compute_stats(args.csv_path, num_proc=args.num_proc, chunk_size=args.chunk_size,
+                                 relative_accuracy=args.relative_accuracy, logger=logger)
+
+    summary = {}
+    for _key, stats in sorted(merged_stats.items()):
+        _report_path = os.path.join(args.save_dir_path, f"wiki_{_key}_stats.json")
+        with open(_report_path, "w") as f:
+            json.dump(stats.to_dict(args.quantiles), f, indent=2)
+        logger.info(f"Stats report of {_key} is saved in {_report_path}")
+        summary[_key] = {"num_articles": stats.num_articles, "text_chars": stats.chars["text"].sum,
+                         "text_bytes": stats.bytes["text"].sum}
+
+    #share of each language on the total text bytes, as a starting point of the language mixing
+    _total_bytes = sum(val["text_bytes"] for val in summary.values())
+    for val in summary.values():
+        val["text_bytes_share"] = val["text_bytes"] / _total_bytes if _total_bytes > 0 else None
+    with open(os.path.join(args.save_dir_path, "stats_summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info("Done Computing Stats")
@@ -0,0 +1,271 @@
+'''
+Script on Building & Querying a Compact Title and Redirect Alias Index of Wikipedia Data extracted by this repo
+-------------------
+The article titles (of the raw or deduplicated CSVs) and the redirect aliases (`title,target_title` pairs saved by
+the extraction with `save-redirects`) of a language are compiled into a sorted string table on disk: the lookup
+keys (NFC-normalized & casefolded titles) concatenated in byte order with their offsets, the original titles and
+the entry of the article each key resolves to (redirect chains are followed). Every part is a NumPy file loaded
+with `mmap_mode="r"`, so a lookup only reads the pages touched by its binary search, and a prefix lookup is
+a contiguous range of the sorted keys.
+Usage example:
+    python wiki_title_index.py --lang-id id --date-ver 20231101 --prefix "jakarta" \
+        --csv-path wiki_id_20231101_dataset_dedup_cleansed.csv.gz --redirects-path wiki_id_20231101_redirects.csv.gz
+'''
+
+import os
+import json
+import bisect
+import shutil
+import logging
+import argparse
+import unicodedata
+
+import numpy as np
+
+from dedup_raw_wiki_data import argparse_bool_check, read_csv_ignore_some_nulls
+
+
+_DEFAULT_INDEX_DIR = "./wiki_title_index"
+#double redirects are fixed by bots, so longer chains are mostly loops
+_MAX_REDIRECT_HOPS = 5
+_INDEX_ARRAY_NAMES = ["keys", "key_offsets", "titles", "title_offsets", "article_idx", "is_redirect"]
+
+
+def set_logger():
+    # Set up the logger
+    logging.basicConfig(
+        level=logging.INFO,  # Set the desired logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        format='%(asctime)s [%(levelname)s]: %(message)s',  # Customize the log message format
+        datefmt='%Y-%m-%d %H:%M:%S'  # Customize the date/time format
+    )
+
+    # Create a file handler to write logs into a file
+    file_handler = logging.FileHandler('app.log')
+
+    # Set the log level for the file handler
+    file_handler.setLevel(logging.INFO)
+
+    # Create a formatter for the file handler (customize the log format for the file)
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    file_handler.setFormatter(file_formatter)
+
+    logger = logging.getLogger("Wiki Dataset Generation")
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def get_title_index_dir(index_dir: str, lang: str, date: str):
+    return os.path.join(index_dir, f"{lang.replace('-', '_')}wiki_{date}_titles")
+
+
+def get_title_key(title: str):
+    '''
+    Get the lookup key of a title: underscores read as spaces (as in its URL), NFC-normalized and casefolded
+    '''
+    return unicodedata.normalize("NFC", title.replace("_", " ").strip()).casefold().encode("utf-8", errors="surrogatepass")
+
+
+def _pack_strings(values: list):
+    #concatenated UTF-8 bytes with the offsets of each value, offsets[idx]:offsets[idx+1] is the value idx
+    encoded = [val if isinstance(val, bytes) else val.encode("utf-8", errors="surrogatepass") for val in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def build_title_index(csv_paths: list, redirects_paths: list, save_dir: str, chunk_size: int=100000, logger=None):
+    '''
+    Build the title index of a language from its extracted data & redirect pairs. The titles of the language
+    are held in memory while building, the index itself is read with mmap
+
+    Parameters
+    ----------
+    csv_paths: CSV gzip-compressed Wikipedia data whose `title` are the articles
+    redirects_paths: CSV gzip-compressed `title,target_title` redirect pairs of the same dump
+    save_dir: dir to write the index into
+    Returns
+    -------
+    dict of the index stats
+    '''
+    logger = logger if logger is not None else logging.getLogger(__name__)
+
+    article_titles = {}
+    for csv_path in csv_paths:
+        for df in read_csv_ignore_some_nulls(csv_path, compression="gzip", chunksize=chunk_size,
+                                             usecols=lambda colname: colname == "title"):
+            for title in df["title"].dropna().astype("str"):
+                article_titles.setdefault(title, len(article_titles))
+    logger.info(f"Found {len(article_titles)} article titles")
+
+    redirects = {}
+    for redirects_path in redirects_paths:
+        for df in read_csv_ignore_some_nulls(redirects_path, compression="gzip", chunksize=chunk_size):
+            df = df.dropna()
+            for title, target_title in zip(df["title"].astype("str"), df["target_title"].astype("str")):
+                #a redirect whose title is also an article (e.g. re-created after the dump) is left to the article
+                if title not in article_titles:
+                    redirects[title] = target_title
+
+    #(key, title, title of the article it resolves to, is redirect)
+    entries = [(get_title_key(title), title, title, False) for title in article_titles]
+    num_dangling = 0
+    for title, target_title in redirects.items():
+        for _ in range(_MAX_REDIRECT_HOPS):
+            if target_title not in redirects:
+                break
+            target_title = redirects[target_title]
+        #the target may be filtered out of the data (e.g. an empty article) or outside of the main namespace
+        if target_title not in article_titles:
+            num_dangling += 1
+            continue
+        entries.append((get_title_key(title), title, target_title, True))
+    logger.info(f"Found {len(entries) - len(article_titles)} redirect aliases ({num_dangling} dangling ones are left out)")
+
+    entries.sort(key=lambda entry: (entry[0], entry[1]))
+    _entry_idx_of_article = np.empty(len(article_titles), dtype=np.int64)
+    for entry_idx, (_, title, _, is_redirect) in enumerate(entries):
+        if not is_redirect:
+            _entry_idx_of_article[article_titles[title]] = entry_idx
+
+    arrays = {}
+    arrays["keys"], arrays["key_offsets"] = _pack_strings([entry[0] for entry in entries])
+    arrays["titles"], arrays["title_offsets"] = _pack_strings([entry[1] for entry in entries])
+    arrays["article_idx"] = _entry_idx_of_article[[article_titles[entry[2]] for entry in entries]]
+    arrays["is_redirect"] = np.fromiter((entry[3] for entry in entries), dtype=bool, count=len(entries))
+
+    #built into a temp dir then renamed, so an interrupted build never leaves a partial index
+    _tmp_dir = save_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(_tmp_dir, ignore_errors=True)
+    os.makedirs(_tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(_tmp_dir, f"{name}.npy"), array)
+    stats = {
+        "num_entries": len(entries),
+        "num_articles": len(article_titles),
+        "num_redirects": len(entries) - len(article_titles),
+        "num_dangling_redirects": num_dangling,
+        "csv_paths": csv_paths,
+        "redirects_paths": redirects_paths,
+    }
+    with open(os.path.join(_tmp_dir, "meta.json"), "w") as f:
+        json.dump(stats, f, indent=2)
+    shutil.rmtree(save_dir, ignore_errors=True)
+    os.replace(_tmp_dir, save_dir)
+    logger.info(f"Title index of {len(entries)} entries is saved in {save_dir}")
+    return stats
+
+
+class _SortedKeys:
+    #sequence view of the keys, so `bisect` reads only the keys it compares
+    def __init__(self, keys: np.ndarray, key_offsets: np.ndarray):
+        self._keys = keys
+        self._key_offsets = key_offsets
+
+    def __len__(self):
+        return len(self._key_offsets) - 1
+
+    def __getitem__(self, idx: int):
+        return self._keys[self._key_offsets[idx]:self._key_offsets[idx+1]].tobytes()
+
+
+class TitleIndex:
+    '''
+    Memory-mapped title index built by `build_title_index`, with exact & prefix lookups of the titles
+    and redirect aliases (case-insensitive, underscores read as spaces)
+
+    Parameters
+    ----------
+    index_dir: dir of the index
+    '''
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        for name in _INDEX_ARRAY_NAMES:
+            setattr(self, f"_{name}", np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r"))
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        self._sorted_keys = _SortedKeys(self._keys, self._key_offsets)
+
+    def __len__(self):
+        return len(self._sorted_keys)
+
+    def _get_title(self, idx: int):
+        return self._titles[self._title_offsets[idx]:self._title_offsets[idx+1]].tobytes().decode("utf-8", errors="surrogatepass")
+
+    def _get_entry(self, idx: int):
+        return {"title": self._get_title(idx), "article_title": self._get_title(int(self._article_idx[idx])),
+                "is_redirect": bool(self._is_redirect[idx])}
+
+    def lookup(self, title: str):
+        '''
+        Get the entries whose key is the same as of `title`
+
+        Returns
+        -------
+        list of dict of `title` (article title or redirect alias), `article_title` it resolves to and `is_redirect`
+        '''
+        key = get_title_key(title)
+        start = bisect.bisect_left(self._sorted_keys, key)
+        end = bisect.bisect_right(self._sorted_keys, key, lo=start)
+        return [self._get_entry(idx) for idx in range(start, end)]
+
+    def prefix_lookup(self, prefix: str, limit: int=10):
+        '''
+        Get up to `limit` entries whose key starts with the key of `prefix`, in the key order
+        '''
+        key = get_title_key(prefix)
+        start = bisect.bisect_left(self._sorted_keys, key)
+        #no UTF-8 byte is 0xff, so every key starting with the prefix is below it
+        end = bisect.bisect_left(self._sorted_keys, key + b"\xff", lo=start)
+        return [self._get_entry(idx) for idx in range(start, min(end, start + limit))]
+
+
+#only executed if called directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--lang-id", help="Lang ID from Wikipedia Data of the index")
+
+    parser.add_argument("--date-ver", help="Date of Wikipedia Data (YYYYMMDD) generation of the index")
+
+    parser.add_argument("--csv-path", help="""Relative location of csv file(s) containing Wikipedia data
+                        whose titles are indexed as the articles (only needed to build the index)""",
+            nargs="+", default=[])
+
+    parser.add_argument("--redirects-path", help="""Relative location of csv file(s) of redirect pairs saved by the extraction
+                        with `save-redirects`, indexed as the aliases of their target articles""",
+            nargs="+", default=[])
+
+    parser.add_argument("--index-dir-path", help="Dir path of the title indexes", default=_DEFAULT_INDEX_DIR)
+
+    parser.add_argument("--rebuild-index", help="Flag whether to rebuild the title index even if it exists",
+            default=False, type=argparse_bool_check)
+
+    #default: only build the title index
+    parser.add_argument("--title", help="Title or alias to look up", default=None)
+
+    parser.add_argument("--prefix", help="Prefix of the titles & aliases to look up (if `title` isn't given)", default=None)
+
+    parser.add_argument("--limit", help="Max number of entries of a prefix lookup", default=10, type=int)
+
+    parser.add_argument("--chunk-size", help="Number of rows read from the CSV at once", default=100000, type=int)
+
+    args = parser.parse_args()
+
+
+    logger = set_logger()
+    logger.info("Parsing arguments...")
+
+    index_dir = get_title_index_dir(args.index_dir_path, args.lang_id, args.date_ver)
+    if args.rebuild_index or not os.path.exists(index_dir):
+        if len(args.csv_path) == 0:
+            raise ValueError(f"Title index {index_dir} doesn't exist, `csv-path` has to be given to build it!")
+        build_title_index(args.csv_path, args.redirects_path, index_dir, chunk_size=args.chunk_size, logger=logger)
+
+    if args.title is not None or args.prefix is not None:
+        title_index = TitleIndex(index_dir)
+        if args.title is not None:
+            entries = title_index.lookup(args.title)
+        else:
+            entries = title_index.prefix_lookup(args.prefix, limit=args.limit)
+        print(json.dumps(entries, ensure_ascii=False, indent=2))